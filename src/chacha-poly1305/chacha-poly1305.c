@@ -5,10 +5,6 @@
 #include "chacha-poly1305.h"
 #include "poly1305.h"
 
-struct chacha_poly1305_ctx {
-	struct chacha_ctx main_ctx, header_ctx;
-};
-
 chacha_poly1305_ctx_t *chacha_poly1305_init(void) {
 	return xzalloc(sizeof(chacha_poly1305_ctx_t));
 }
@@ -1,9 +1,14 @@
 #ifndef CHACHA_POLY1305_H
 #define CHACHA_POLY1305_H
 
+#include "chacha.h"
+
 #define CHACHA_POLY1305_KEYLEN 64
 
-typedef struct chacha_poly1305_ctx chacha_poly1305_ctx_t;
+// The context holds no pointers, so it can be copied to use the same key on another thread.
+typedef struct chacha_poly1305_ctx {
+	struct chacha_ctx main_ctx, header_ctx;
+} chacha_poly1305_ctx_t;
 
 extern void chacha_poly1305_exit(chacha_poly1305_ctx_t *);
 extern chacha_poly1305_ctx_t *chacha_poly1305_init(void) ATTR_DEALLOCATOR(chacha_poly1305_exit);
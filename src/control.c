@@ -124,6 +124,12 @@ bool control_h(connection_t *c, const char *request) {
 	case REQ_DUMP_TRAFFIC:
 		return dump_traffic(c);
 
+	case REQ_DUMP_SUBNET_CACHE:
+		return dump_subnet_cache(c);
+
+	case REQ_DUMP_NODE_STATS:
+		return dump_node_stats(c);
+
 	case REQ_PCAP:
 		sscanf(request, "%*d %*d %d", &c->outmaclength);
 		c->status.pcap = true;
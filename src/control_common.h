@@ -41,8 +41,36 @@ enum request_type {
 	REQ_DUMP_TRAFFIC,
 	REQ_PCAP,
 	REQ_LOG,
+	REQ_DUMP_SUBNET_CACHE,
+	REQ_DUMP_NODE_STATS,
 };
 
+/* REQ_DUMP_NODE_STATS is answered with blocks of binary records. Each block is
+   announced by a "CONTROL REQ_DUMP_NODE_STATS records size length" line, where
+   size is the length of the fixed part of a record, and is never longer than
+   NODE_STATS_BLOCK_SIZE bytes. A line without these three fields ends
+   the dump.
+
+   A record holds, in network byte order: in packets, in bytes, out packets,
+   out bytes, dropped incoming and outgoing packets, replayed packets,
+   uncompressed and compressed outgoing bytes (all 64 bits), UDP RTT
+   (32 bits, signed), MTU (16 bits) and node_path_t (8 bits). This fixed part
+   is followed by the length of the node's name (16 bits) and the name itself.
+   Fields may be added to the end of the fixed part later on. */
+
+#define NODE_STATS_RECORD_SIZE 79
+#define NODE_STATS_BLOCK_SIZE 4096
+
+typedef enum node_path_t {
+	PATH_UNREACHABLE,
+	PATH_MYSELF,
+	PATH_INDIRECT,                  /* Sent through a relay */
+	PATH_UNKNOWN,                   /* No valid key yet */
+	PATH_UDP,
+	PATH_TCP,
+	PATH_FORWARDED,                 /* No UDP, forwarded over TCP through nexthop */
+} node_path_t;
+
 #define TINC_CTL_VERSION_CURRENT 0
 
 #endif
@@ -29,6 +29,12 @@ extern char *iface;
 
 #define DEVICE_DUMMY "dummy"
 
+/* Maximum number of queues of a multi-queue device (DeviceQueues) */
+#define MAX_DEVICE_QUEUES 16
+
+/* Maximum number of packets read from a non-blocking device on each wakeup */
+#define DEVICE_READ_BATCH 64
+
 typedef struct devops_t {
 	bool (*setup)(void);
 	void (*close)(void);
@@ -36,6 +42,9 @@ typedef struct devops_t {
 	bool (*write)(struct vpn_packet_t *);
 	void (*enable)(void);   /* optional */
 	void (*disable)(void);  /* optional */
+	int (*queue_fd)(int queue);  /* optional, -1 if there is no such queue */
+	bool (*read_queue)(struct vpn_packet_t *, int queue);  /* optional, may be called on worker threads, so it must not log */
+	bool nonblocking;  /* read() fails with EAGAIN when there are no packets left */
 } devops_t;
 
 extern const devops_t os_devops;
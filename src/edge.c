@@ -50,6 +50,33 @@ splay_tree_t edge_weight_tree = {
 	.compare = (splay_compare_t) edge_weight_compare,
 };
 
+static int edge_address_compare(const edge_t *a, const edge_t *b) {
+	int result;
+
+	result = sockaddrcmp_noport(&a->address, &b->address);
+
+	if(result) {
+		return result;
+	}
+
+	/* an edge without endpoints comes before all edges with the same address */
+	if(!a->to || !b->to) {
+		return !!a->to - !!b->to;
+	}
+
+	result = strcmp(a->to->name, b->to->name);
+
+	if(result) {
+		return result;
+	}
+
+	return strcmp(a->from->name, b->from->name);
+}
+
+splay_tree_t edge_address_tree = {
+	.compare = (splay_compare_t) edge_address_compare,
+};
+
 static int edge_compare(const edge_t *a, const edge_t *b) {
 	return strcmp(a->to->name, b->to->name);
 }
@@ -61,6 +88,7 @@ void init_edge_tree(splay_tree_t *tree) {
 }
 
 void exit_edges(void) {
+	splay_empty_tree(&edge_address_tree);
 	splay_empty_tree(&edge_weight_tree);
 }
 
@@ -87,19 +115,30 @@ void edge_add(edge_t *e) {
 		return;
 	}
 
+	/* Undo the inserts that succeeded if a later one fails, so that the trees always contain the same edges */
 
-	e->reverse = lookup_edge(e->to, e->from);
+	splay_node_t *weight_node = splay_insert(&edge_weight_tree, e);
 
-	if(e->reverse) {
-		e->reverse->reverse = e;
+	if(!weight_node) {
+		logger(DEBUG_ALWAYS, LOG_ERR, "Edge from %s to %s already exists in edge_weight_tree\n", e->from->name, e->to->name);
+		splay_unlink_node(&e->from->edge_tree, node);
+		free(node);
+		return;
 	}
 
-	node = splay_insert(&edge_weight_tree, e);
-
-	if(!node) {
-		logger(DEBUG_ALWAYS, LOG_ERR, "Edge from %s to %s already exists in edge_weight_tree\n", e->from->name, e->to->name);
+	if(!splay_insert(&edge_address_tree, e)) {
+		logger(DEBUG_ALWAYS, LOG_ERR, "Edge from %s to %s already exists in edge_address_tree\n", e->from->name, e->to->name);
+		splay_delete_node(&edge_weight_tree, weight_node);
+		splay_unlink_node(&e->from->edge_tree, node);
+		free(node);
 		return;
 	}
+
+	e->reverse = lookup_edge(e->to, e->from);
+
+	if(e->reverse) {
+		e->reverse->reverse = e;
+	}
 }
 
 void edge_del(edge_t *e) {
@@ -107,6 +146,7 @@ void edge_del(edge_t *e) {
 		e->reverse->reverse = NULL;
 	}
 
+	splay_delete(&edge_address_tree, e);
 	splay_delete(&edge_weight_tree, e);
 	splay_delete(&e->from->edge_tree, e);
 }
@@ -120,6 +160,34 @@ edge_t *lookup_edge(node_t *from, node_t *to) {
 	return splay_search(&from->edge_tree, &v);
 }
 
+edge_t *lookup_edge_address(const sockaddr_t *address) {
+	const edge_t v = {.address = *address};
+
+	edge_t *found = splay_search_closest_greater(&edge_address_tree, &v);
+
+	if(!found || sockaddrcmp_noport(&found->address, address)) {
+		return NULL;
+	}
+
+	return found;
+}
+
+edge_t *lookup_edge_address_next(const edge_t *e) {
+	splay_node_t *node = splay_search_node(&edge_address_tree, e);
+
+	if(!node || !node->next) {
+		return NULL;
+	}
+
+	edge_t *found = node->next->data;
+
+	if(sockaddrcmp_noport(&found->address, &e->address)) {
+		return NULL;
+	}
+
+	return found;
+}
+
 bool dump_edges(connection_t *c) {
 	for splay_each(node_t, n, &node_tree) {
 		for splay_each(edge_t, e, &n->edge_tree) {
@@ -40,6 +40,7 @@ typedef struct edge_t {
 } edge_t;
 
 extern splay_tree_t edge_weight_tree;          /* Tree with all known edges sorted on weight */
+extern splay_tree_t edge_address_tree;         /* Tree with all known edges sorted on address, ignoring the port */
 
 extern void exit_edges(void);
 extern void free_edge(edge_t *e);
@@ -48,6 +49,8 @@ extern void init_edge_tree(splay_tree_t *tree);
 extern void edge_add(edge_t *e);
 extern void edge_del(edge_t *e);
 extern edge_t *lookup_edge(struct node_t *from, struct node_t *to);
+extern edge_t *lookup_edge_address(const sockaddr_t *address);
+extern edge_t *lookup_edge_address_next(const edge_t *e);
 extern bool dump_edges(struct connection_t *c);
 
 #endif
@@ -220,6 +220,7 @@ static void check_reachability(void) {
 		if(n->status.visited != n->status.reachable) {
 			n->status.reachable = !n->status.reachable;
 			n->last_state_change = now.tv_sec;
+			subnet_cache_flush_node(n);
 
 			if(n->status.reachable) {
 				logger(DEBUG_TRAFFIC, LOG_DEBUG, "Node %s (%s) became reachable",
@@ -318,7 +319,6 @@ static void check_reachability(void) {
 }
 
 void graph(void) {
-	subnet_cache_flush_tables();
 	sssp_bfs();
 	check_reachability();
 	mst_kruskal();
@@ -31,52 +31,77 @@ uint32_t modulo(uint32_t hash, size_t n);
 #define hash_delete(t, ...) hash_delete_ ## t (__VA_ARGS__)
 #define hash_search(t, ...) hash_search_ ## t (__VA_ARGS__)
 #define hash_clear(t, n) hash_clear_ ## t ((n))
+#define hash_resize(t, ...) hash_resize_ ## t (__VA_ARGS__)
+#define hash_free(t, n) hash_free_ ## t ((n))
 
-#define hash_define(t, n) \
+/* The number of slots is a power of two, or 0 to disable the table */
+
+#define hash_define(t) \
 	typedef struct hash_ ## t { \
-		t keys[n]; \
-		const void *values[n]; \
+		t *keys; \
+		const void **values; \
+		uint32_t n; \
 	} hash_ ## t; \
-	static inline uint32_t hash_modulo_ ## t(uint32_t hash) { \
-		return hash & (n - 1); \
+	static inline uint32_t hash_modulo_ ## t(const hash_ ##t *hash, uint32_t value) { \
+		return value & (hash->n - 1); \
 	} \
 	static inline void hash_insert_ ## t (hash_ ##t *hash, const t *key, const void *value) { \
-		uint32_t i = hash_modulo_ ## t(hash_function_ ## t(key)); \
+		if(!hash->n) return; \
+		uint32_t i = hash_modulo_ ## t(hash, hash_function_ ## t(key)); \
 		for(uint8_t f=0; f< (HASH_SEARCH_ITERATIONS - 1); f++){ \
 			if(hash->values[i] == NULL || !memcmp(key, &hash->keys[i], sizeof(t))) { \
 				memcpy(&hash->keys[i], key, sizeof(t)); \
 				hash->values[i] = value; \
 				return; \
 			} \
-			if(++i == n) i = 0; \
+			if(++i == hash->n) i = 0; \
 		} \
 		/* We always pick the last slot. It's unfair. But thats life */ \
 		memcpy(&hash->keys[i], key, sizeof(t)); \
 		hash->values[i] = value; \
 	} \
 	static inline void *hash_search_ ## t (const hash_ ##t *hash, const t *key) { \
-		uint32_t i = hash_modulo_ ## t(hash_function_ ## t(key)); \
+		if(!hash->n) return NULL; \
+		uint32_t i = hash_modulo_ ## t(hash, hash_function_ ## t(key)); \
 		for(uint8_t f=0; f<HASH_SEARCH_ITERATIONS; f++){ \
 			if(!memcmp(key, &hash->keys[i], sizeof(t))) { \
 				return (void *)hash->values[i]; \
 			} \
-			if(++i == n) i = 0; \
+			if(++i == hash->n) i = 0; \
 		} \
 		return NULL; \
 	} \
-	static inline void hash_delete_ ## t (hash_ ##t *hash, const t *key) { \
-		uint32_t i = hash_modulo_ ## t(hash_function_ ## t(key)); \
+	static inline bool hash_delete_ ## t (hash_ ##t *hash, const t *key) { \
+		if(!hash->n) return false; \
+		uint32_t i = hash_modulo_ ## t(hash, hash_function_ ## t(key)); \
 		for(uint8_t f=0; f<HASH_SEARCH_ITERATIONS; f++){ \
 			if(!memcmp(key, &hash->keys[i], sizeof(t))) { \
+				bool found = hash->values[i]; \
 				hash->values[i] = NULL; \
-				return; \
+				return found; \
 			} \
-			if(++i == n) i = 0; \
+			if(++i == hash->n) i = 0; \
 		} \
+		return false; \
 	} \
 	static inline void hash_clear_ ## t(hash_ ##t *hash) { \
-		memset(hash->values, 0, n * sizeof(*hash->values)); \
-		memset(hash->keys, 0, n * sizeof(*hash->keys)); \
+		if(!hash->n) return; \
+		memset(hash->values, 0, hash->n * sizeof(*hash->values)); \
+		memset(hash->keys, 0, hash->n * sizeof(*hash->keys)); \
+	} \
+	static inline void hash_free_ ## t(hash_ ##t *hash) { \
+		free(hash->keys); \
+		free(hash->values); \
+		hash->keys = NULL; \
+		hash->values = NULL; \
+		hash->n = 0; \
+	} \
+	static inline void hash_resize_ ## t(hash_ ##t *hash, uint32_t n) { \
+		hash_free_ ## t(hash); \
+		if(!n) return; \
+		hash->keys = xzalloc(n * sizeof(*hash->keys)); \
+		hash->values = xzalloc(n * sizeof(*hash->values)); \
+		hash->n = n; \
 	}
 
 
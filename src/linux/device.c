@@ -36,6 +36,8 @@ typedef enum device_type_t {
 } device_type_t;
 
 int device_fd = -1;
+static int queue_fds[MAX_DEVICE_QUEUES];
+static int queues = 0;
 static device_type_t device_type;
 char *device = NULL;
 char *iface = NULL;
@@ -43,6 +45,21 @@ static char *type = NULL;
 static char ifrname[IFNAMSIZ];
 static const char *device_info;
 
+static int open_queue(void) {
+	int fd = open(device, O_RDWR | O_NONBLOCK);
+
+	if(fd < 0) {
+		logger(DEBUG_ALWAYS, LOG_ERR, "Could not open %s: %s", device, strerror(errno));
+		return -1;
+	}
+
+#ifdef FD_CLOEXEC
+	fcntl(fd, F_SETFD, FD_CLOEXEC);
+#endif
+
+	return fd;
+}
+
 static bool setup_device(void) {
 	if(!get_config_string(lookup_config(&config_tree, "Device"), &device)) {
 		device = xstrdup(DEFAULT_DEVICE);
@@ -53,17 +70,29 @@ static bool setup_device(void) {
 			iface = xstrdup(netname);
 		}
 
-	device_fd = open(device, O_RDWR | O_NONBLOCK);
+	int device_queues = 1;
 
-	if(device_fd < 0) {
-		logger(DEBUG_ALWAYS, LOG_ERR, "Could not open %s: %s", device, strerror(errno));
+	if(get_config_int(lookup_config(&config_tree, "DeviceQueues"), &device_queues)
+	                && (device_queues < 1 || device_queues > MAX_DEVICE_QUEUES)) {
+		logger(DEBUG_ALWAYS, LOG_ERR, "DeviceQueues must be between 1 and %d!", MAX_DEVICE_QUEUES);
+		return false;
+	}
+
+#ifndef IFF_MULTI_QUEUE
+
+	if(device_queues > 1) {
+		logger(DEBUG_ALWAYS, LOG_ERR, "Multi-queue tun/tap devices are not supported on this platform!");
 		return false;
 	}
 
-#ifdef FD_CLOEXEC
-	fcntl(device_fd, F_SETFD, FD_CLOEXEC);
 #endif
 
+	device_fd = open_queue();
+
+	if(device_fd < 0) {
+		return false;
+	}
+
 	struct ifreq ifr = {0};
 
 	get_config_string(lookup_config(&config_tree, "DeviceType"), &type);
@@ -96,6 +125,14 @@ static bool setup_device(void) {
 		ifr.ifr_flags |= IFF_ONE_QUEUE;
 	}
 
+#endif
+
+#ifdef IFF_MULTI_QUEUE
+
+	if(device_queues > 1) {
+		ifr.ifr_flags |= IFF_MULTI_QUEUE;
+	}
+
 #endif
 
 	if(iface) {
@@ -113,7 +150,31 @@ static bool setup_device(void) {
 		return false;
 	}
 
-	logger(DEBUG_ALWAYS, LOG_INFO, "%s is a %s", device, device_info);
+	queue_fds[0] = device_fd;
+	queues = 1;
+
+	/* Every other queue is attached to the interface created by the first one */
+
+	while(queues < device_queues) {
+		int fd = open_queue();
+
+		if(fd < 0) {
+			return false;
+		}
+
+		queue_fds[queues++] = fd;
+
+		if(ioctl(fd, TUNSETIFF, &ifr)) {
+			logger(DEBUG_ALWAYS, LOG_ERR, "Could not attach queue %d to %s: %s", queues - 1, ifrname, strerror(errno));
+			return false;
+		}
+	}
+
+	if(queues > 1) {
+		logger(DEBUG_ALWAYS, LOG_INFO, "%s is a %s with %d queues", device, device_info, queues);
+	} else {
+		logger(DEBUG_ALWAYS, LOG_INFO, "%s is a %s", device, device_info);
+	}
 
 	if(ifr.ifr_flags & IFF_TAP) {
 		struct ifreq ifr_mac = {0};
@@ -129,6 +190,12 @@ static bool setup_device(void) {
 }
 
 static void close_device(void) {
+	for(int i = 1; i < queues; i++) {
+		close(queue_fds[i]);
+	}
+
+	queues = 0;
+
 	close(device_fd);
 	device_fd = -1;
 
@@ -141,42 +208,54 @@ static void close_device(void) {
 	device_info = NULL;
 }
 
-static bool read_packet(vpn_packet_t *packet) {
+/* Doesn't log, so that it can be called on worker threads */
+static bool read_from(int fd, vpn_packet_t *packet) {
 	ssize_t inlen;
 
 	switch(device_type) {
 	case DEVICE_TYPE_TUN:
-		inlen = read(device_fd, DATA(packet) + 10, MTU - 10);
+		inlen = read(fd, DATA(packet) + 10, MTU - 10);
+		break;
 
-		if(inlen <= 0) {
-			logger(DEBUG_ALWAYS, LOG_ERR, "Error while reading from %s %s: %s",
-			       device_info, device, strerror(errno));
+	case DEVICE_TYPE_TAP:
+		inlen = read(fd, DATA(packet), MTU);
+		break;
 
-			if(errno == EBADFD) {  /* File descriptor in bad state */
-				event_exit();
-			}
+	default:
+		abort();
+	}
 
-			return false;
-		}
+	if(inlen <= 0) {
+		return false;
+	}
 
+	if(device_type == DEVICE_TYPE_TUN) {
 		memset(DATA(packet), 0, 12);
 		packet->len = inlen + 10;
-		break;
+	} else {
+		packet->len = inlen;
+	}
 
-	case DEVICE_TYPE_TAP:
-		inlen = read(device_fd, DATA(packet), MTU);
+	return true;
+}
 
-		if(inlen <= 0) {
-			logger(DEBUG_ALWAYS, LOG_ERR, "Error while reading from %s %s: %s",
-			       device_info, device, strerror(errno));
+static bool read_packet(vpn_packet_t *packet) {
+	errno = 0;
+
+	if(!read_from(device_fd, packet)) {
+		/* The device has been drained, errno is left for handle_device_data() */
+		if(errno == EAGAIN) {
 			return false;
 		}
 
-		packet->len = inlen;
-		break;
+		logger(DEBUG_ALWAYS, LOG_ERR, "Error while reading from %s %s: %s",
+		       device_info, device, strerror(errno));
 
-	default:
-		abort();
+		if(device_type == DEVICE_TYPE_TUN && errno == EBADFD) {  /* File descriptor in bad state */
+			event_exit();
+		}
+
+		return false;
 	}
 
 	logger(DEBUG_TRAFFIC, LOG_DEBUG, "Read packet of %d bytes from %s", packet->len,
@@ -185,6 +264,48 @@ static bool read_packet(vpn_packet_t *packet) {
 	return true;
 }
 
+static int queue_fd(int queue) {
+	return queue >= 0 && queue < queues ? queue_fds[queue] : -1;
+}
+
+static bool read_queue(vpn_packet_t *packet, int queue) {
+	return read_from(queue_fd(queue), packet);
+}
+
+/* Pick the queue to write a packet to from its IP addresses, so that packets
+   of a flow go through the same queue, and different flows are spread out */
+static int write_fd(const vpn_packet_t *packet) {
+	if(queues < 2 || packet->len < 14) {
+		return device_fd;
+	}
+
+	const uint8_t *data = DATA(packet);
+	uint16_t type = data[12] << 8 | data[13];
+	size_t start, end;
+
+	if(type == ETH_P_IP) {
+		start = 14 + 12;
+		end = 14 + 20;
+	} else if(type == ETH_P_IPV6) {
+		start = 14 + 8;
+		end = 14 + 40;
+	} else {
+		return device_fd;
+	}
+
+	if(packet->len < end) {
+		return device_fd;
+	}
+
+	uint32_t hash = 2166136261u;
+
+	for(size_t i = start; i < end; i++) {
+		hash = (hash ^ data[i]) * 16777619u;
+	}
+
+	return queue_fds[hash % queues];
+}
+
 static bool write_packet(vpn_packet_t *packet) {
 	logger(DEBUG_TRAFFIC, LOG_DEBUG, "Writing packet of %d bytes to %s",
 	       packet->len, device_info);
@@ -193,7 +314,7 @@ static bool write_packet(vpn_packet_t *packet) {
 	case DEVICE_TYPE_TUN:
 		DATA(packet)[10] = DATA(packet)[11] = 0;
 
-		if(write(device_fd, DATA(packet) + 10, packet->len - 10) < 0) {
+		if(write(write_fd(packet), DATA(packet) + 10, packet->len - 10) < 0) {
 			logger(DEBUG_ALWAYS, LOG_ERR, "Can't write to %s %s: %s", device_info, device,
 			       strerror(errno));
 			return false;
@@ -202,7 +323,7 @@ static bool write_packet(vpn_packet_t *packet) {
 		break;
 
 	case DEVICE_TYPE_TAP:
-		if(write(device_fd, DATA(packet), packet->len) < 0) {
+		if(write(write_fd(packet), DATA(packet), packet->len) < 0) {
 			logger(DEBUG_ALWAYS, LOG_ERR, "Can't write to %s %s: %s", device_info, device,
 			       strerror(errno));
 			return false;
@@ -222,4 +343,7 @@ const devops_t os_devops = {
 	.close = close_device,
 	.read = read_packet,
 	.write = write_packet,
+	.queue_fd = queue_fd,
+	.read_queue = read_queue,
+	.nonblocking = true,
 };
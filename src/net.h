@@ -45,6 +45,7 @@
 #define MAXBUFSIZE ((MAXSIZE > 2048 ? MAXSIZE : 2048) + 128)
 
 #define MAXSOCKETS 8    /* Probably overkill... */
+#define MAX_UDP_SHARDS 16
 
 typedef struct mac_t {
 	uint8_t x[6];
@@ -107,9 +108,24 @@ typedef struct vpn_packet_t {
 #define PKT_MAC 2
 #define PKT_PROBE 4
 
+/* Additional UDP socket bound to the same address as a listen socket (see UDPShards) */
+typedef struct udp_shard_t {
+	io_t io;
+	struct listen_socket_t *ls;
+} udp_shard_t;
+
+/* Queue of the virtual network device (see DeviceQueues) */
+typedef struct device_queue_t {
+	io_t io;
+	int queue;
+	struct device_work_t *work;     /* Packets read on a worker thread, if CryptoThreads is set */
+} device_queue_t;
+
 typedef struct listen_socket_t {
 	io_t tcp;
 	io_t udp;
+	udp_shard_t shard[MAX_UDP_SHARDS - 1];
+	int shards;
 	sockaddr_t sa;
 	bool bindto;
 	int priority;
@@ -153,6 +169,7 @@ extern int udp_rcvbuf;
 extern int udp_sndbuf;
 extern bool udp_rcvbuf_warnings;
 extern bool udp_sndbuf_warnings;
+extern int udp_shards;
 extern int max_connection_burst;
 extern int fwmark;
 extern bool do_prune;
@@ -187,6 +204,7 @@ extern char *scriptextension;
 
 extern void retry_outgoing(outgoing_t *outgoing);
 extern void handle_incoming_vpn_data(void *data, int flags);
+extern void handle_incoming_vpn_shard(void *data, int flags);
 extern void finish_connecting(struct connection_t *c);
 extern bool do_outgoing_connection(struct outgoing_t *outgoing);
 extern void handle_new_meta_connection(void *data, int flags);
@@ -211,6 +229,7 @@ extern int main_loop(void);
 extern void terminate_connection(struct connection_t *c, bool report);
 extern bool node_read_ecdsa_public_key(struct node_t *n);
 extern void handle_device_data(void *data, int flags);
+extern void handle_finished_work(void *data, int flags);
 extern void handle_meta_connection_data(struct connection_t *c);
 extern void regenerate_key(void);
 extern void purge(void);
@@ -54,6 +54,8 @@
 #include "route.h"
 #include "utils.h"
 #include "random.h"
+#include "workers.h"
+#include "xalloc.h"
 
 /* The minimum size of a probe is 14 bytes, but since we normally use CBC mode
    encryption, we can add a few extra random bytes without increasing the
@@ -416,6 +418,42 @@ static bool try_mac(node_t *n, const vpn_packet_t *inpkt) {
 #endif
 }
 
+/* Update what we know about n after a packet was successfully received from it */
+static void received_udppacket(node_t *n, size_t sock, const sockaddr_t *addr, bool direct) {
+	n->sock = sock;
+
+	if(direct && sockaddrcmp(addr, &n->address)) {
+		update_node_udp(n, addr);
+	}
+
+	/* If the packet went through a relay, help the sender find the appropriate MTU
+	   through the relay path. */
+
+	if(!direct) {
+		send_mtu_info(myself, n, MTU);
+	}
+}
+
+/* Move packets rejected by SPTPS replay protection to the node's counter,
+   before a restart of SPTPS resets them. */
+static void count_replayed(node_t *n) {
+	n->in_replayed += n->sptps.replayed;
+	n->sptps.replayed = 0;
+}
+
+static void sptps_receive_failed(node_t *n) {
+	count_replayed(n);
+
+	/* Uh-oh. It might be that the tunnel is stuck in some corrupted state,
+	   so let's restart SPTPS in case that helps. But don't do that too often
+	   to prevent storms, and because that would make life a little too easy
+	   for external attackers trying to DoS us. */
+	if(n->last_req_key < now.tv_sec - 10) {
+		logger(DEBUG_PROTOCOL, LOG_ERR, "Failed to decode raw TCP packet from %s (%s), restarting SPTPS", n->name, n->hostname);
+		send_req_key(n);
+	}
+}
+
 static bool receive_udppacket(node_t *n, vpn_packet_t *inpkt) {
 	if(n->status.sptps) {
 		if(!n->sptps.state) {
@@ -434,15 +472,7 @@ static bool receive_udppacket(node_t *n, vpn_packet_t *inpkt) {
 		n->status.udppacket = false;
 
 		if(!result) {
-			/* Uh-oh. It might be that the tunnel is stuck in some corrupted state,
-			   so let's restart SPTPS in case that helps. But don't do that too often
-			   to prevent storms, and because that would make life a little too easy
-			   for external attackers trying to DoS us. */
-			if(n->last_req_key < now.tv_sec - 10) {
-				logger(DEBUG_PROTOCOL, LOG_ERR, "Failed to decode raw TCP packet from %s (%s), restarting SPTPS", n->name, n->hostname);
-				send_req_key(n);
-			}
-
+			sptps_receive_failed(n);
 			return false;
 		}
 
@@ -515,6 +545,7 @@ static bool receive_udppacket(node_t *n, vpn_packet_t *inpkt) {
 				if(n->farfuture++ < replaywin >> 2) {
 					logger(DEBUG_TRAFFIC, LOG_WARNING, "Packet from %s (%s) is %d seqs in the future, dropped (%u)",
 					       n->name, n->hostname, seqno - n->received_seqno - 1, n->farfuture);
+					n->in_replayed++;
 					return false;
 				}
 
@@ -525,6 +556,7 @@ static bool receive_udppacket(node_t *n, vpn_packet_t *inpkt) {
 				if((n->received_seqno >= replaywin * 8 && seqno <= n->received_seqno - replaywin * 8) || !(n->late[(seqno / 8) % replaywin] & (1 << seqno % 8))) {
 					logger(DEBUG_TRAFFIC, LOG_WARNING, "Got late or replayed packet from %s (%s), seqno %d, last received %d",
 					       n->name, n->hostname, seqno, n->received_seqno);
+					n->in_replayed++;
 					return false;
 				}
 			} else {
@@ -659,6 +691,9 @@ bool receive_tcppacket_sptps(connection_t *c, const char *data, size_t len) {
 	/* The packet is for us */
 
 	if(!sptps_receive_data(&from->sptps, data, len)) {
+		from->in_dropped++;
+		count_replayed(from);
+
 		/* Uh-oh. It might be that the tunnel is stuck in some corrupted state,
 		   so let's restart SPTPS in case that helps. But don't do that too often
 		   to prevent storms. */
@@ -674,8 +709,143 @@ bool receive_tcppacket_sptps(connection_t *c, const char *data, size_t len) {
 	return true;
 }
 
+/* With CryptoThreads set, SPTPS data packets are encrypted and decrypted on worker threads.
+   Sequence numbers, replay protection, routing and sending stay on the main thread.
+   All packets from or to a node are handled by the same thread, so their order is kept. */
+
+#ifdef HAVE_WORKERS
+typedef struct crypto_work_t {
+	work_t work;
+	sptps_datagram_t datagram;
+	node_id_t node;         /* Nodes are looked up by ID when the work is done, they might be gone by then */
+	node_id_t from;
+	sockaddr_t addr;
+	size_t sock;
+	bool direct;
+	uint8_t data[MAXSIZE + SPTPS_DATAGRAM_OVERHEAD];
+} crypto_work_t;
+
+static unsigned int work_key(const node_t *n) {
+	unsigned int key;
+	memcpy(&key, &n->id, sizeof(key));
+	return key;
+}
+
+static void seal_run(work_t *work) {
+	crypto_work_t *w = (crypto_work_t *)work;
+	sptps_seal(&w->datagram, w->data);
+}
+
+static void seal_done(work_t *work) {
+	crypto_work_t *w = (crypto_work_t *)work;
+	node_t *n = lookup_node_id(&w->node);
+
+	if(n && n->status.reachable) {
+		sptps_seal_finish(&n->sptps, &w->datagram, w->data);
+	}
+
+	free(w);
+}
+
+/* Returns false if the record has to be encrypted and sent by the main thread instead */
+static bool seal_sptps_record(node_t *n, uint8_t type, const void *data, uint16_t len) {
+	if(!worker_threads || !n->sptps.outstate || len > MAXSIZE) {
+		return false;
+	}
+
+	crypto_work_t *w = xmalloc(sizeof(*w));
+
+	if(!sptps_seal_begin(&n->sptps, &w->datagram, w->data, type, data, len)) {
+		free(w);
+		return true;
+	}
+
+	w->work.run = seal_run;
+	w->work.done = seal_done;
+	w->node = n->id;
+
+	if(!submit_work(&w->work, work_key(n))) {
+		logger(DEBUG_TRAFFIC, LOG_WARNING, "Too many packets waiting for encryption, dropping packet to %s (%s)", n->name, n->hostname);
+		n->out_dropped++;
+		free(w);
+	}
+
+	return true;
+}
+
+static void open_run(work_t *work) {
+	crypto_work_t *w = (crypto_work_t *)work;
+	sptps_open(&w->datagram, w->data);
+}
+
+static void open_done(work_t *work) {
+	crypto_work_t *w = (crypto_work_t *)work;
+	node_t *n = lookup_node_id(&w->node);
+	node_t *from = lookup_node_id(&w->from);
+
+	if(n && from) {
+		from->status.udppacket = true;
+		bool result = sptps_open_finish(&from->sptps, &w->datagram, w->data);
+		from->status.udppacket = false;
+
+		if(result) {
+			received_udppacket(n, w->sock, &w->addr, w->direct);
+		} else {
+			from->in_dropped++;
+			sptps_receive_failed(from);
+		}
+	}
+
+	free(w);
+}
+
+/* Returns false if the packet has to be decrypted and received by the main thread instead */
+static bool open_udppacket(node_t *n, node_t *from, size_t sock, const sockaddr_t *addr, bool direct, const vpn_packet_t *pkt) {
+	if(!worker_threads || !from->status.sptps) {
+		return false;
+	}
+
+	crypto_work_t *w = xmalloc(sizeof(*w));
+
+	if(!sptps_open_begin(&from->sptps, &w->datagram, DATA(pkt), pkt->len)) {
+		free(w);
+		return false;
+	}
+
+	memcpy(w->data, DATA(pkt), pkt->len);
+	w->work.run = open_run;
+	w->work.done = open_done;
+	w->node = n->id;
+	w->from = from->id;
+	w->addr = *addr;
+	w->sock = sock;
+	w->direct = direct;
+
+	if(!submit_work(&w->work, work_key(from))) {
+		logger(DEBUG_TRAFFIC, LOG_WARNING, "Too many packets waiting for decryption, dropping packet from %s (%s)", from->name, from->hostname);
+		from->in_dropped++;
+		free(w);
+	}
+
+	return true;
+}
+
+#endif
+
+static void send_sptps_record(node_t *n, uint8_t type, const void *data, uint16_t len) {
+#ifdef HAVE_WORKERS
+
+	if(seal_sptps_record(n, type, data, len)) {
+		return;
+	}
+
+#endif
+	sptps_send_record(&n->sptps, type, data, len);
+}
+
 static void send_sptps_packet(node_t *n, vpn_packet_t *origpkt) {
 	if(!n->status.validkey && !n->connection) {
+		n->out_dropped++;
 		return;
 	}
 
@@ -683,7 +853,7 @@ static void send_sptps_packet(node_t *n, vpn_packet_t *origpkt) {
 	int offset = 0;
 
 	if((!(DATA(origpkt)[12] | DATA(origpkt)[13])) && (n->sptps.outstate))  {
-		sptps_send_record(&n->sptps, PKT_PROBE, DATA(origpkt), origpkt->len);
+		send_sptps_record(n, PKT_PROBE, DATA(origpkt), origpkt->len);
 		return;
 	}
 
@@ -702,6 +872,7 @@ static void send_sptps_packet(node_t *n, vpn_packet_t *origpkt) {
 	if(n->outcompression != COMPRESS_NONE) {
 		outpkt.offset = 0;
 		length_t len = compress_packet(DATA(&outpkt) + offset, DATA(origpkt) + offset, origpkt->len - offset, n->outcompression);
+		n->uncompressed_bytes += origpkt->len - offset;
 
 		if(!len) {
 			logger(DEBUG_TRAFFIC, LOG_ERR, "Error while compressing packet to %s (%s)", n->name, n->hostname);
@@ -710,6 +881,8 @@ static void send_sptps_packet(node_t *n, vpn_packet_t *origpkt) {
 			origpkt = &outpkt;
 			type |= PKT_COMPRESSED;
 		}
+
+		n->compressed_bytes += origpkt->len - offset;
 	}
 
 	/* If we have a direct metaconnection to n, and we can't use UDP, then
@@ -719,7 +892,7 @@ static void send_sptps_packet(node_t *n, vpn_packet_t *origpkt) {
 	if(n->connection && origpkt->len > n->minmtu) {
 		send_tcppacket(n->connection, origpkt);
 	} else {
-		sptps_send_record(&n->sptps, type, DATA(origpkt) + offset, origpkt->len - offset);
+		send_sptps_record(n, type, DATA(origpkt) + offset, origpkt->len - offset);
 	}
 }
 
@@ -801,6 +974,120 @@ static void choose_local_address(const node_t *n, const sockaddr_t **sa, size_t
 	}
 }
 
+/* While a burst of incoming packets is being handled, outgoing UDP packets are
+   queued instead of being sent one by one, and flushed with as few system calls
+   as possible once the burst is over (or the queue is full). */
+
+#define MAX_SEND_BATCH 64
+
+#ifdef HAVE_SENDMMSG
+typedef struct queued_packet_t {
+	node_t *node;
+	size_t origlen;
+	sockaddr_t sa;
+	uint8_t data[MAXSIZE];
+} queued_packet_t;
+
+static bool send_batching = false;
+static size_t send_sock;
+static size_t send_count = 0;
+static queued_packet_t send_queue[MAX_SEND_BATCH];
+static struct mmsghdr send_msg[MAX_SEND_BATCH];
+static struct iovec send_iov[MAX_SEND_BATCH];
+#endif
+
+/* Returns false if the packet could not be sent for a reason other than it being too big */
+static bool udp_send_error(node_t *n, size_t origlen, int err) {
+	n->out_dropped++;
+
+	if(sockwouldblock(err)) {
+		return true;
+	}
+
+	if(sockmsgsize(err)) {
+		reduce_mtu(n, (int)origlen - 1);
+		return true;
+	}
+
+	logger(DEBUG_TRAFFIC, LOG_WARNING, "Error sending packet to %s (%s): %s", n->name, n->hostname, sockstrerror(err));
+	return false;
+}
+
+static void flush_udp_batch(void) {
+#ifdef HAVE_SENDMMSG
+	size_t done = 0;
+
+	while(done < send_count) {
+		int sent = sendmmsg(listen_socket[send_sock].udp.fd, send_msg + done, send_count - done, 0);
+
+		if(sent < 0) {
+			/* Only the first packet failed, the rest can still be sent */
+			udp_send_error(send_queue[done].node, send_queue[done].origlen, sockerrno);
+			done++;
+		} else {
+			done += sent;
+		}
+	}
+
+	send_count = 0;
+#endif
+}
+
+static void begin_udp_batch(void) {
+#ifdef HAVE_SENDMMSG
+	send_batching = true;
+#endif
+}
+
+static void end_udp_batch(void) {
+#ifdef HAVE_SENDMMSG
+	flush_udp_batch();
+	send_batching = false;
+#endif
+}
+
+/* Send a UDP packet of len bytes to n (whose payload was origlen bytes long) through listen_socket[sock].
+   Errors can only be reported if the packet was not queued. */
+static bool send_udp(node_t *n, size_t origlen, size_t sock, const sockaddr_t *sa, const void *data, size_t len) {
+#ifdef HAVE_SENDMMSG
+
+	if(send_batching && len <= MAXSIZE) {
+		if(send_count && (send_sock != sock || send_count == MAX_SEND_BATCH)) {
+			flush_udp_batch();
+		}
+
+		queued_packet_t *pkt = &send_queue[send_count];
+		pkt->node = n;
+		pkt->origlen = origlen;
+		pkt->sa = *sa;
+		memcpy(pkt->data, data, len);
+
+		send_iov[send_count] = (struct iovec) {
+			.iov_base = pkt->data,
+			.iov_len = len,
+		};
+
+		send_msg[send_count].msg_hdr = (struct msghdr) {
+			.msg_name = &pkt->sa.sa,
+			.msg_namelen = SALEN(pkt->sa.sa),
+			.msg_iov = &send_iov[send_count],
+			.msg_iovlen = 1,
+		};
+
+		send_sock = sock;
+		send_count++;
+		return true;
+	}
+
+#endif
+
+	if(sendto(listen_socket[sock].udp.fd, data, len, 0, &sa->sa, SALEN(sa->sa)) < 0) {
+		return udp_send_error(n, origlen, sockerrno);
+	}
+
+	return true;
+}
+
 static void send_udppacket(node_t *n, vpn_packet_t *origpkt) {
 	if(!n->status.reachable) {
 		logger(DEBUG_TRAFFIC, LOG_INFO, "Trying to send UDP packet to unreachable node %s (%s)", n->name, n->hostname);
@@ -859,9 +1146,12 @@ static void send_udppacket(node_t *n, vpn_packet_t *origpkt) {
 		if(!(outpkt->len = compress_packet(DATA(outpkt), DATA(inpkt), inpkt->len, n->outcompression))) {
 			logger(DEBUG_TRAFFIC, LOG_ERR, "Error while compressing packet to %s (%s)",
 			       n->name, n->hostname);
+			n->out_dropped++;
 			return;
 		}
 
+		n->uncompressed_bytes += inpkt->len;
+		n->compressed_bytes += outpkt->len;
 		inpkt = outpkt;
 	}
 
@@ -911,6 +1201,8 @@ static void send_udppacket(node_t *n, vpn_packet_t *origpkt) {
 	}
 
 	if(priorityinheritance && origpriority != listen_socket[sock].priority) {
+		/* Queued packets must not be sent with the new priority */
+		flush_udp_batch();
 		listen_socket[sock].priority = origpriority;
 
 		switch(sa->sa.sa_family) {
@@ -942,13 +1234,7 @@ static void send_udppacket(node_t *n, vpn_packet_t *origpkt) {
 		}
 	}
 
-	if(sendto(listen_socket[sock].udp.fd, (void *)SEQNO(inpkt), inpkt->len, 0, &sa->sa, SALEN(sa->sa)) < 0 && !sockwouldblock(sockerrno)) {
-		if(sockmsgsize(sockerrno)) {
-			reduce_mtu(n, origlen - 1);
-		} else {
-			logger(DEBUG_TRAFFIC, LOG_WARNING, "Error sending packet to %s (%s): %s", n->name, n->hostname, sockstrerror(sockerrno));
-		}
-	}
+	send_udp(n, origlen, sock, sa, SEQNO(inpkt), inpkt->len);
 
 end:
 	origpkt->len = origlen;
@@ -1034,16 +1320,7 @@ bool send_sptps_data(node_t *to, node_t *from, int type, const void *data, size_
 
 	logger(DEBUG_TRAFFIC, LOG_INFO, "Sending packet from %s (%s) to %s (%s) via %s (%s) (UDP)", from->name, from->hostname, to->name, to->hostname, relay->name, relay->hostname);
 
-	if(sendto(listen_socket[sock].udp.fd, buf, buf_ptr - buf, 0, &sa->sa, SALEN(sa->sa)) < 0 && !sockwouldblock(sockerrno)) {
-		if(sockmsgsize(sockerrno)) {
-			reduce_mtu(relay, (int)origlen - 1);
-		} else {
-			logger(DEBUG_TRAFFIC, LOG_WARNING, "Error sending UDP SPTPS packet to %s (%s): %s", relay->name, relay->hostname, sockstrerror(sockerrno));
-			return false;
-		}
-	}
-
-	return true;
+	return send_udp(relay, origlen, sock, sa, buf, buf_ptr - buf);
 }
 
 bool receive_sptps_record(void *handle, uint8_t type, const void *data, uint16_t len) {
@@ -1566,6 +1843,7 @@ void send_packet(node_t *n, vpn_packet_t *packet) {
 
 	if(!n->status.reachable) {
 		logger(DEBUG_TRAFFIC, LOG_INFO, "Node %s (%s) is not reachable", n->name, n->hostname);
+		n->out_dropped++;
 		return;
 	}
 
@@ -1652,59 +1930,78 @@ void broadcast_packet(const node_t *from, vpn_packet_t *packet) {
 	}
 }
 
+/* How many nodes with no known address matching a packet are tried per second */
+#define MAX_HARD_TRIES 64
+
+static bool has_key_in(const node_t *n) {
+	if(!n->status.reachable || n == myself) {
+		return false;
+	}
+
+	return n->status.validkey_in || (n->status.sptps && n->sptps.instate);
+}
+
 /* We got a packet from some IP address, but we don't know who sent it.  Try to
-   verify the message authentication code against all active session keys.
-   Since this is actually an expensive operation, we only do a full check once
-   a minute, the rest of the time we only check against nodes for which we know
-   an IP address that matches the one from the packet.  */
+   verify the message authentication code against the session keys of nodes
+   that other nodes see at this IP address, which are found in the edge address
+   index.  Since this is actually an expensive operation, we only try other
+   nodes once a second, and then no more than MAX_HARD_TRIES of them, carrying
+   on where the previous round stopped.  */
 
 static node_t *try_harder(const sockaddr_t *from, const vpn_packet_t *pkt) {
-	node_t *match = NULL;
-	bool hard = false;
 	static time_t last_hard_try = 0;
+	static char next_hard_try[MAX_STRING_SIZE] = "";
+	const node_t *tried = NULL;
 
-	for splay_each(node_t, n, &node_tree) {
-		if(!n->status.reachable || n == myself) {
+	for(edge_t *e = lookup_edge_address(from); e; e = lookup_edge_address_next(e)) {
+		node_t *n = e->to;
+
+		// Edges to the same node are next to each other
+		if(!e->reverse || n == tried || !has_key_in(n)) {
 			continue;
 		}
 
-		if(!n->status.validkey_in && !(n->status.sptps && n->sptps.instate)) {
-			continue;
+		tried = n;
+
+		if(try_mac(n, pkt)) {
+			return n;
 		}
+	}
 
-		bool soft = false;
+	if(last_hard_try == now.tv_sec || !node_tree.head) {
+		return NULL;
+	}
 
-		for splay_each(edge_t, e, &n->edge_tree) {
-			if(!e->reverse) {
-				continue;
-			}
+	last_hard_try = now.tv_sec;
 
-			if(!sockaddrcmp_noport(from, &e->reverse->address)) {
-				soft = true;
-				break;
-			}
-		}
+	node_t key = {.name = next_hard_try};
+	splay_node_t *node = splay_search_closest_greater_node(&node_tree, &key);
+	node_t *match = NULL;
+	int tries = 0;
 
-		if(!soft) {
-			if(last_hard_try == now.tv_sec) {
-				continue;
-			}
+	if(!node) {
+		node = node_tree.head;
+	}
 
-			hard = true;
-		}
+	for(unsigned int visited = 0; visited < node_tree.count && tries < MAX_HARD_TRIES; visited++) {
+		node_t *n = node->data;
+		node = node->next ? node->next : node_tree.head;
 
-		if(!try_mac(n, pkt)) {
+		if(!has_key_in(n)) {
 			continue;
 		}
 
-		match = n;
-		break;
-	}
+		tries++;
 
-	if(hard) {
-		last_hard_try = now.tv_sec;
+		if(try_mac(n, pkt)) {
+			match = n;
+			break;
+		}
 	}
 
+	node_t *next = node->data;
+	snprintf(next_hard_try, sizeof(next_hard_try), "%s", next->name);
+
 	return match;
 }
 
@@ -1808,29 +2105,24 @@ skip_harder:
 		from = n;
 	}
 
-	if(!receive_udppacket(from, pkt)) {
+#ifdef HAVE_WORKERS
+
+	if(open_udppacket(n, from, ls - listen_socket, addr, direct, pkt)) {
 		return;
 	}
 
-	n->sock = ls - listen_socket;
+#endif
 
-	if(direct && sockaddrcmp(addr, &n->address)) {
-		update_node_udp(n, addr);
+	if(!receive_udppacket(from, pkt)) {
+		from->in_dropped++;
+		return;
 	}
 
-	/* If the packet went through a relay, help the sender find the appropriate MTU
-	   through the relay path. */
-
-	if(!direct) {
-		send_mtu_info(myself, n, MTU);
-	}
+	received_udppacket(n, ls - listen_socket, addr, direct);
 }
 
-void handle_incoming_vpn_data(void *data, int flags) {
-	(void)data;
-	(void)flags;
-	listen_socket_t *ls = data;
-
+/* Read packets from fd, which is either the UDP socket of ls or one of its shards */
+static void receive_vpn_data(listen_socket_t *ls, int fd) {
 #ifdef HAVE_RECVMMSG
 #define MAX_MSG 64
 	static ssize_t num = MAX_MSG;
@@ -1855,7 +2147,7 @@ void handle_incoming_vpn_data(void *data, int flags) {
 		};
 	}
 
-	num = recvmmsg(ls->udp.fd, msg, MAX_MSG, MSG_DONTWAIT, NULL);
+	num = recvmmsg(fd, msg, MAX_MSG, MSG_DONTWAIT, NULL);
 
 	if(num < 0) {
 		if(!sockwouldblock(sockerrno)) {
@@ -1865,6 +2157,8 @@ void handle_incoming_vpn_data(void *data, int flags) {
 		return;
 	}
 
+	begin_udp_batch();
+
 	for(int i = 0; i < num; i++) {
 		pkt[i].len = msg[i].msg_len;
 
@@ -1875,13 +2169,15 @@ void handle_incoming_vpn_data(void *data, int flags) {
 		handle_incoming_vpn_packet(ls, &pkt[i], &addr[i]);
 	}
 
+	end_udp_batch();
+
 #else
 	vpn_packet_t pkt;
 	sockaddr_t addr = {0};
 	socklen_t addrlen = sizeof(addr);
 
 	pkt.offset = 0;
-	ssize_t len = recvfrom(ls->udp.fd, (void *)DATA(&pkt), MAXSIZE, 0, &addr.sa, &addrlen);
+	ssize_t len = recvfrom(fd, (void *)DATA(&pkt), MAXSIZE, 0, &addr.sa, &addrlen);
 
 	if(len <= 0 || (size_t)len > MAXSIZE) {
 		if(!sockwouldblock(sockerrno)) {
@@ -1897,26 +2193,160 @@ void handle_incoming_vpn_data(void *data, int flags) {
 #endif
 }
 
+void handle_incoming_vpn_data(void *data, int flags) {
+	(void)flags;
+	listen_socket_t *ls = data;
+	receive_vpn_data(ls, ls->udp.fd);
+}
+
+void handle_incoming_vpn_shard(void *data, int flags) {
+	(void)flags;
+	udp_shard_t *shard = data;
+	receive_vpn_data(shard->ls, shard->io.fd);
+}
+
+static int device_errors = 0;
+
+static void receive_device_packet(vpn_packet_t *packet) {
+	device_errors = 0;
+	myself->in_packets++;
+	myself->in_bytes += packet->len;
+	route(myself, packet);
+}
+
+/* Unlike read(), read_queue() leaves logging the error to its caller */
+static void device_read_failed(int queue, int error, bool logged) {
+	if(!logged) {
+		logger(DEBUG_ALWAYS, LOG_ERR, "Error while reading from queue %d of %s: %s", queue, device, strerror(error));
+	}
+
+	sleep_millis(device_errors * 50);
+	device_errors++;
+
+	if(device_errors > 10) {
+		logger(DEBUG_ALWAYS, LOG_ERR, "Too many errors from %s, exiting!", device);
+		event_exit();
+	}
+}
+
+/* With CryptoThreads set, device queues are read on worker threads, so that several
+   queues are read at the same time, and the main thread only routes the packets.
+   Each queue is read by one thread at a time, so packets of a flow stay in order. */
+
+#ifdef HAVE_WORKERS
+typedef struct device_work_t {
+	work_t work;
+	device_queue_t *queue;
+	int count;
+	int error;              /* errno of a failed read, 0 if the queue was drained or the batch is full */
+	vpn_packet_t packet[DEVICE_READ_BATCH];
+} device_work_t;
+
+static void device_read_run(work_t *work) {
+	device_work_t *w = (device_work_t *)work;
+	w->count = 0;
+	w->error = 0;
+
+	while(w->count < DEVICE_READ_BATCH) {
+		vpn_packet_t *packet = &w->packet[w->count];
+		packet->offset = DEFAULT_PACKET_OFFSET;
+		packet->priority = 0;
+		errno = 0;
+
+		if(!devops.read_queue(packet, w->queue->queue)) {
+			if(errno != EAGAIN) {
+				w->error = errno ? errno : EIO;
+			}
+
+			break;
+		}
+
+		w->count++;
+	}
+}
+
+static void device_read_done(work_t *work) {
+	device_work_t *w = (device_work_t *)work;
+
+	for(int i = 0; i < w->count; i++) {
+		receive_device_packet(&w->packet[i]);
+	}
+
+	if(w->error) {
+		device_read_failed(w->queue->queue, w->error, false);
+	}
+
+	/* The queue was not watched while it was being read */
+	if(w->queue->io.cb) {
+		io_set(&w->queue->io, IO_READ);
+	}
+}
+
+/* Returns false if the worker is too busy, and the queue has to be read by the main thread instead */
+static bool read_device_queue(device_queue_t *q) {
+	if(!q->work) {
+		q->work = xzalloc(sizeof(*q->work));
+		q->work->work.run = device_read_run;
+		q->work->work.done = device_read_done;
+		q->work->queue = q;
+	}
+
+	if(!submit_work(&q->work->work, q->queue)) {
+		return false;
+	}
+
+	io_set(&q->io, 0);
+	return true;
+}
+#endif
+
 void handle_device_data(void *data, int flags) {
-	(void)data;
 	(void)flags;
-	vpn_packet_t packet;
-	packet.offset = DEFAULT_PACKET_OFFSET;
-	packet.priority = 0;
-	static int errors = 0;
+	device_queue_t *q = data;
 
-	if(devops.read(&packet)) {
-		errors = 0;
-		myself->in_packets++;
-		myself->in_bytes += packet.len;
-		route(myself, &packet);
-	} else {
-		sleep_millis(errors * 50);
-		errors++;
+#ifdef HAVE_WORKERS
+
+	if(worker_threads && devops.read_queue && devops.nonblocking && read_device_queue(q)) {
+		return;
+	}
+
+#endif
+
+	/* Non-blocking devices are drained on every wakeup (up to a limit, so that
+	   sockets are not starved), saving a trip through the event loop per packet */
 
-		if(errors > 10) {
-			logger(DEBUG_ALWAYS, LOG_ERR, "Too many errors from %s, exiting!", device);
-			event_exit();
+	int batch = devops.nonblocking ? DEVICE_READ_BATCH : 1;
+
+	begin_udp_batch();
+
+	for(int i = 0; i < batch; i++) {
+		vpn_packet_t packet;
+		packet.offset = DEFAULT_PACKET_OFFSET;
+		packet.priority = 0;
+		errno = 0;
+
+		if(!(q->queue ? devops.read_queue(&packet, q->queue) : devops.read(&packet))) {
+			if(devops.nonblocking && errno == EAGAIN) {
+				break;
+			}
+
+			device_read_failed(q->queue, errno ? errno : EIO, !q->queue);
+			break;
 		}
+
+		receive_device_packet(&packet);
 	}
+
+	end_udp_batch();
 }
+
+#ifdef HAVE_WORKERS
+void handle_finished_work(void *data, int flags) {
+	(void)data;
+	(void)flags;
+
+	begin_udp_batch();
+	finish_work();
+	end_udp_batch();
+}
+#endif
@@ -46,13 +46,18 @@
 #include "xalloc.h"
 #include "keys.h"
 #include "sandbox.h"
+#include "workers.h"
 
 #ifdef HAVE_MINIUPNPC
 #include "upnp.h"
 #endif
 
 ports_t myport;
-static io_t device_io;
+static device_queue_t device_queue[MAX_DEVICE_QUEUES];
+#ifdef HAVE_WORKERS
+static io_t workers_io;
+#endif
+static int device_queues;
 devops_t devops;
 bool device_standby = false;
 
@@ -464,7 +469,7 @@ bool setup_myself_reloadable(void) {
 
 	for splay_each(subnet_t, s, &subnet_tree) {
 		if(!s->owner) {
-			splay_delete_node(&subnet_tree, node);
+			subnet_del(NULL, s);
 		}
 	}
 
@@ -510,6 +515,17 @@ bool setup_myself_reloadable(void) {
 		macexpire = 600;
 	}
 
+	int subnet_cache_size = SUBNET_HASH_SIZE;
+
+	if(get_config_int(lookup_config(&config_tree, "SubnetCacheSize"), &subnet_cache_size)) {
+		if(subnet_cache_size < 0 || subnet_cache_size > MAX_SUBNET_CACHE_SIZE) {
+			logger(DEBUG_ALWAYS, LOG_ERR, "SubnetCacheSize must be between 0 and %d!", MAX_SUBNET_CACHE_SIZE);
+			return false;
+		}
+	}
+
+	subnet_cache_resize(subnet_cache_size);
+
 	if(get_config_int(lookup_config(&config_tree, "MaxTimeout"), &maxtimeout)) {
 		if(maxtimeout <= 0) {
 			logger(DEBUG_ALWAYS, LOG_ERR, "Bogus maximum timeout!");
@@ -617,6 +633,25 @@ static int bind_reusing_port(const sockaddr_t *sa, int from_fd, bind_fn_t setup)
 	return fd;
 }
 
+/*
+  Open additional UDP sockets on the same address and port as sock->udp.
+  The kernel spreads incoming flows across them, and each one is read on its own.
+*/
+static void add_udp_shards(listen_socket_t *sock, const sockaddr_t *sa) {
+	for(sock->shards = 0; sock->shards < udp_shards - 1; sock->shards++) {
+		int udp_fd = bind_reusing_port(sa, sock->udp.fd, setup_vpn_in_socket);
+
+		if(udp_fd < 0) {
+			logger(DEBUG_ALWAYS, LOG_WARNING, "Could only open %d of %d UDP shards", sock->shards + 1, udp_shards);
+			break;
+		}
+
+		udp_shard_t *shard = &sock->shard[sock->shards];
+		shard->ls = sock;
+		io_add(&shard->io, handle_incoming_vpn_shard, shard, udp_fd, IO_READ);
+	}
+}
+
 /*
   Add listening sockets.
 */
@@ -708,6 +743,7 @@ static bool add_listen_address(char *address, bool bindto) {
 		listen_socket_t *sock = &listen_socket[listen_sockets];
 		io_add(&sock->tcp, handle_new_meta_connection, sock, tcp_fd, IO_READ);
 		io_add(&sock->udp, handle_incoming_vpn_data, sock, udp_fd, IO_READ);
+		add_udp_shards(sock, sa);
 
 		if(debug_level >= DEBUG_CONNECTIONS) {
 			int tcp_port = get_bound_port(tcp_fd);
@@ -888,6 +924,22 @@ static bool setup_myself(void) {
 		udp_sndbuf_warnings = true;
 	}
 
+	if(get_config_int(lookup_config(&config_tree, "UDPShards"), &udp_shards)) {
+		if(udp_shards < 1 || udp_shards > MAX_UDP_SHARDS) {
+			logger(DEBUG_ALWAYS, LOG_ERR, "UDPShards must be between 1 and %d!", MAX_UDP_SHARDS);
+			return false;
+		}
+
+#ifndef SO_REUSEPORT
+
+		if(udp_shards > 1) {
+			logger(DEBUG_ALWAYS, LOG_WARNING, "UDPShards not supported on this platform!");
+			udp_shards = 1;
+		}
+
+#endif
+	}
+
 	get_config_int(lookup_config(&config_tree, "FWMark"), &fwmark);
 #ifndef SO_MARK
 
@@ -1081,7 +1133,24 @@ static bool setup_myself(void) {
 	}
 
 	if(device_fd >= 0) {
-		io_add(&device_io, handle_device_data, NULL, device_fd, IO_READ);
+		device_queue[0].queue = 0;
+		io_add(&device_queue[0].io, handle_device_data, &device_queue[0], device_fd, IO_READ);
+		device_queues = 1;
+
+		/* Each extra queue of a multi-queue device is read on its own */
+
+		while(devops.queue_fd && devops.read_queue && device_queues < MAX_DEVICE_QUEUES) {
+			int fd = devops.queue_fd(device_queues);
+
+			if(fd < 0) {
+				break;
+			}
+
+			device_queue_t *q = &device_queue[device_queues];
+			q->queue = device_queues;
+			io_add(&q->io, handle_device_data, q, fd, IO_READ);
+			device_queues++;
+		}
 	}
 
 	/* Open sockets */
@@ -1124,6 +1193,7 @@ static bool setup_myself(void) {
 
 			io_add(&listen_socket[i].tcp, (io_cb_t)handle_new_meta_connection, &listen_socket[i], tcp_fd, IO_READ);
 			io_add(&listen_socket[i].udp, (io_cb_t)handle_incoming_vpn_data, &listen_socket[i], udp_fd, IO_READ);
+			add_udp_shards(&listen_socket[i], &sa);
 
 			if(debug_level >= DEBUG_CONNECTIONS) {
 				char *hostname = sockaddr2hostname(&sa);
@@ -1216,6 +1286,34 @@ static bool setup_myself(void) {
 /*
   initialize network
 */
+static bool setup_workers(void) {
+	int threads = 0;
+
+	if(get_config_int(lookup_config(&config_tree, "CryptoThreads"), &threads)
+	                && (threads < 0 || threads > MAX_WORKERS)) {
+		logger(DEBUG_ALWAYS, LOG_ERR, "CryptoThreads must be between 0 and %d!", MAX_WORKERS);
+		return false;
+	}
+
+	if(!threads) {
+		return true;
+	}
+
+#ifdef HAVE_WORKERS
+	int fd = init_workers(threads);
+
+	if(fd < 0) {
+		return false;
+	}
+
+	io_add(&workers_io, handle_finished_work, NULL, fd, IO_READ);
+	return true;
+#else
+	logger(DEBUG_ALWAYS, LOG_WARNING, "CryptoThreads is not supported on this platform");
+	return true;
+#endif
+}
+
 bool setup_network(void) {
 	init_connections();
 	init_subnets();
@@ -1244,6 +1342,10 @@ bool setup_network(void) {
 		return false;
 	}
 
+	if(!setup_workers()) {
+		return false;
+	}
+
 	if(!init_control()) {
 		return false;
 	}
@@ -1263,6 +1365,15 @@ bool setup_network(void) {
   close all open network connections
 */
 void close_network_connections(void) {
+#ifdef HAVE_WORKERS
+
+	if(worker_threads) {
+		io_del(&workers_io);
+		exit_workers();
+	}
+
+#endif
+
 	for(list_node_t *node = connection_list.head, *next; node; node = next) {
 		next = node->next;
 		connection_t *c = node->data;
@@ -1288,6 +1399,11 @@ void close_network_connections(void) {
 		io_del(&listen_socket[i].udp);
 		closesocket(listen_socket[i].tcp.fd);
 		closesocket(listen_socket[i].udp.fd);
+
+		for(int j = 0; j < listen_socket[i].shards; j++) {
+			io_del(&listen_socket[i].shard[j].io);
+			closesocket(listen_socket[i].shard[j].io.fd);
+		}
 	}
 
 	exit_requests();
@@ -1303,10 +1419,14 @@ void close_network_connections(void) {
 	free(myport.tcp);
 	free(myport.udp);
 
-	if(device_fd >= 0) {
-		io_del(&device_io);
+	for(int i = 0; i < device_queues; i++) {
+		io_del(&device_queue[i].io);
+		free(device_queue[i].work);
+		device_queue[i].work = NULL;
 	}
 
+	device_queues = 0;
+
 	if(devops.close) {
 		devops.close();
 	}
@@ -42,6 +42,7 @@ int udp_rcvbuf = 1024 * 1024;
 int udp_sndbuf = 1024 * 1024;
 bool udp_rcvbuf_warnings;
 bool udp_sndbuf_warnings;
+int udp_shards = 1;
 int max_connection_burst = 10;
 int fwmark;
 
@@ -331,6 +332,14 @@ int setup_vpn_in_socket(const sockaddr_t *sa) {
 	setsockopt(nfd, SOL_SOCKET, SO_REUSEADDR, (void *)&option, sizeof(option));
 	setsockopt(nfd, SOL_SOCKET, SO_BROADCAST, (void *)&option, sizeof(option));
 
+#ifdef SO_REUSEPORT
+
+	if(udp_shards > 1) {
+		setsockopt(nfd, SOL_SOCKET, SO_REUSEPORT, (void *)&option, sizeof(option));
+	}
+
+#endif
+
 	set_udp_buffer(nfd, SO_RCVBUF, "SO_RCVBUF", udp_rcvbuf, udp_rcvbuf_warnings);
 	set_udp_buffer(nfd, SO_SNDBUF, "SO_SNDBUF", udp_sndbuf, udp_sndbuf_warnings);
 
@@ -23,6 +23,7 @@
 #include "address_cache.h"
 #include "control_common.h"
 #include "logger.h"
+#include "meta.h"
 #include "net.h"
 #include "netutl.h"
 #include "node.h"
@@ -230,3 +231,95 @@ bool dump_traffic(connection_t *c) {
 
 	return send_request(c, "%d %d", CONTROL, REQ_DUMP_TRAFFIC);
 }
+
+static uint8_t *put_u64(uint8_t *p, uint64_t value) {
+	for(int i = 7; i >= 0; i--) {
+		*p++ = value >> (i * 8);
+	}
+
+	return p;
+}
+
+static uint8_t *put_u32(uint8_t *p, uint32_t value) {
+	for(int i = 3; i >= 0; i--) {
+		*p++ = value >> (i * 8);
+	}
+
+	return p;
+}
+
+static uint8_t *put_u16(uint8_t *p, uint16_t value) {
+	*p++ = value >> 8;
+	*p++ = value;
+	return p;
+}
+
+/* The same classification as "Reachability" in tinc info */
+static node_path_t node_path(const node_t *n) {
+	if(n == myself) {
+		return PATH_MYSELF;
+	} else if(!n->status.reachable) {
+		return PATH_UNREACHABLE;
+	} else if(n->via != n) {
+		return PATH_INDIRECT;
+	} else if(!n->status.validkey) {
+		return PATH_UNKNOWN;
+	} else if(n->minmtu > 0) {
+		return PATH_UDP;
+	} else if(n->nexthop == n) {
+		return PATH_TCP;
+	} else {
+		return PATH_FORWARDED;
+	}
+}
+
+static bool send_node_stats(connection_t *c, const uint8_t *block, size_t len, int records) {
+	return send_request(c, "%d %d %d %d %lu", CONTROL, REQ_DUMP_NODE_STATS, records, NODE_STATS_RECORD_SIZE, (unsigned long)len)
+	       && send_meta(c, block, len);
+}
+
+bool dump_node_stats(connection_t *c) {
+	uint8_t block[NODE_STATS_BLOCK_SIZE];
+	uint8_t *p = block;
+	int records = 0;
+
+	for splay_each(node_t, n, &node_tree) {
+		size_t namelen = strlen(n->name);
+
+		if(NODE_STATS_RECORD_SIZE + 2 + namelen > sizeof(block)) {
+			continue;
+		}
+
+		if((size_t)(p - block) + NODE_STATS_RECORD_SIZE + 2 + namelen > sizeof(block)) {
+			if(!send_node_stats(c, block, p - block, records)) {
+				return false;
+			}
+
+			p = block;
+			records = 0;
+		}
+
+		p = put_u64(p, n->in_packets);
+		p = put_u64(p, n->in_bytes);
+		p = put_u64(p, n->out_packets);
+		p = put_u64(p, n->out_bytes);
+		p = put_u64(p, n->in_dropped);
+		p = put_u64(p, n->out_dropped);
+		p = put_u64(p, n->in_replayed);
+		p = put_u64(p, n->uncompressed_bytes);
+		p = put_u64(p, n->compressed_bytes);
+		p = put_u32(p, n->udp_ping_rtt);
+		p = put_u16(p, n->mtu);
+		*p++ = node_path(n);
+		p = put_u16(p, namelen);
+		memcpy(p, n->name, namelen);
+		p += namelen;
+		records++;
+	}
+
+	if(records && !send_node_stats(c, block, p - block, records)) {
+		return false;
+	}
+
+	return send_request(c, "%d %d", CONTROL, REQ_DUMP_NODE_STATS);
+}
@@ -113,6 +113,11 @@ typedef struct node_t {
 	uint64_t in_bytes;
 	uint64_t out_packets;
 	uint64_t out_bytes;
+	uint64_t in_dropped;                    /* Packets from this node that could not be received */
+	uint64_t out_dropped;                   /* Packets to this node that could not be sent */
+	uint64_t in_replayed;                   /* Packets rejected by replay protection */
+	uint64_t uncompressed_bytes;            /* Outgoing payload before compression */
+	uint64_t compressed_bytes;              /* Outgoing payload after compression */
 
 	struct address_cache_t *address_cache;
 } node_t;
@@ -130,6 +135,7 @@ extern node_t *lookup_node_id(const node_id_t *id);
 extern node_t *lookup_node_udp(const sockaddr_t *sa);
 extern bool dump_nodes(struct connection_t *c);
 extern bool dump_traffic(struct connection_t *c);
+extern bool dump_node_stats(struct connection_t *c);
 extern void update_node_udp(node_t *n, const sockaddr_t *sa);
 
 #endif
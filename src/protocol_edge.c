@@ -162,8 +162,15 @@ bool add_edge_h(connection_t *c, const char *request) {
 		e->options = options;
 
 		if(new_address) {
+			splay_node_t *node = splay_unlink(&edge_address_tree, e);
 			sockaddrfree(&e->address);
 			e->address = address;
+
+			if(!node) {
+				splay_insert(&edge_address_tree, e);
+			} else if(!splay_insert_node(&edge_address_tree, node)) {
+				free(node);
+			}
 		} else {
 			sockaddrfree(&address);
 		}
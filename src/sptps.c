@@ -29,6 +29,7 @@
 #include "xalloc.h"
 
 unsigned int sptps_replaywin = 16;
+static uint32_t sptps_sessions = 0;
 
 /*
    Nonce MUST be exchanged first (done)
@@ -372,6 +373,9 @@ static bool receive_sig(sptps_t *s, const uint8_t *data, uint16_t len) {
 		return error(s, EINVAL, "Failed to set key");
 	}
 
+	// Records sealed on another thread with the old key have to be sealed again.
+	s->outkeygen++;
+
 	return true;
 }
 
@@ -463,7 +467,12 @@ static bool sptps_check_seqno(sptps_t *s, uint32_t seqno, bool update_state) {
 				}
 
 				if(farfuture) {
-					return update_state ? error(s, EIO, "Packet is %d seqs in the future, dropped (%u)\n", seqno - s->inseqno, s->farfuture) : false;
+					if(!update_state) {
+						return false;
+					}
+
+					s->replayed++;
+					return error(s, EIO, "Packet is %d seqs in the future, dropped (%u)\n", seqno - s->inseqno, s->farfuture);
 				}
 
 				// Unless we have seen lots of them, in which case we consider the others lost.
@@ -478,7 +487,12 @@ static bool sptps_check_seqno(sptps_t *s, uint32_t seqno, bool update_state) {
 			} else if(seqno < s->inseqno) {
 				// If the sequence number is farther in the past than the bitmap goes, or if the packet was already received, drop it.
 				if((s->inseqno >= s->replaywin * 8 && seqno < s->inseqno - s->replaywin * 8) || !(s->late[(seqno / 8) % s->replaywin] & (1 << seqno % 8))) {
-					return update_state ? error(s, EIO, "Received late or replayed packet, seqno %d, last received %d\n", seqno, s->inseqno) : false;
+					if(!update_state) {
+						return false;
+					}
+
+					s->replayed++;
+					return error(s, EIO, "Received late or replayed packet, seqno %d, last received %d\n", seqno, s->inseqno);
 				}
 			} else if(update_state) {
 				// We missed some packets. Mark them in the bitmap as being late.
@@ -530,6 +544,35 @@ bool sptps_verify_datagram(sptps_t *s, const void *vdata, size_t len) {
 	return chacha_poly1305_decrypt(s->incipher, seqno, data + 4, len - 4, buffer, &outlen);
 }
 
+// Handle a decrypted datagram record of len bytes, starting with the record type.
+// The buffer must have room for one more byte.
+static bool receive_datagram_record(sptps_t *s, uint8_t *buffer, size_t len) {
+	// Append a NULL byte for safety.
+	buffer[len] = 0;
+
+	const uint8_t *data = buffer;
+	uint8_t type = *(data++);
+	len--;
+
+	if(type < SPTPS_HANDSHAKE) {
+		if(!s->instate) {
+			return error(s, EIO, "Application record received before handshake finished");
+		}
+
+		if(!s->receive_record(s->handle, type, data, len)) {
+			return false;
+		}
+	} else if(type == SPTPS_HANDSHAKE) {
+		if(!receive_handshake(s, data, len)) {
+			return false;
+		}
+	} else {
+		return error(s, EIO, "Invalid record type %d", type);
+	}
+
+	return true;
+}
+
 // Receive incoming data, datagram version.
 static bool sptps_receive_data_datagram(sptps_t *s, const uint8_t *data, size_t len) {
 	if(len < (s->instate ? 21 : 5)) {
@@ -572,34 +615,99 @@ static bool sptps_receive_data_datagram(sptps_t *s, const uint8_t *data, size_t
 		return false;
 	}
 
-	// Append a NULL byte for safety.
-	buffer[outlen] = 0;
+	return receive_datagram_record(s, buffer, outlen);
+}
 
-	data = buffer;
-	len = outlen;
+// Prepare a datagram record for sptps_seal(), assigning it the next sequence number.
+// The buffer must have room for len + SPTPS_DATAGRAM_OVERHEAD bytes.
+bool sptps_seal_begin(sptps_t *s, sptps_datagram_t *d, uint8_t *buffer, uint8_t type, const void *data, uint16_t len) {
+	if(!s->datagram || !s->outstate) {
+		return error(s, EINVAL, "Handshake phase not finished yet");
+	}
 
-	uint8_t type = *(data++);
-	len--;
+	if(type >= SPTPS_HANDSHAKE) {
+		return error(s, EINVAL, "Invalid application record type");
+	}
 
-	if(type < SPTPS_HANDSHAKE) {
-		if(!s->instate) {
-			return error(s, EIO, "Application record received before handshake finished");
-		}
+	d->cipher = *s->outcipher;
+	d->session = s->session;
+	d->keygen = s->outkeygen;
+	d->seqno = s->outseqno++;
+	d->type = type;
+	d->len = len + SPTPS_DATAGRAM_OVERHEAD;
 
-		if(!s->receive_record(s->handle, type, data, len)) {
-			return false;
-		}
-	} else if(type == SPTPS_HANDSHAKE) {
-		if(!receive_handshake(s, data, len)) {
-			return false;
+	uint32_t netseqno = htonl(d->seqno);
+	memcpy(buffer, &netseqno, 4);
+	buffer[4] = type;
+	memcpy(buffer + 5, data, len);
+	return true;
+}
+
+// Encrypt and HMAC a record prepared by sptps_seal_begin().
+void sptps_seal(sptps_datagram_t *d, uint8_t *buffer) {
+	chacha_poly1305_encrypt(&d->cipher, d->seqno, buffer + 4, d->len - 20, buffer + 4, NULL);
+}
+
+// Send a record encrypted by sptps_seal().
+// If the keys changed in the meantime, the record is decrypted with the old key and encrypted again with the new one.
+bool sptps_seal_finish(sptps_t *s, sptps_datagram_t *d, uint8_t *buffer) {
+	if(d->session != s->session || !s->outstate) {
+		return false;
+	}
+
+	if(d->keygen != s->outkeygen) {
+		size_t len;
+
+		if(!chacha_poly1305_decrypt(&d->cipher, d->seqno, buffer + 4, d->len - 4, buffer + 4, &len)) {
+			return error(s, EIO, "Failed to reseal packet");
 		}
-	} else {
-		return error(s, EIO, "Invalid record type %d", type);
+
+		chacha_poly1305_encrypt(s->outcipher, d->seqno, buffer + 4, len, buffer + 4, NULL);
+	}
+
+	return s->send_data(s->handle, d->type, buffer, d->len);
+}
+
+// Prepare a received datagram of len bytes for sptps_open().
+// Returns false if it has to be handled by sptps_receive_data() instead.
+bool sptps_open_begin(sptps_t *s, sptps_datagram_t *d, const uint8_t *buffer, size_t len) {
+	if(!s->datagram || !s->instate || len < 21) {
+		return false;
 	}
 
+	uint32_t seqno;
+	memcpy(&seqno, buffer, 4);
+
+	d->cipher = *s->incipher;
+	d->session = s->session;
+	d->seqno = ntohl(seqno);
+	d->ok = false;
+	d->len = len;
 	return true;
 }
 
+// Check the HMAC of a datagram prepared by sptps_open_begin() and decrypt it in place.
+void sptps_open(sptps_datagram_t *d, uint8_t *buffer) {
+	d->ok = chacha_poly1305_decrypt(&d->cipher, d->seqno, buffer + 4, d->len - 4, buffer + 4, &d->len);
+}
+
+// Apply replay protection to a datagram decrypted by sptps_open(), and handle the record it contains.
+bool sptps_open_finish(sptps_t *s, const sptps_datagram_t *d, uint8_t *buffer) {
+	if(d->session != s->session || !s->instate) {
+		return error(s, EIO, "Session restarted while decrypting packet");
+	}
+
+	if(!d->ok) {
+		return error(s, EIO, "Failed to decrypt and verify packet");
+	}
+
+	if(!sptps_check_seqno(s, d->seqno, true)) {
+		return false;
+	}
+
+	return receive_datagram_record(s, buffer + 4, d->len);
+}
+
 // Receive incoming data. Check if it contains a complete record, if so, handle it.
 size_t sptps_receive_data(sptps_t *s, const void *vdata, size_t len) {
 	const uint8_t *data = vdata;
@@ -709,6 +817,7 @@ bool sptps_start(sptps_t *s, void *handle, bool initiator, bool datagram, ecdsa_
 	// Initialise struct sptps
 	memset(s, 0, sizeof(*s));
 
+	s->session = ++sptps_sessions;
 	s->handle = handle;
 	s->initiator = initiator;
 	s->datagram = datagram;
@@ -68,6 +68,7 @@ typedef union sptps_key_t {
 STATIC_ASSERT(sizeof(sptps_key_t) == 128, "sptps_key_t has invalid size");
 
 typedef struct sptps {
+	uint32_t session;
 	bool initiator;
 	bool datagram;
 	sptps_state_t state;
@@ -82,11 +83,13 @@ typedef struct sptps {
 	uint32_t received;
 	unsigned int replaywin;
 	unsigned int farfuture;
+	unsigned int replayed;
 	uint8_t *late;
 
 	bool outstate;
 	chacha_poly1305_ctx_t *outcipher;
 	uint32_t outseqno;
+	uint32_t outkeygen;
 
 	ecdsa_t *mykey;
 	ecdsa_t *hiskey;
@@ -103,6 +106,17 @@ typedef struct sptps {
 	receive_record_t receive_record;
 } sptps_t;
 
+// A datagram record that is encrypted or decrypted outside of its session, for example on another thread.
+typedef struct sptps_datagram_t {
+	chacha_poly1305_ctx_t cipher;
+	uint32_t session;
+	uint32_t keygen;
+	uint32_t seqno;
+	uint8_t type;
+	bool ok;
+	size_t len;
+} sptps_datagram_t;
+
 extern unsigned int sptps_replaywin;
 extern void sptps_log_quiet(sptps_t *s, int s_errno, const char *format, va_list ap) ATTR_FORMAT(printf, 3, 0);
 extern void sptps_log_stderr(sptps_t *s, int s_errno, const char *format, va_list ap) ATTR_FORMAT(printf, 3, 0);
@@ -114,4 +128,12 @@ extern size_t sptps_receive_data(sptps_t *s, const void *data, size_t len);
 extern bool sptps_force_kex(sptps_t *s);
 extern bool sptps_verify_datagram(sptps_t *s, const void *data, size_t len);
 
+// Only sptps_seal() and sptps_open() may run concurrently with other calls on the same session.
+extern bool sptps_seal_begin(sptps_t *s, sptps_datagram_t *d, uint8_t *buffer, uint8_t type, const void *data, uint16_t len);
+extern void sptps_seal(sptps_datagram_t *d, uint8_t *buffer);
+extern bool sptps_seal_finish(sptps_t *s, sptps_datagram_t *d, uint8_t *buffer);
+extern bool sptps_open_begin(sptps_t *s, sptps_datagram_t *d, const uint8_t *buffer, size_t len);
+extern void sptps_open(sptps_datagram_t *d, uint8_t *buffer);
+extern bool sptps_open_finish(sptps_t *s, const sptps_datagram_t *d, uint8_t *buffer);
+
 #endif
@@ -27,6 +27,7 @@
 #include "ecdsa.h"
 #include "ecdsagen.h"
 #include "meta.h"
+#include "names.h"
 #include "protocol.h"
 #include "sptps.h"
 #include "random.h"
@@ -64,10 +65,31 @@ static bool receive_record(void *handle, uint8_t type, const void *data, uint16_
 	return true;
 }
 
+// Largest record sptps_send_record() accepts, and the most that fits in one
+// datagram together with the record header and authentication tag
+#define MAX_RECORD_SIZE 65535
+#define MAX_RECORD_SIZES 16
+#define MAX_RESULTS 64
+
+// Column at which human-readable results end
+#define RESULT_WIDTH 72
+
+#if defined(DISABLE_LEGACY)
+#define CRYPTO_BACKEND "nolegacy"
+#elif defined(HAVE_OPENSSL)
+#define CRYPTO_BACKEND "openssl"
+#elif defined(HAVE_LIBGCRYPT)
+#define CRYPTO_BACKEND "gcrypt"
+#else
+#define CRYPTO_BACKEND "unknown"
+#endif
+
+static uint8_t recvbuf[MAX_RECORD_SIZE + 64];
+
 static void receive_data(sptps_t *sptps) {
-	uint8_t buf[4096], *bufp = buf;
+	uint8_t *bufp = recvbuf;
 	int fd = *(int *)sptps->handle;
-	size_t len = recv(fd, buf, sizeof(buf), 0);
+	size_t len = recv(fd, recvbuf, sizeof(recvbuf), 0);
 
 	while(len) {
 		size_t done = sptps_receive_data(sptps, bufp, len);
@@ -105,12 +127,153 @@ static bool clock_countto(double seconds) {
 	return false;
 }
 
-static int run_benchmark(int argc, char *argv[]) {
+typedef struct result_t {
+	const char *name;
+	const char *unit;
+	uint16_t record_size;
+	double value;
+} result_t;
+
+static result_t results[MAX_RESULTS];
+static size_t result_count;
+static int label_width;
+static double duration = 10;
+static uint16_t record_sizes[MAX_RECORD_SIZES] = {1451};
+static size_t record_size_count;
+static bool json;
+
+static void begin(const char *label) {
+	label_width = fprintf(stderr, "%s for %lg seconds: ", label, duration);
+}
+
+// Remember a result for JSON output, and print it in human-readable form
+// after the label passed to begin().
+static void report(const char *name, const char *unit, uint16_t record_size, double value) {
+	if(result_count < MAX_RESULTS) {
+		results[result_count++] = (result_t) {
+			name, unit, record_size, value
+		};
+	}
+
+	const char *prefix = "";
+	double scaled = value;
+
+	if(!strcmp(unit, "bit/s")) {
+		if(value > 1e9) {
+			prefix = "G";
+			scaled /= 1e9;
+		} else if(value > 1e6) {
+			prefix = "M";
+			scaled /= 1e6;
+		} else if(value > 1e3) {
+			prefix = "k";
+			scaled /= 1e3;
+		}
+	}
+
+	int width = RESULT_WIDTH - label_width - (int)strlen(prefix) - (int)strlen(unit) - 1;
+	fprintf(stderr, "%*.2lf %s%s\n", width > 0 ? width : 0, scaled, prefix, unit);
+}
+
+static void print_json(void) {
+	printf("{\n");
+	printf("  \"crypto\": \"%s\",\n", CRYPTO_BACKEND);
+	printf("  \"duration\": %lg,\n", duration);
+	printf("  \"results\": [");
+
+	for(size_t i = 0; i < result_count; i++) {
+		const result_t *r = &results[i];
+		printf("%s\n    {\"name\": \"%s\", ", i ? "," : "", r->name);
+
+		if(r->record_size) {
+			printf("\"record_size\": %u, ", r->record_size);
+		}
+
+		printf("\"unit\": \"%s\", \"value\": %.2lf}", r->unit, r->value);
+	}
+
+	printf("\n  ]\n}\n");
+	fflush(stdout);
+}
+
+static void handshake(sptps_t *sptps1, sptps_t *sptps2, int fd[2], bool datagram, ecdsa_t *key1, ecdsa_t *key2) {
+	struct pollfd pfd[2] = {{fd[0], POLLIN, 0}, {fd[1], POLLIN, 0}};
+
+	sptps_start(sptps1, fd + 0, true, datagram, key1, key2, "sptps_speed", 11, send_data, receive_record);
+	sptps_start(sptps2, fd + 1, false, datagram, key2, key1, "sptps_speed", 11, send_data, receive_record);
+
+	while(poll(pfd, 2, 0)) {
+		if(pfd[0].revents) {
+			receive_data(sptps1);
+		}
+
+		if(pfd[1].revents) {
+			receive_data(sptps2);
+		}
+	}
+}
+
+// Measure SPTPS authentication and transmission of records of all requested sizes,
+// either over a stream (like meta connections) or datagrams (like VPN packets).
+static int benchmark_sptps(bool datagram, ecdsa_t *key1, ecdsa_t *key2, const uint8_t *data) {
+	const char *proto = datagram ? "UDP" : "TCP";
+	char label[64];
+	sptps_t sptps1, sptps2;
+	int fd[2];
+
+	if(socketpair(AF_UNIX, datagram ? SOCK_DGRAM : SOCK_STREAM, 0, fd)) {
+		fprintf(stderr, "Could not create a UNIX socket pair: %s\n", sockstrerror(sockerrno));
+		return 1;
+	}
+
+	// Authentication phase
+
+	snprintf(label, sizeof(label), "SPTPS/%s authenticate", proto);
+	begin(label);
+
+	for(clock_start(); clock_countto(duration);) {
+		handshake(&sptps1, &sptps2, fd, datagram, key1, key2);
+		sptps_stop(&sptps1);
+		sptps_stop(&sptps2);
+	}
+
+	report(datagram ? "sptps_udp_authenticate" : "sptps_tcp_authenticate", "op/s", 0, rate * 2);
+
+	// Data
+
+	handshake(&sptps1, &sptps2, fd, datagram, key1, key2);
+
+	for(size_t i = 0; i < record_size_count; i++) {
+		uint16_t size = record_sizes[i];
+
+		snprintf(label, sizeof(label), "SPTPS/%s transmit %u byte records", proto, size);
+		begin(label);
+
+		for(clock_start(); clock_countto(duration);) {
+			if(!sptps_send_record(&sptps1, 0, data, size)) {
+				abort();
+			}
+
+			receive_data(&sptps2);
+		}
+
+		report(datagram ? "sptps_udp_transmit" : "sptps_tcp_transmit", "bit/s", size, rate * 2 * size * 8);
+	}
+
+	sptps_stop(&sptps1);
+	sptps_stop(&sptps2);
+
+	close(fd[0]);
+	close(fd[1]);
+
+	return 0;
+}
+
+static int run_benchmark(void) {
 	ecdsa_t *key1, *key2;
 	ecdh_t *ecdh1, *ecdh2;
-	sptps_t sptps1, sptps2;
-	uint8_t buf1[4096], buf2[4096], buf3[4096];
-	double duration = argc > 1 ? atof(argv[1]) : 10;
+	static uint8_t buf1[MAX_RECORD_SIZE];
+	uint8_t buf2[4096], buf3[4096];
 
 	randomize(buf1, sizeof(buf1));
 	randomize(buf2, sizeof(buf2));
@@ -118,29 +281,29 @@ static int run_benchmark(int argc, char *argv[]) {
 
 	// Key generation
 
-	fprintf(stderr, "Generating keys for %lg seconds: ", duration);
+	begin("Generating keys");
 
 	for(clock_start(); clock_countto(duration);) {
 		ecdsa_free(ecdsa_generate());
 	}
 
-	fprintf(stderr, "%17.2lf op/s\n", rate);
+	report("keygen", "op/s", 0, rate);
 
 	key1 = ecdsa_generate();
 	key2 = ecdsa_generate();
 
 	// Ed25519 signatures
 
-	fprintf(stderr, "Ed25519 sign for %lg seconds: ", duration);
+	begin("Ed25519 sign");
 
 	for(clock_start(); clock_countto(duration);)
 		if(!ecdsa_sign(key1, buf1, 256, buf2)) {
 			return 1;
 		}
 
-	fprintf(stderr, "%20.2lf op/s\n", rate);
+	report("ed25519_sign", "op/s", 0, rate);
 
-	fprintf(stderr, "Ed25519 verify for %lg seconds: ", duration);
+	begin("Ed25519 verify");
 
 	for(clock_start(); clock_countto(duration);)
 		if(!ecdsa_verify(key1, buf1, 256, buf2)) {
@@ -148,10 +311,10 @@ static int run_benchmark(int argc, char *argv[]) {
 			return 1;
 		}
 
-	fprintf(stderr, "%18.2lf op/s\n", rate);
+	report("ed25519_verify", "op/s", 0, rate);
 
 	ecdh1 = ecdh_generate_public(buf1);
-	fprintf(stderr, "ECDH for %lg seconds: ", duration);
+	begin("ECDH");
 
 	for(clock_start(); clock_countto(duration);) {
 		ecdh2 = ecdh_generate_public(buf2);
@@ -165,165 +328,148 @@ static int run_benchmark(int argc, char *argv[]) {
 		}
 	}
 
-	fprintf(stderr, "%28.2lf op/s\n", rate);
+	report("ecdh", "op/s", 0, rate);
 	ecdh_free(ecdh1);
 
-	// SPTPS authentication phase
+	// SPTPS over a stream and over datagrams
 
-	int fd[2];
-
-	if(socketpair(AF_UNIX, SOCK_STREAM, 0, fd)) {
-		fprintf(stderr, "Could not create a UNIX socket pair: %s\n", sockstrerror(sockerrno));
+	if(benchmark_sptps(false, key1, key2, buf1) || benchmark_sptps(true, key1, key2, buf1)) {
 		return 1;
 	}
 
-	struct pollfd pfd[2] = {{fd[0], POLLIN, 0}, {fd[1], POLLIN, 0}};
-
-	fprintf(stderr, "SPTPS/TCP authenticate for %lg seconds: ", duration);
-
-	for(clock_start(); clock_countto(duration);) {
-		sptps_start(&sptps1, fd + 0, true, false, key1, key2, "sptps_speed", 11, send_data, receive_record);
-		sptps_start(&sptps2, fd + 1, false, false, key2, key1, "sptps_speed", 11, send_data, receive_record);
-
-		while(poll(pfd, 2, 0)) {
-			if(pfd[0].revents) {
-				receive_data(&sptps1);
-			}
+	// Clean up
 
-			if(pfd[1].revents) {
-				receive_data(&sptps2);
-			}
-		}
+	ecdsa_free(key1);
+	ecdsa_free(key2);
 
-		sptps_stop(&sptps1);
-		sptps_stop(&sptps2);
+	if(json) {
+		print_json();
 	}
 
-	fprintf(stderr, "%10.2lf op/s\n", rate * 2);
+	return 0;
+}
 
-	// SPTPS data
+typedef enum option_t {
+	OPT_BAD_OPTION  = '?',
+	OPT_LONG_OPTION =  0,
+
+	// Short options
+	OPT_JSON        = 'j',
+	OPT_RECORD_SIZE = 's',
+
+	// Long options
+	OPT_HELP        = 255,
+} option_t;
+
+static struct option const long_options[] = {
+	{"json",        no_argument,       NULL, OPT_JSON},
+	{"record-size", required_argument, NULL, OPT_RECORD_SIZE},
+	{"help",        no_argument,       NULL, OPT_HELP},
+	{NULL,          0,                 NULL, 0}
+};
+
+static void usage(void) {
+	fprintf(stderr,
+	        "Usage: %s [options] [seconds]\n"
+	        "\n"
+	        "Run each benchmark for the given number of seconds of CPU time (default 10).\n"
+	        "\n"
+	        "Valid options are:\n"
+	        "  -j, --json              Also write results to stdout as JSON.\n"
+	        "  -s, --record-size SIZE  Measure SPTPS transmit with records of SIZE bytes.\n"
+	        "                          Can be a comma-separated list, or given several times.\n"
+	        "                          The default is 1451 (a full VPN packet).\n"
+	        "\n"
+	        "Report bugs to tinc@tinc-vpn.org.\n",
+	        program_name);
+}
 
-	sptps_start(&sptps1, fd + 0, true, false, key1, key2, "sptps_speed", 11, send_data, receive_record);
-	sptps_start(&sptps2, fd + 1, false, false, key2, key1, "sptps_speed", 11, send_data, receive_record);
+static bool parse_record_sizes(const char *arg) {
+	while(*arg) {
+		char *next;
+		unsigned long size = strtoul(arg, &next, 10);
 
-	while(poll(pfd, 2, 0)) {
-		if(pfd[0].revents) {
-			receive_data(&sptps1);
+		if(next == arg || (*next && *next != ',') || !size || size > MAX_RECORD_SIZE) {
+			fprintf(stderr, "Invalid record size: %s\n", arg);
+			return false;
 		}
 
-		if(pfd[1].revents) {
-			receive_data(&sptps2);
+		if(record_size_count >= MAX_RECORD_SIZES) {
+			fprintf(stderr, "At most %d record sizes are supported.\n", MAX_RECORD_SIZES);
+			return false;
 		}
-	}
 
-	fprintf(stderr, "SPTPS/TCP transmit for %lg seconds: ", duration);
-
-	for(clock_start(); clock_countto(duration);) {
-		if(!sptps_send_record(&sptps1, 0, buf1, 1451)) {
-			abort();
-		}
-
-		receive_data(&sptps2);
+		record_sizes[record_size_count++] = (uint16_t)size;
+		arg = *next ? next + 1 : next;
 	}
 
-	rate *= 2 * 1451 * 8;
-
-	if(rate > 1e9) {
-		fprintf(stderr, "%14.2lf Gbit/s\n", rate / 1e9);
-	} else if(rate > 1e6) {
-		fprintf(stderr, "%14.2lf Mbit/s\n", rate / 1e6);
-	} else if(rate > 1e3) {
-		fprintf(stderr, "%14.2lf kbit/s\n", rate / 1e3);
-	}
-
-	sptps_stop(&sptps1);
-	sptps_stop(&sptps2);
-
-	// SPTPS datagram authentication phase
+	return true;
+}
 
-	close(fd[0]);
-	close(fd[1]);
+static int parse_options(int argc, char *argv[]) {
+	int r;
+	int option_index = 0;
 
-	if(socketpair(AF_UNIX, SOCK_DGRAM, 0, fd)) {
-		fprintf(stderr, "Could not create a UNIX socket pair: %s\n", sockstrerror(sockerrno));
-		return 1;
-	}
+	while((r = getopt_long(argc, argv, "js:", long_options, &option_index)) != EOF) {
+		switch((option_t) r) {
+		case OPT_LONG_OPTION:
+			break;
 
-	fprintf(stderr, "SPTPS/UDP authenticate for %lg seconds: ", duration);
+		case OPT_BAD_OPTION:
+			usage();
+			return 1;
 
-	for(clock_start(); clock_countto(duration);) {
-		sptps_start(&sptps1, fd + 0, true, true, key1, key2, "sptps_speed", 11, send_data, receive_record);
-		sptps_start(&sptps2, fd + 1, false, true, key2, key1, "sptps_speed", 11, send_data, receive_record);
+		case OPT_JSON:
+			json = true;
+			break;
 
-		while(poll(pfd, 2, 0)) {
-			if(pfd[0].revents) {
-				receive_data(&sptps1);
+		case OPT_RECORD_SIZE:
+			if(!parse_record_sizes(optarg)) {
+				usage();
+				return 1;
 			}
 
-			if(pfd[1].revents) {
-				receive_data(&sptps2);
-			}
-		}
-
-		sptps_stop(&sptps1);
-		sptps_stop(&sptps2);
-	}
-
-	fprintf(stderr, "%10.2lf op/s\n", rate * 2);
+			break;
 
-	// SPTPS datagram data
+		case OPT_HELP:
+			usage();
+			return 0;
 
-	sptps_start(&sptps1, fd + 0, true, true, key1, key2, "sptps_speed", 11, send_data, receive_record);
-	sptps_start(&sptps2, fd + 1, false, true, key2, key1, "sptps_speed", 11, send_data, receive_record);
-
-	while(poll(pfd, 2, 0)) {
-		if(pfd[0].revents) {
-			receive_data(&sptps1);
-		}
-
-		if(pfd[1].revents) {
-			receive_data(&sptps2);
+		default:
+			break;
 		}
 	}
 
-	fprintf(stderr, "SPTPS/UDP transmit for %lg seconds: ", duration);
-
-	for(clock_start(); clock_countto(duration);) {
-		if(!sptps_send_record(&sptps1, 0, buf1, 1451)) {
-			abort();
-		}
-
-		receive_data(&sptps2);
+	if(argc - optind > 1) {
+		fprintf(stderr, "Wrong number of arguments.\n");
+		usage();
+		return 1;
 	}
 
-	rate *= 2 * 1451 * 8;
+	if(optind < argc) {
+		duration = atof(argv[optind]);
+	}
 
-	if(rate > 1e9) {
-		fprintf(stderr, "%14.2lf Gbit/s\n", rate / 1e9);
-	} else if(rate > 1e6) {
-		fprintf(stderr, "%14.2lf Mbit/s\n", rate / 1e6);
-	} else if(rate > 1e3) {
-		fprintf(stderr, "%14.2lf kbit/s\n", rate / 1e3);
+	if(!record_size_count) {
+		record_size_count = 1;
 	}
 
-	sptps_stop(&sptps1);
-	sptps_stop(&sptps2);
+	return -1;
+}
 
-	// Clean up
+int main(int argc, char *argv[]) {
+	program_name = argv[0];
 
-	close(fd[0]);
-	close(fd[1]);
-	ecdsa_free(key1);
-	ecdsa_free(key2);
+	int result = parse_options(argc, argv);
 
-	return 0;
-}
+	if(result >= 0) {
+		return result;
+	}
 
-int main(int argc, char *argv[]) {
 	random_init();
 	crypto_init();
 
-	int result = run_benchmark(argc, argv);
+	result = run_benchmark();
 
 	random_exit();
 
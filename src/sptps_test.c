@@ -97,6 +97,11 @@ static bool receive_record(void *handle, uint8_t type, const void *data, uint16_
 		fprintf(stderr, "Received type %d record of %u bytes:\n", type, len);
 	}
 
+	if(type == SPTPS_HANDSHAKE) {
+		fprintf(stderr, "Handshake completed\n");
+		return true;
+	}
+
 	if(writeonly) {
 		return true;
 	}
@@ -166,7 +171,7 @@ static void usage(void) {
 #endif
 	        "  -w, --writeonly         Only send data from stdin to the socket.\n"
 	        "  -L, --packet-loss RATE  Fake packet loss of RATE percent.\n"
-	        "  -R, --replay-window N   Set replay window to N bytes.\n"
+	        "  -W, --replay-window N   Set replay window to N bytes.\n"
 	        "  -s, --special           Enable special handling of lines starting with #, ^ and $.\n"
 	        "  -v, --verbose           Display debug messages.\n"
 	        "  -4                      Use IPv4.\n"
@@ -716,6 +721,9 @@ static int run_test(int argc, char *argv[]) {
 						ecdsa_free(hiskey);
 						return 1;
 					}
+
+					// Invalid datagrams are dropped, like tincd does
+					break;
 				}
 
 				bufp += done;
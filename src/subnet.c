@@ -30,6 +30,7 @@
 #include "node.h"
 #include "script.h"
 #include "subnet.h"
+#include "subnet_trie.h"
 #include "xalloc.h"
 #include "sandbox.h"
 
@@ -104,41 +105,124 @@ static uint32_t hash_function_mac_t(const mac_t *p) {
 	return hash;
 }
 
-hash_define(ipv4_t, SUBNET_HASH_SIZE)
-hash_define(ipv6_t, SUBNET_HASH_SIZE)
-hash_define(mac_t, SUBNET_HASH_SIZE)
+hash_define(ipv4_t)
+hash_define(ipv6_t)
+hash_define(mac_t)
 
 hash_new(ipv4_t, ipv4_cache);
 hash_new(ipv6_t, ipv6_cache);
 hash_new(mac_t, mac_cache);
 
+static subnet_cache_stats_t cache_stats[SUBNET_IPV6 + 1];
+
+/* Longest prefix match indexes of all IPv4 and IPv6 subnets in subnet_tree */
+
+static subnet_trie_t ipv4_trie = {.bits = 32};
+static subnet_trie_t ipv6_trie = {.bits = 128};
+
 
 void subnet_cache_flush_table(subnet_type_t stype) {
 	// NOTE: a subnet type of SUBNET_TYPES can be used to clear all hash tables
 
 	if(stype != SUBNET_IPV6) { // ipv4
 		hash_clear(ipv4_t, &ipv4_cache);
+		cache_stats[SUBNET_IPV4].flushes++;
 	}
 
 	if(stype != SUBNET_IPV4) { // ipv6
 		hash_clear(ipv6_t, &ipv6_cache);
+		cache_stats[SUBNET_IPV6].flushes++;
 	}
 
 	hash_clear(mac_t, &mac_cache);
+	cache_stats[SUBNET_MAC].flushes++;
+}
+
+static uint32_t cache_size(subnet_type_t type) {
+	switch(type) {
+	case SUBNET_MAC:
+		return mac_cache.n;
+
+	case SUBNET_IPV4:
+		return ipv4_cache.n;
+
+	case SUBNET_IPV6:
+		return ipv6_cache.n;
+	}
+
+	return 0;
+}
+
+static bool cache_used(subnet_type_t type, uint32_t i) {
+	switch(type) {
+	case SUBNET_MAC:
+		return mac_cache.values[i];
+
+	case SUBNET_IPV4:
+		return ipv4_cache.values[i];
+
+	case SUBNET_IPV6:
+		return ipv6_cache.values[i];
+	}
+
+	return false;
+}
+
+static uint32_t cache_entries(subnet_type_t type) {
+	uint32_t entries = 0;
+
+	for(uint32_t i = 0; i < cache_size(type); i++) {
+		entries += cache_used(type, i);
+	}
+
+	return entries;
+}
+
+void subnet_cache_resize(uint32_t size) {
+	// Round up to a power of two
+	uint32_t n = size ? 1 : 0;
+
+	while(n < size) {
+		n <<= 1;
+	}
+
+	if(n == ipv4_cache.n) {
+		return;
+	}
+
+	// Resizing drops all cached lookups
+	for(subnet_type_t type = SUBNET_MAC; type <= SUBNET_IPV6; type++) {
+		if(cache_entries(type)) {
+			cache_stats[type].flushes++;
+		}
+	}
+
+	hash_resize(ipv4_t, &ipv4_cache, n);
+	hash_resize(ipv6_t, &ipv6_cache, n);
+	hash_resize(mac_t, &mac_cache, n);
+}
+
+const subnet_cache_stats_t *subnet_cache_stats(subnet_type_t type) {
+	return &cache_stats[type];
 }
 
 /* Initialising trees */
 
 void init_subnets(void) {
 	hash_seed = prng(UINT32_MAX);
+	memset(cache_stats, 0, sizeof(cache_stats));
 
-	// tables need to be cleared on startup
-	subnet_cache_flush_tables();
+	// freshly allocated tables are empty, so they don't need to be flushed
+	subnet_cache_resize(SUBNET_HASH_SIZE);
 }
 
 void exit_subnets(void) {
+	subnet_trie_clear(&ipv4_trie);
+	subnet_trie_clear(&ipv6_trie);
 	splay_empty_tree(&subnet_tree);
-	subnet_cache_flush_tables();
+	hash_free(ipv4_t, &ipv4_cache);
+	hash_free(ipv6_t, &ipv6_cache);
+	hash_free(mac_t, &mac_cache);
 }
 
 void init_subnet_tree(splay_tree_t *tree) {
@@ -158,43 +242,142 @@ void free_subnet(subnet_t *subnet) {
 
 void subnet_cache_flush_tables(void) {
 	// flushes all the tables
-	hash_clear(ipv4_t, &ipv4_cache);
-	hash_clear(ipv6_t, &ipv6_cache);
-	hash_clear(mac_t, &mac_cache);
+	subnet_cache_flush_table(SUBNET_MAC);
 }
 
-static void subnet_cache_flush(subnet_t *subnet) {
+/* Remove cached lookups of addresses inside the subnet, leave the rest alone */
+
+static void subnet_cache_invalidate(const subnet_t *subnet) {
+	subnet_cache_stats_t *stats = &cache_stats[subnet->type];
+
 	switch(subnet->type) {
-	case SUBNET_IPV4:
-		if(subnet->net.ipv4.prefixlength == 32) {
-			hash_delete(ipv4_t, &ipv4_cache, &subnet->net.ipv4.address);
+	case SUBNET_IPV4: {
+		const subnet_ipv4_t *net = &subnet->net.ipv4;
+
+		if(net->prefixlength == 32) {
+			stats->invalidations += hash_delete(ipv4_t, &ipv4_cache, &net->address);
 			return;
 		}
 
-		break;
+		for(uint32_t i = 0; i < ipv4_cache.n; i++) {
+			if(ipv4_cache.values[i] && !maskcmp(&ipv4_cache.keys[i], &net->address, net->prefixlength)) {
+				ipv4_cache.values[i] = NULL;
+				stats->invalidations++;
+			}
+		}
 
-	case SUBNET_IPV6:
-		if(subnet->net.ipv4.prefixlength == 128) {
-			hash_delete(ipv6_t, &ipv6_cache, &subnet->net.ipv6.address);
+		return;
+	}
+
+	case SUBNET_IPV6: {
+		const subnet_ipv6_t *net = &subnet->net.ipv6;
+
+		if(net->prefixlength == 128) {
+			stats->invalidations += hash_delete(ipv6_t, &ipv6_cache, &net->address);
 			return;
 		}
 
-		break;
+		for(uint32_t i = 0; i < ipv6_cache.n; i++) {
+			if(ipv6_cache.values[i] && !maskcmp(&ipv6_cache.keys[i], &net->address, net->prefixlength)) {
+				ipv6_cache.values[i] = NULL;
+				stats->invalidations++;
+			}
+		}
+
+		return;
+	}
 
 	case SUBNET_MAC:
-		hash_delete(mac_t, &mac_cache, &subnet->net.mac.address);
+		stats->invalidations += hash_delete(mac_t, &mac_cache, &subnet->net.mac.address);
 		return;
 	}
+}
 
-	subnet_cache_flush_table(subnet->type);
+static void subnet_cache_flush(const subnet_t *subnet) {
+	cache_stats[subnet->type].flushes++;
+	subnet_cache_invalidate(subnet);
+}
+
+/* Remove cached lookups that can change when the owner becomes (un)reachable */
+
+void subnet_cache_flush_node(const node_t *owner) {
+	bool ipv4 = false;
+	bool ipv6 = false;
+	bool flushed[SUBNET_IPV6 + 1] = {false};
+
+	// Host subnets and MAC addresses can be removed one by one,
+	// the other ones are handled in a single pass over the cache.
+
+	for splay_each(subnet_t, subnet, &owner->subnet_tree) {
+		if(subnet->type == SUBNET_IPV4 && subnet->net.ipv4.prefixlength != 32) {
+			ipv4 = true;
+		} else if(subnet->type == SUBNET_IPV6 && subnet->net.ipv6.prefixlength != 128) {
+			ipv6 = true;
+		} else {
+			subnet_cache_invalidate(subnet);
+		}
+
+		flushed[subnet->type] = true;
+	}
+
+	// Count one flush per table, no matter how many subnets the owner has
+	for(subnet_type_t type = SUBNET_MAC; type <= SUBNET_IPV6; type++) {
+		cache_stats[type].flushes += flushed[type];
+	}
+
+	for(uint32_t i = 0; ipv4 && i < ipv4_cache.n; i++) {
+		if(ipv4_cache.values[i] && subnet_trie_owns(&ipv4_trie, &ipv4_cache.keys[i], owner)) {
+			ipv4_cache.values[i] = NULL;
+			cache_stats[SUBNET_IPV4].invalidations++;
+		}
+	}
+
+	for(uint32_t i = 0; ipv6 && i < ipv6_cache.n; i++) {
+		if(ipv6_cache.values[i] && subnet_trie_owns(&ipv6_trie, &ipv6_cache.keys[i], owner)) {
+			ipv6_cache.values[i] = NULL;
+			cache_stats[SUBNET_IPV6].invalidations++;
+		}
+	}
 }
 
 /* Adding and removing subnets */
 
+static void subnet_index_add(subnet_t *subnet) {
+	switch(subnet->type) {
+	case SUBNET_IPV4:
+		subnet_trie_insert(&ipv4_trie, &subnet->net.ipv4.address, subnet->net.ipv4.prefixlength, subnet);
+		break;
+
+	case SUBNET_IPV6:
+		subnet_trie_insert(&ipv6_trie, &subnet->net.ipv6.address, subnet->net.ipv6.prefixlength, subnet);
+		break;
+
+	case SUBNET_MAC:
+		break;
+	}
+}
+
+static void subnet_index_del(const subnet_t *subnet) {
+	switch(subnet->type) {
+	case SUBNET_IPV4:
+		subnet_trie_delete(&ipv4_trie, &subnet->net.ipv4.address, subnet->net.ipv4.prefixlength, subnet);
+		break;
+
+	case SUBNET_IPV6:
+		subnet_trie_delete(&ipv6_trie, &subnet->net.ipv6.address, subnet->net.ipv6.prefixlength, subnet);
+		break;
+
+	case SUBNET_MAC:
+		break;
+	}
+}
+
 void subnet_add(node_t *n, subnet_t *subnet) {
 	subnet->owner = n;
 
-	splay_insert(&subnet_tree, subnet);
+	if(splay_insert(&subnet_tree, subnet)) {
+		subnet_index_add(subnet);
+	}
 
 	if(n) {
 		splay_insert(&n->subnet_tree, subnet);
@@ -208,9 +391,10 @@ void subnet_del(node_t *n, subnet_t *subnet) {
 		splay_delete(&n->subnet_tree, subnet);
 	}
 
-	splay_delete(&subnet_tree, subnet);
-
 	subnet_cache_flush(subnet);
+
+	subnet_index_del(subnet);
+	splay_delete(&subnet_tree, subnet);
 }
 
 /* Subnet lookup routines */
@@ -225,9 +409,12 @@ subnet_t *lookup_subnet_mac(const node_t *owner, const mac_t *address) {
 	// Check if this address is cached
 
 	if((r = hash_search(mac_t, &mac_cache, address))) {
+		cache_stats[SUBNET_MAC].hits++;
 		return r;
 	}
 
+	cache_stats[SUBNET_MAC].misses++;
+
 	// Search all subnets for a matching one
 
 	for splay_each(subnet_t, p, owner ? &owner->subnet_tree : &subnet_tree) {
@@ -259,24 +446,15 @@ subnet_t *lookup_subnet_ipv4(const ipv4_t *address) {
 	// Check if this address is cached
 
 	if((r = hash_search(ipv4_t, &ipv4_cache, address))) {
+		cache_stats[SUBNET_IPV4].hits++;
 		return r;
 	}
 
-	// Search all subnets for a matching one
-
-	for splay_each(subnet_t, p, &subnet_tree) {
-		if(!p || p->type != SUBNET_IPV4) {
-			continue;
-		}
+	cache_stats[SUBNET_IPV4].misses++;
 
-		if(!maskcmp(address, &p->net.ipv4.address, p->net.ipv4.prefixlength)) {
-			r = p;
+	// Find the longest matching prefix
 
-			if(!p->owner || p->owner->status.reachable) {
-				break;
-			}
-		}
-	}
+	r = subnet_trie_lookup(&ipv4_trie, address);
 
 	// Cache the result
 
@@ -293,24 +471,15 @@ subnet_t *lookup_subnet_ipv6(const ipv6_t *address) {
 	// Check if this address is cached
 
 	if((r = hash_search(ipv6_t, &ipv6_cache, address))) {
+		cache_stats[SUBNET_IPV6].hits++;
 		return r;
 	}
 
-	// Search all subnets for a matching one
-
-	for splay_each(subnet_t, p, &subnet_tree) {
-		if(!p || p->type != SUBNET_IPV6) {
-			continue;
-		}
+	cache_stats[SUBNET_IPV6].misses++;
 
-		if(!maskcmp(address, &p->net.ipv6.address, p->net.ipv6.prefixlength)) {
-			r = p;
+	// Find the longest matching prefix
 
-			if(!p->owner || p->owner->status.reachable) {
-				break;
-			}
-		}
-	}
+	r = subnet_trie_lookup(&ipv6_trie, address);
 
 	// Cache the result
 
@@ -392,6 +561,18 @@ void subnet_update(node_t *owner, subnet_t *subnet, bool up) {
 	environment_exit(&env);
 }
 
+bool dump_subnet_cache(connection_t *c) {
+	static const char *const names[] = {"mac", "ipv4", "ipv6"};
+	for(subnet_type_t type = SUBNET_MAC; type <= SUBNET_IPV6; type++) {
+		const subnet_cache_stats_t *stats = &cache_stats[type];
+		send_request(c, "%d %d %s %"PRIu32" %"PRIu32" %"PRIu64" %"PRIu64" %"PRIu64" %"PRIu64,
+		             CONTROL, REQ_DUMP_SUBNET_CACHE, names[type], cache_size(type), cache_entries(type),
+		             stats->hits, stats->misses, stats->flushes, stats->invalidations);
+	}
+
+	return send_request(c, "%d %d", CONTROL, REQ_DUMP_SUBNET_CACHE);
+}
+
 bool dump_subnets(connection_t *c) {
 	for splay_each(subnet_t, subnet, &subnet_tree) {
 		char netstr[MAXNETSTR];
@@ -62,6 +62,15 @@ typedef struct subnet_t {
 
 #define MAXNETSTR 64
 
+#define MAX_SUBNET_CACHE_SIZE 0x1000000
+
+typedef struct subnet_cache_stats_t {
+	uint64_t hits;
+	uint64_t misses;
+	uint64_t flushes;       /* number of times the cache was cleared, completely or where a subnet or node changed */
+	uint64_t invalidations; /* number of entries removed because a subnet covering them changed */
+} subnet_cache_stats_t;
+
 extern splay_tree_t subnet_tree;
 
 extern int subnet_compare(const struct subnet_t *a, const struct subnet_t *b);
@@ -85,7 +94,11 @@ extern subnet_t *lookup_subnet_mac(const struct node_t *owner, const mac_t *addr
 extern subnet_t *lookup_subnet_ipv4(const ipv4_t *address);
 extern subnet_t *lookup_subnet_ipv6(const ipv6_t *address);
 extern bool dump_subnets(struct connection_t *c);
+extern bool dump_subnet_cache(struct connection_t *c);
 extern void subnet_cache_flush_tables(void);
 extern void subnet_cache_flush_table(subnet_type_t ipver);
+extern void subnet_cache_flush_node(const struct node_t *owner);
+extern void subnet_cache_resize(uint32_t size);
+extern const subnet_cache_stats_t *subnet_cache_stats(subnet_type_t type);
 
 #endif
@@ -0,0 +1,255 @@
+/*
+    subnet_trie.c -- longest prefix match index for subnets
+    Copyright (C) 2026 Guus Sliepen <guus@tinc-vpn.org>
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License along
+    with this program; if not, write to the Free Software Foundation, Inc.,
+    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+*/
+
+#include "system.h"
+
+#include "net.h"
+#include "node.h"
+#include "subnet.h"
+#include "subnet_trie.h"
+#include "xalloc.h"
+
+/* This is a path-compressed binary trie. Every node either holds subnets, or has
+   two children, so there are less than two nodes per distinct prefix. A node's
+   prefix always starts with the prefix of its parent, and the bit right after the
+   parent's prefix selects which child it is. Looking up an address therefore visits
+   at most one node per bit of the address, no matter how many subnets there are. */
+
+static int get_bit(const uint8_t *address, int bit) {
+	return (address[bit / 8] >> (7 - bit % 8)) & 1;
+}
+
+/* Return the number of leading bits a and b have in common, up to max.
+   The first from bits are assumed to be equal already. */
+static int common_bits(const uint8_t *a, const uint8_t *b, int from, int max) {
+	for(int i = from / 8 * 8; i < max; i += 8) {
+		uint8_t diff = a[i / 8] ^ b[i / 8];
+
+		if(diff) {
+			while(!(diff & 0x80)) {
+				diff <<= 1;
+				i++;
+			}
+
+			return i < max ? i : max;
+		}
+	}
+
+	return max;
+}
+
+static subnet_trie_node_t *new_trie_node(subnet_trie_t *trie, const uint8_t *prefix, int prefixlength) {
+	subnet_trie_node_t *node = xzalloc(sizeof(*node));
+	maskcpy(node->prefix, prefix, prefixlength, sizeof(node->prefix));
+	node->prefixlength = prefixlength;
+	trie->nodes++;
+	return node;
+}
+
+static void free_trie_node(subnet_trie_t *trie, subnet_trie_node_t *node) {
+	free(node->subnets);
+	free(node);
+	trie->nodes--;
+}
+
+static void add_to_node(subnet_trie_node_t *node, subnet_t *subnet) {
+	int i = 0;
+
+	while(i < node->count && subnet_compare(node->subnets[i], subnet) < 0) {
+		i++;
+	}
+
+	node->subnets = xrealloc(node->subnets, (node->count + 1) * sizeof(*node->subnets));
+	memmove(node->subnets + i + 1, node->subnets + i, (node->count - i) * sizeof(*node->subnets));
+	node->subnets[i] = subnet;
+	node->count++;
+}
+
+static bool remove_from_node(subnet_trie_node_t *node, const subnet_t *subnet) {
+	for(int i = 0; i < node->count; i++) {
+		if(!subnet_compare(node->subnets[i], subnet)) {
+			node->count--;
+			memmove(node->subnets + i, node->subnets + i + 1, (node->count - i) * sizeof(*node->subnets));
+			return true;
+		}
+	}
+
+	return false;
+}
+
+void subnet_trie_insert(subnet_trie_t *trie, const void *prefix, int prefixlength, subnet_t *subnet) {
+	subnet_trie_node_t **link = &trie->root;
+	int matched = 0;
+
+	while(*link) {
+		subnet_trie_node_t *node = *link;
+		int common = common_bits(node->prefix, prefix, matched, MIN(node->prefixlength, prefixlength));
+
+		if(common < node->prefixlength) {
+			// The new prefix diverges from this node's prefix, or is shorter: insert a node above it
+			subnet_trie_node_t *parent = new_trie_node(trie, prefix, common);
+			parent->child[get_bit(node->prefix, common)] = node;
+			*link = parent;
+
+			if(common == prefixlength) {
+				add_to_node(parent, subnet);
+			} else {
+				subnet_trie_node_t *leaf = new_trie_node(trie, prefix, prefixlength);
+				parent->child[get_bit(prefix, common)] = leaf;
+				add_to_node(leaf, subnet);
+			}
+
+			return;
+		}
+
+		if(node->prefixlength == prefixlength) {
+			add_to_node(node, subnet);
+			return;
+		}
+
+		matched = node->prefixlength;
+		link = &node->child[get_bit(prefix, matched)];
+	}
+
+	*link = new_trie_node(trie, prefix, prefixlength);
+	add_to_node(*link, subnet);
+}
+
+void subnet_trie_delete(subnet_trie_t *trie, const void *prefix, int prefixlength, const subnet_t *subnet) {
+	subnet_trie_node_t **path[SUBNET_TRIE_MAX_BITS + 1];
+	subnet_trie_node_t **link = &trie->root;
+	int depth = 0;
+	int matched = 0;
+
+	while(true) {
+		subnet_trie_node_t *node = *link;
+
+		if(!node || node->prefixlength > prefixlength || common_bits(node->prefix, prefix, matched, node->prefixlength) < node->prefixlength) {
+			return;
+		}
+
+		path[depth++] = link;
+
+		if(node->prefixlength == prefixlength) {
+			break;
+		}
+
+		matched = node->prefixlength;
+		link = &node->child[get_bit(prefix, matched)];
+	}
+
+	if(!remove_from_node(*link, subnet)) {
+		return;
+	}
+
+	// Remove nodes that are no longer needed to keep the trie compressed
+
+	while(depth--) {
+		link = path[depth];
+		subnet_trie_node_t *node = *link;
+
+		if(node->count || (node->child[0] && node->child[1])) {
+			break;
+		}
+
+		*link = node->child[0] ? node->child[0] : node->child[1];
+		free_trie_node(trie, node);
+	}
+}
+
+subnet_t *subnet_trie_lookup(const subnet_trie_t *trie, const void *address) {
+	const subnet_trie_node_t *matches[SUBNET_TRIE_MAX_BITS + 1];
+	int depth = 0;
+	int matched = 0;
+
+	for(const subnet_trie_node_t *node = trie->root; node;) {
+		if(common_bits(node->prefix, address, matched, node->prefixlength) < node->prefixlength) {
+			break;
+		}
+
+		if(node->count) {
+			matches[depth++] = node;
+		}
+
+		matched = node->prefixlength;
+
+		if(matched == trie->bits) {
+			break;
+		}
+
+		node = node->child[get_bit(address, matched)];
+	}
+
+	// Try the longest prefix first, and fall back to shorter ones if its owners are unreachable
+
+	subnet_t *r = NULL;
+
+	while(depth--) {
+		const subnet_trie_node_t *node = matches[depth];
+
+		for(int i = 0; i < node->count; i++) {
+			r = node->subnets[i];
+
+			if(!r->owner || r->owner->status.reachable) {
+				return r;
+			}
+		}
+	}
+
+	return r;
+}
+
+bool subnet_trie_owns(const subnet_trie_t *trie, const void *address, const node_t *owner) {
+	int matched = 0;
+
+	for(const subnet_trie_node_t *node = trie->root; node;) {
+		if(common_bits(node->prefix, address, matched, node->prefixlength) < node->prefixlength) {
+			break;
+		}
+
+		for(int i = 0; i < node->count; i++) {
+			if(node->subnets[i]->owner == owner) {
+				return true;
+			}
+		}
+
+		matched = node->prefixlength;
+
+		if(matched == trie->bits) {
+			break;
+		}
+
+		node = node->child[get_bit(address, matched)];
+	}
+
+	return false;
+}
+
+static void clear_trie_node(subnet_trie_t *trie, subnet_trie_node_t *node) {
+	if(node) {
+		clear_trie_node(trie, node->child[0]);
+		clear_trie_node(trie, node->child[1]);
+		free_trie_node(trie, node);
+	}
+}
+
+void subnet_trie_clear(subnet_trie_t *trie) {
+	clear_trie_node(trie, trie->root);
+	trie->root = NULL;
+}
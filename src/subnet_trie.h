@@ -0,0 +1,56 @@
+#ifndef TINC_SUBNET_TRIE_H
+#define TINC_SUBNET_TRIE_H
+
+/*
+    subnet_trie.h -- header for subnet_trie.c
+    Copyright (C) 2026 Guus Sliepen <guus@tinc-vpn.org>
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License along
+    with this program; if not, write to the Free Software Foundation, Inc.,
+    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+*/
+
+#include "system.h"
+
+#define SUBNET_TRIE_MAX_BITS 128
+
+struct node_t;
+struct subnet_t;
+
+typedef struct subnet_trie_node_t {
+	struct subnet_trie_node_t *child[2];
+	struct subnet_t **subnets;      // Subnets with exactly this prefix, in subnet_compare() order
+	int count;
+	int prefixlength;
+	uint8_t prefix[SUBNET_TRIE_MAX_BITS / 8];
+} subnet_trie_node_t;
+
+typedef struct subnet_trie_t {
+	subnet_trie_node_t *root;
+	int bits;                       // Length of addresses stored in this trie
+	size_t nodes;
+} subnet_trie_t;
+
+// Add a subnet with the given prefix. The same subnet must not be added twice.
+extern void subnet_trie_insert(subnet_trie_t *trie, const void *prefix, int prefixlength, struct subnet_t *subnet);
+// Remove the subnet with the given prefix that compares equal to subnet.
+extern void subnet_trie_delete(subnet_trie_t *trie, const void *prefix, int prefixlength, const struct subnet_t *subnet);
+// Find the subnet with the longest prefix matching address whose owner is reachable.
+// If there is none, return the subnet with the shortest matching prefix.
+extern struct subnet_t *subnet_trie_lookup(const subnet_trie_t *trie, const void *address);
+// Check whether owner has a subnet that contains address.
+extern bool subnet_trie_owns(const subnet_trie_t *trie, const void *address, const struct node_t *owner);
+// Remove all subnets.
+extern void subnet_trie_clear(subnet_trie_t *trie);
+
+#endif
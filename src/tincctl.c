@@ -174,6 +174,7 @@ static void usage(bool status) {
 		        "    edges                    - all known connections in the VPN\n"
 		        "    subnets                  - all known subnets in the VPN\n"
 		        "    connections              - all meta connections with ourself\n"
+		        "    subnet-cache             - subnet lookup cache statistics\n"
 		        "    [di]graph                - graph of the VPN in dotty format\n"
 		        "    invitations              - outstanding invitations\n"
 		        "  info NODE|SUBNET|ADDRESS   Give information about a particular NODE, SUBNET or ADDRESS.\n"
@@ -524,7 +525,7 @@ bool recvline(int fd, char *line, size_t len) {
 	return true;
 }
 
-static bool recvdata(int fd, char *data, size_t len) {
+bool recvdata(int fd, char *data, size_t len) {
 	while(blen < len) {
 		ssize_t nrecv = recv(fd, buffer + blen, sizeof(buffer) - blen, 0);
 
@@ -1209,6 +1210,8 @@ static int cmd_dump(int argc, char *argv[]) {
 		sendline(fd, "%d %d", CONTROL, REQ_DUMP_SUBNETS);
 	} else if(!strcasecmp(argv[1], "connections")) {
 		sendline(fd, "%d %d", CONTROL, REQ_DUMP_CONNECTIONS);
+	} else if(!strcasecmp(argv[1], "subnet-cache")) {
+		sendline(fd, "%d %d", CONTROL, REQ_DUMP_SUBNET_CACHE);
 	} else if(!strcasecmp(argv[1], "graph")) {
 		sendline(fd, "%d %d", CONTROL, REQ_DUMP_NODES);
 		sendline(fd, "%d %d", CONTROL, REQ_DUMP_EDGES);
@@ -1267,6 +1270,8 @@ static int cmd_dump(int argc, char *argv[]) {
 		long int last_state_change;
 		int udp_ping_rtt;
 		uint64_t in_packets, in_bytes, out_packets, out_bytes;
+		uint32_t size, entries;
+		uint64_t hits, misses, flushes, invalidations;
 
 		switch(req) {
 		case REQ_DUMP_NODES: {
@@ -1356,6 +1361,18 @@ static int cmd_dump(int argc, char *argv[]) {
 		}
 		break;
 
+		case REQ_DUMP_SUBNET_CACHE: {
+			int n = sscanf(line, "%*d %*d %4095s %"PRIu32" %"PRIu32" %"PRIu64" %"PRIu64" %"PRIu64" %"PRIu64, subnet, &size, &entries, &hits, &misses, &flushes, &invalidations);
+
+			if(n != 7) {
+				fprintf(stderr, "Unable to parse subnet cache dump from tincd.\n");
+				return 1;
+			}
+
+			printf("%s size %"PRIu32" entries %"PRIu32" hits %"PRIu64" misses %"PRIu64" flushes %"PRIu64" invalidations %"PRIu64"\n", subnet, size, entries, hits, misses, flushes, invalidations);
+		}
+		break;
+
 		default:
 			fprintf(stderr, "Unable to parse dump from tincd.\n");
 			return 1;
@@ -1675,8 +1692,10 @@ const var_t variables[] = {
 	{"Broadcast", VAR_SERVER | VAR_SAFE},
 	{"BroadcastSubnet", VAR_SERVER | VAR_MULTIPLE | VAR_SAFE},
 	{"ConnectTo", VAR_SERVER | VAR_MULTIPLE | VAR_SAFE},
+	{"CryptoThreads", VAR_SERVER},
 	{"DecrementTTL", VAR_SERVER | VAR_SAFE},
 	{"Device", VAR_SERVER},
+	{"DeviceQueues", VAR_SERVER},
 	{"DeviceStandby", VAR_SERVER},
 	{"DeviceType", VAR_SERVER},
 	{"DirectOnly", VAR_SERVER | VAR_SAFE},
@@ -1711,6 +1730,7 @@ const var_t variables[] = {
 	{"ScriptsExtension", VAR_SERVER},
 	{"ScriptsInterpreter", VAR_SERVER},
 	{"StrictSubnets", VAR_SERVER | VAR_SAFE},
+	{"SubnetCacheSize", VAR_SERVER},
 	{"TunnelServer", VAR_SERVER | VAR_SAFE},
 	{"UDPDiscovery", VAR_SERVER | VAR_SAFE},
 	{"UDPDiscoveryKeepaliveInterval", VAR_SERVER | VAR_SAFE},
@@ -1719,6 +1739,7 @@ const var_t variables[] = {
 	{"MTUInfoInterval", VAR_SERVER | VAR_SAFE},
 	{"UDPInfoInterval", VAR_SERVER | VAR_SAFE},
 	{"UDPRcvBuf", VAR_SERVER},
+	{"UDPShards", VAR_SERVER},
 	{"UDPSndBuf", VAR_SERVER},
 	{"UPnP", VAR_SERVER},
 	{"UPnPDiscoverWait", VAR_SERVER},
@@ -3054,7 +3075,7 @@ static char *complete_command(const char *text, int state) {
 }
 
 static char *complete_dump(const char *text, int state) {
-	const char *matches[] = {"reachable", "nodes", "edges", "subnets", "connections", "graph", NULL};
+	const char *matches[] = {"reachable", "nodes", "edges", "subnets", "connections", "subnet-cache", "graph", NULL};
 	static int i;
 
 	if(!state) {
@@ -51,6 +51,7 @@ extern char *get_my_name(bool verbose) ATTR_MALLOC;
 extern bool connect_tincd(bool verbose);
 extern bool sendline(int fd, const char *format, ...) ATTR_FORMAT(printf, 2, 3);
 extern bool recvline(int fd, char *line, size_t len);
+extern bool recvdata(int fd, char *data, size_t len);
 extern int check_port(const char *name);
 
 #endif
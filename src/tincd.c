@@ -506,6 +506,9 @@ int main(int argc, char **argv) {
 #endif
 #ifdef HAVE_WATCHDOG
 		        " watchdog"
+#endif
+#ifdef HAVE_WORKERS
+		        " crypto_threads"
 #endif
 		        "\n\n"
 		        "Copyright (C) 1998-2021 Ivo Timmermans, Guus Sliepen and others.\n"
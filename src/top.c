@@ -67,8 +67,53 @@ static float bscale = 1;
 static const char *punit = "pkts";
 static float pscale = 1;
 
+static uint64_t get_u64(const uint8_t *p) {
+	uint64_t value = 0;
+
+	for(int i = 0; i < 8; i++) {
+		value = value << 8 | p[i];
+	}
+
+	return value;
+}
+
+static uint16_t get_u16(const uint8_t *p) {
+	return p[0] << 8 | p[1];
+}
+
+/* Nodes are dumped sorted by name, just like node_list. Instead of searching the
+   whole list for every node, continue from where the previous one was found. */
+static nodestats_t *find_node(list_node_t **next, const char *name) {
+	while(*next) {
+		nodestats_t *ns = (*next)->data;
+		int result = strcmp(name, ns->name);
+
+		if(result > 0) {
+			*next = (*next)->next;
+			continue;
+		}
+
+		if(result == 0) {
+			*next = (*next)->next;
+			return ns;
+		}
+
+		nodestats_t *found = xzalloc(sizeof(*found));
+		found->name = xstrdup(name);
+		list_insert_before(&node_list, *next, found);
+		changed = true;
+		return found;
+	}
+
+	nodestats_t *found = xzalloc(sizeof(*found));
+	found->name = xstrdup(name);
+	list_insert_tail(&node_list, found);
+	changed = true;
+	return found;
+}
+
 static bool update(int fd) {
-	if(!sendline(fd, "%d %d", CONTROL, REQ_DUMP_TRAFFIC)) {
+	if(!sendline(fd, "%d %d", CONTROL, REQ_DUMP_NODE_STATS)) {
 		return false;
 	}
 
@@ -79,66 +124,72 @@ static bool update(int fd) {
 	float interval = (float) diff.tv_sec + (float) diff.tv_usec * 1e-6f;
 
 	char line[4096];
-	char name[4096];
+	uint8_t block[NODE_STATS_BLOCK_SIZE];
+	char name[NODE_STATS_BLOCK_SIZE];
 	int code;
 	int req;
-	uint64_t in_packets;
-	uint64_t in_bytes;
-	uint64_t out_packets;
-	uint64_t out_bytes;
+	int records;
+	int size;
+	unsigned long len;
 
 	for list_each(nodestats_t, ns, &node_list) {
 		ns->known = false;
 	}
 
+	list_node_t *next = node_list.head;
+
 	while(recvline(fd, line, sizeof(line))) {
-		int n = sscanf(line, "%d %d %4095s %"PRIu64" %"PRIu64" %"PRIu64" %"PRIu64, &code, &req, name, &in_packets, &in_bytes, &out_packets, &out_bytes);
+		int n = sscanf(line, "%d %d %d %d %lu", &code, &req, &records, &size, &len);
 
 		if(n == 2) {
 			return true;
 		}
 
-		if(n != 7) {
+		if(n != 5 || code != CONTROL || req != REQ_DUMP_NODE_STATS || size < NODE_STATS_RECORD_SIZE || len > sizeof(block)) {
 			return false;
 		}
 
-		nodestats_t *found = NULL;
+		if(!recvdata(fd, (char *)block, len)) {
+			return false;
+		}
 
-		for list_each(nodestats_t, ns, &node_list) {
-			int result = strcmp(name, ns->name);
+		const uint8_t *p = block;
+		const uint8_t *end = block + len;
 
-			if(result > 0) {
-				continue;
+		for(int i = 0; i < records; i++) {
+			if(end - p < size + 2) {
+				return false;
 			}
 
-			if(result == 0) {
-				found = ns;
-				break;
-			} else {
-				found = xzalloc(sizeof(*found));
-				found->name = xstrdup(name);
-				list_insert_before(&node_list, node, found);
-				changed = true;
-				break;
+			const uint8_t *record = p;
+			p += size;
+			uint16_t namelen = get_u16(p);
+			p += 2;
+
+			if(end - p < namelen) {
+				return false;
 			}
-		}
 
-		if(!found) {
-			found = xzalloc(sizeof(*found));
-			found->name = xstrdup(name);
-			list_insert_tail(&node_list, found);
-			changed = true;
+			memcpy(name, p, namelen);
+			name[namelen] = 0;
+			p += namelen;
+
+			uint64_t in_packets = get_u64(record);
+			uint64_t in_bytes = get_u64(record + 8);
+			uint64_t out_packets = get_u64(record + 16);
+			uint64_t out_bytes = get_u64(record + 24);
+
+			nodestats_t *found = find_node(&next, name);
+			found->known = true;
+			found->in_packets_rate = (float)(in_packets - found->in_packets) / interval;
+			found->in_bytes_rate = (float)(in_bytes - found->in_bytes) / interval;
+			found->out_packets_rate = (float)(out_packets - found->out_packets) / interval;
+			found->out_bytes_rate = (float)(out_bytes - found->out_bytes) / interval;
+			found->in_packets = in_packets;
+			found->in_bytes = in_bytes;
+			found->out_packets = out_packets;
+			found->out_bytes = out_bytes;
 		}
-
-		found->known = true;
-		found->in_packets_rate = (float)(in_packets - found->in_packets) / interval;
-		found->in_bytes_rate = (float)(in_bytes - found->in_bytes) / interval;
-		found->out_packets_rate = (float)(out_packets - found->out_packets) / interval;
-		found->out_bytes_rate = (float)(out_bytes - found->out_bytes) / interval;
-		found->in_packets = in_packets;
-		found->in_bytes = in_bytes;
-		found->out_packets = out_packets;
-		found->out_bytes = out_bytes;
 	}
 
 	return false;
@@ -0,0 +1,213 @@
+/*
+    workers.c -- run per-packet work on a pool of threads
+    Copyright (C) 2026 Guus Sliepen <guus@tinc-vpn.org>
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License along
+    with this program; if not, write to the Free Software Foundation, Inc.,
+    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+*/
+
+#include "system.h"
+
+#include <pthread.h>
+
+#include "logger.h"
+#include "workers.h"
+#include "xalloc.h"
+
+/* Each thread has its own queue of work to run, and a list of work that has been run.
+   Threads take all queued work at once, and the main thread is woken up through a pipe
+   only when a thread's list of finished work was empty, to keep locking and system calls
+   per packet to a minimum. */
+
+#define MAX_QUEUED_WORK 1024
+
+typedef struct worker_t {
+	pthread_t thread;
+	pthread_mutex_t mutex;
+	pthread_cond_t cond;
+	bool stop;
+
+	work_t *queue;
+	work_t **queue_tail;
+	size_t queued;
+
+	work_t *finished;
+	work_t **finished_tail;
+} worker_t;
+
+int worker_threads = 0;
+
+static worker_t *workers;
+static int wakeup_fd[2] = {-1, -1};
+
+static void *worker_main(void *arg) {
+	worker_t *w = arg;
+
+	pthread_mutex_lock(&w->mutex);
+
+	while(true) {
+		while(!w->queue && !w->stop) {
+			pthread_cond_wait(&w->cond, &w->mutex);
+		}
+
+		if(!w->queue) {
+			break;
+		}
+
+		work_t *work = w->queue;
+		work_t **tail = w->queue_tail;
+		w->queue = NULL;
+		w->queue_tail = &w->queue;
+		w->queued = 0;
+
+		pthread_mutex_unlock(&w->mutex);
+
+		for(work_t *i = work; i; i = i->next) {
+			i->run(i);
+		}
+
+		pthread_mutex_lock(&w->mutex);
+
+		bool wakeup = !w->finished;
+		*w->finished_tail = work;
+		w->finished_tail = tail;
+
+		if(wakeup && write(wakeup_fd[1], "", 1) != 1) {
+			// Pipe full, the main thread will wake up anyway.
+		}
+	}
+
+	pthread_mutex_unlock(&w->mutex);
+	return NULL;
+}
+
+int init_workers(int count) {
+	if(pipe(wakeup_fd)) {
+		logger(DEBUG_ALWAYS, LOG_ERR, "Could not create pipe: %s", strerror(errno));
+		return -1;
+	}
+
+	for(int i = 0; i < 2; i++) {
+		fcntl(wakeup_fd[i], F_SETFL, fcntl(wakeup_fd[i], F_GETFL) | O_NONBLOCK);
+		fcntl(wakeup_fd[i], F_SETFD, FD_CLOEXEC);
+	}
+
+	workers = xzalloc(count * sizeof(*workers));
+
+	// Signals should only be handled by the main thread
+	sigset_t all, old;
+	sigfillset(&all);
+	pthread_sigmask(SIG_SETMASK, &all, &old);
+
+	for(; worker_threads < count; worker_threads++) {
+		worker_t *w = &workers[worker_threads];
+		pthread_mutex_init(&w->mutex, NULL);
+		pthread_cond_init(&w->cond, NULL);
+		w->queue_tail = &w->queue;
+		w->finished_tail = &w->finished;
+
+		int error = pthread_create(&w->thread, NULL, worker_main, w);
+
+		if(error) {
+			logger(DEBUG_ALWAYS, LOG_ERR, "Unable to start worker thread: [%d] %s", error, strerror(error));
+			pthread_mutex_destroy(&w->mutex);
+			pthread_cond_destroy(&w->cond);
+			break;
+		}
+	}
+
+	pthread_sigmask(SIG_SETMASK, &old, NULL);
+
+	if(worker_threads < count) {
+		exit_workers();
+		return -1;
+	}
+
+	logger(DEBUG_CONNECTIONS, LOG_INFO, "Started %d worker threads", count);
+	return wakeup_fd[0];
+}
+
+void exit_workers(void) {
+	for(int i = 0; i < worker_threads; i++) {
+		worker_t *w = &workers[i];
+		pthread_mutex_lock(&w->mutex);
+		w->stop = true;
+		pthread_cond_signal(&w->cond);
+		pthread_mutex_unlock(&w->mutex);
+	}
+
+	for(int i = 0; i < worker_threads; i++) {
+		pthread_join(workers[i].thread, NULL);
+	}
+
+	finish_work();
+
+	for(int i = 0; i < worker_threads; i++) {
+		pthread_mutex_destroy(&workers[i].mutex);
+		pthread_cond_destroy(&workers[i].cond);
+	}
+
+	worker_threads = 0;
+	free(workers);
+	workers = NULL;
+
+	for(int i = 0; i < 2; i++) {
+		if(wakeup_fd[i] != -1) {
+			close(wakeup_fd[i]);
+			wakeup_fd[i] = -1;
+		}
+	}
+}
+
+bool submit_work(work_t *work, unsigned int key) {
+	worker_t *w = &workers[key % worker_threads];
+
+	pthread_mutex_lock(&w->mutex);
+
+	bool queued = w->queued < MAX_QUEUED_WORK;
+
+	if(queued) {
+		work->next = NULL;
+		*w->queue_tail = work;
+		w->queue_tail = &work->next;
+
+		if(!w->queued++) {
+			pthread_cond_signal(&w->cond);
+		}
+	}
+
+	pthread_mutex_unlock(&w->mutex);
+	return queued;
+}
+
+void finish_work(void) {
+	char buf[64];
+
+	while(read(wakeup_fd[0], buf, sizeof(buf)) == sizeof(buf));
+
+	for(int i = 0; i < worker_threads; i++) {
+		worker_t *w = &workers[i];
+
+		pthread_mutex_lock(&w->mutex);
+		work_t *work = w->finished;
+		w->finished = NULL;
+		w->finished_tail = &w->finished;
+		pthread_mutex_unlock(&w->mutex);
+
+		for(work_t *next; work; work = next) {
+			next = work->next;
+			work->done(work);
+		}
+	}
+}
@@ -0,0 +1,48 @@
+#ifndef TINC_WORKERS_H
+#define TINC_WORKERS_H
+
+/*
+    workers.h -- header for workers.c
+    Copyright (C) 2026 Guus Sliepen <guus@tinc-vpn.org>
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License along
+    with this program; if not, write to the Free Software Foundation, Inc.,
+    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+*/
+
+#include "system.h"
+
+#define MAX_WORKERS 64
+
+typedef struct work_t work_t;
+typedef void (*work_cb_t)(work_t *work);
+
+struct work_t {
+	work_cb_t run;          // Called on a worker thread, must not touch any global state
+	work_cb_t done;         // Called on the main thread after run() has returned
+	work_t *next;
+};
+
+extern int worker_threads;
+
+// Start count threads. Returns a file descriptor that becomes readable when work is done, or -1 on error.
+extern int init_workers(int count);
+// Wait for all submitted work to be done, and stop the threads.
+extern void exit_workers(void);
+// Run work on a thread selected by key. Work with the same key is run and done in the order it was submitted.
+// Returns false if that thread has too much work queued already.
+extern bool submit_work(work_t *work, unsigned int key);
+// Call done() for all work that has been run.
+extern void finish_work(void);
+
+#endif
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+"""Benchmark how fast the graph converges after startup and after a node flaps."""
+
+import time
+import typing as T
+
+from testlib import bench
+from testlib.cmd import Mesh, Topology
+from testlib.converge import wait_converged
+from testlib.log import log
+from testlib.test import Test
+
+# Number of nodes in each benchmarked mesh
+SIZES = (8, 32)
+
+# Average number of connections per node
+DEGREE = 3
+
+# How many times a node is restarted to measure reconvergence
+FLAPS = 5
+
+
+def bench_startup(mesh: Mesh) -> bench.Result:
+    """Measure time until all nodes see the full graph after simultaneous start."""
+    since = time.monotonic()
+    mesh.start(wait=False)
+    spent = mesh.wait_converged(since=since)
+    return {"phase": "startup", "seconds": bench.summary(list(spent.values()))}
+
+
+def is_connected_without(mesh: Mesh, index: int) -> bool:
+    """Check if the mesh stays connected after removing the node with index."""
+    adjacent: T.Dict[int, T.Set[int]] = {i: set() for i in range(len(mesh))}
+    for i, j in mesh.edges:
+        if index not in (i, j):
+            adjacent[i].add(j)
+            adjacent[j].add(i)
+
+    first = 1 if index == 0 else 0
+    seen, stack = {first}, [first]
+    while stack:
+        for peer in adjacent[stack.pop()] - seen:
+            seen.add(peer)
+            stack.append(peer)
+    return len(seen) == len(mesh) - 1
+
+
+def bench_flaps(mesh: Mesh) -> T.List[bench.Result]:
+    """Restart nodes one by one, and measure how long it takes the rest of
+    the mesh to notice that each of them went down, and then came back up.
+    Only reachability is awaited: connections made by other nodes to the
+    restarted one are restored by their own reconnection timers. Nodes that
+    would split the mesh in two when they're gone are not restarted.
+    """
+    down: T.List[float] = []
+    up: T.List[float] = []
+    candidates = [i for i in range(len(mesh)) if is_connected_without(mesh, i)]
+
+    for flap in range(FLAPS):
+        node = mesh[candidates[flap % len(candidates)]]
+        rest = [n for n in mesh.nodes if n is not node]
+        log.info("flap %d: restarting node %s", flap, node)
+
+        since = time.monotonic()
+        node.cmd("stop")
+        down += wait_converged(rest, since=since).values()
+
+        since = time.monotonic()
+        node.start()
+        up += wait_converged(mesh.nodes, since=since).values()
+
+    return [
+        {"phase": "node down", "seconds": bench.summary(down)},
+        {"phase": "node up", "seconds": bench.summary(up)},
+    ]
+
+
+def run_benchmarks() -> None:
+    """Run benchmarks for all mesh sizes and save results."""
+    results = []
+    for size in SIZES:
+        with Test(f"convergence of {size} nodes") as ctx:
+            mesh = Mesh(ctx, size, Topology.RANDOM, degree=DEGREE, seed=size)
+            for result in [bench_startup(mesh), *bench_flaps(mesh)]:
+                result.update({"nodes": size, "edges": len(mesh.edges)})
+                log.info("%s", result)
+                results.append(result)
+            mesh.stop()
+    bench.report(results)
+
+
+run_benchmarks()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+"""Benchmark data plane throughput depending on the number of worker threads (CryptoThreads).
+
+Several flows are sent at the same time in both directions, since packets of a
+single node are always handled by the same thread.
+"""
+
+import os
+import sys
+
+from testlib import bench
+from testlib.const import EXIT_SKIP
+from testlib.log import log
+from testlib.proc import Feature, features
+from testlib.tunnel import benchmark, require_netns
+
+# How long to send data in each measurement, in seconds
+DURATION = bench.duration(1)
+
+# Number of flows sent in parallel
+STREAMS = int(os.getenv("BENCH_STREAMS", "4"))
+
+# Thread counts to compare. 0 runs everything on the main thread.
+THREADS = (0, 1, 2, 4)
+
+if Feature.CRYPTO_THREADS not in features():
+    log.info("worker threads are not supported, skipping benchmark")
+    sys.exit(EXIT_SKIP)
+
+require_netns()
+benchmark(
+    "crypto threads",
+    (
+        ({"threads": threads, "streams": STREAMS}, f"set CryptoThreads {threads}")
+        for threads in THREADS
+    ),
+    duration=DURATION,
+    streams=STREAMS,
+)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+"""Benchmark data plane throughput depending on the number of TUN queues (DeviceQueues).
+
+Several flows are sent at the same time, so that the kernel can spread them
+across queues. Each queue count is measured with queues read on the main thread,
+and with as many worker threads (CryptoThreads) as queues, if they are supported.
+Queues can only be read at the same time if there are enough CPUs, so their
+number is saved with the results.
+"""
+
+import os
+import typing as T
+
+from testlib import bench
+from testlib.proc import Feature, features
+from testlib.tunnel import benchmark, require_netns
+
+# How long to send data in each measurement, in seconds
+DURATION = bench.duration(1)
+
+# Number of flows sent in parallel
+STREAMS = int(os.getenv("BENCH_STREAMS", "8"))
+
+# Queue counts to compare
+QUEUES = (1, 2, 4, 8)
+
+
+def get_cases() -> T.Iterator[T.Tuple[bench.Result, str]]:
+    """Get (case, tinc script) for each queue and thread count to benchmark."""
+    workers = Feature.CRYPTO_THREADS in features()
+    for queues in QUEUES:
+        for threads in (0, queues) if workers else (0,):
+            case = {
+                "queues": queues,
+                "threads": threads,
+                "cpus": os.cpu_count(),
+                "streams": STREAMS,
+            }
+            config = os.linesep.join(
+                [f"set DeviceQueues {queues}", f"set CryptoThreads {threads}"]
+            )
+            yield case, config
+
+
+require_netns()
+benchmark("device queues", get_cases(), duration=DURATION, streams=STREAMS)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+"""Benchmark the data plane without root, using fd devices instead of TUN devices.
+
+A generator process writes IPv4 packets straight into the fd device of bar,
+and a sink process reads them from the fd device of foo (see testlib.fd_tunnel),
+so the tunnel is measured without the kernel network stack and without needing
+network namespaces, which lets the benchmark run in unprivileged containers.
+
+Each packet size is measured twice: sending as fast as tincd takes packets,
+which gives throughput, and at a fixed rate low enough for the tunnel to keep
+up, which gives one-way latency. Results include CPU time spent by both tincd
+processes per forwarded packet.
+
+To compare two builds, run the benchmark with the first one and
+BENCH_UPDATE_BASELINE set, then with the second one. Results of the second
+run include the change of each metric against the first one.
+"""
+
+import os
+import typing as T
+
+from testlib import bench, traffic
+from testlib.fd_tunnel import FdTunnel
+from testlib.log import log
+from testlib.test import Test
+
+# How long to send data in each measurement, in seconds
+DURATION = bench.duration(2)
+
+# IPv4 packet sizes in bytes
+SIZES = (64, 512, 1400)
+
+# Packets per second, 0 meaning as fast as possible
+RATES = (0, 1000)
+
+# Results are compared with the baseline stored under this name
+BASELINE = os.getenv("BENCH_BASELINE_KEY", "fd_device")
+
+
+def run_case(tunnel: FdTunnel, size: int, rate: int) -> bench.Result:
+    """Inject packets of size bytes and describe how many of them got through."""
+    result: bench.Result = {"size": size, "rate": rate}
+    foo, bar = tunnel.nodes
+    cpu = tunnel.cpu_seconds()
+    try:
+        sent, received = traffic.inject(
+            tunnel.devices[bar.name].fileno(),
+            tunnel.devices[foo.name].fileno(),
+            bar.address,
+            foo.address,
+            rate=rate,
+            duration=DURATION,
+            size=size,
+        )
+    except RuntimeError as ex:
+        log.error("measurement of %d byte packets failed", size, exc_info=ex)
+        result["error"] = str(ex)
+        return result
+
+    cpu = tunnel.cpu_seconds() - cpu
+    packets = received["packets"]
+    result.update(
+        {
+            "sent_packets_per_second": sent["packets_per_second"],
+            "packets_per_second": received["packets_per_second"],
+            "mbit_per_second": received["mbit_per_second"],
+            "loss": 1 - packets / sent["packets"] if sent["packets"] else None,
+            "reordered": received["reordered"],
+            "latency_us": received["latency_us"],
+            "cpu_microseconds_per_packet": cpu / packets * 1e6 if packets else None,
+        }
+    )
+    log.info("%s", result)
+    return result
+
+
+def to_metrics(results: T.List[bench.Result]) -> bench.Metrics:
+    """Extract metrics where higher values are better from successful results.
+    Packet rates are only taken from cases that send as fast as possible.
+    """
+    metrics: bench.Metrics = {}
+    for result in results:
+        if result.get("error"):
+            continue
+        case = f"{result['size']}/{result['rate']}"
+        if not result["rate"]:
+            metrics[f"{case}/packets_per_second"] = result["packets_per_second"]
+        if result["cpu_microseconds_per_packet"]:
+            per_cpu = 1e6 / result["cpu_microseconds_per_packet"]
+            metrics[f"{case}/packets_per_cpu_second"] = per_cpu
+    return metrics
+
+
+def run_benchmarks() -> None:
+    """Measure all combinations of packet sizes and rates, and save results."""
+    results: T.List[bench.Result] = []
+
+    with Test("fd device data plane") as ctx:
+        tunnel = FdTunnel(ctx)
+        tunnel.start()
+        for size in SIZES:
+            for rate in RATES:
+                results.append(run_case(tunnel, size, rate))
+        tunnel.stop()
+
+    metrics = to_metrics(results)
+    baseline = bench.load_baseline(BASELINE)
+
+    if baseline:
+        changes = bench.changes(baseline, metrics)
+        for result in results:
+            case = f"{result['size']}/{result['rate']}/"
+            result["change_percent"] = {
+                name[len(case) :]: change
+                for name, change in changes.items()
+                if name.startswith(case)
+            }
+
+    bench.report(results)
+
+    if baseline is None or os.getenv("BENCH_UPDATE_BASELINE"):
+        bench.save_baseline(BASELINE, metrics)
+
+
+run_benchmarks()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+"""Benchmark round-trip latency and jitter between two nodes in network namespaces.
+
+Packets take different paths depending on the state of the tunnel: right after
+the nodes connect, tincd forwards them over the TCP meta connection until
+UDP works (see try_udp() in src/net_packet.c). Each path is measured separately:
+
+    udp         direct UDP, after path MTU discovery has finished
+    tcp         TCP meta connection (TCPOnly = yes)
+    cold start  probing starts right after the tunnel is up, so early packets
+                go over TCP and later ones over UDP
+"""
+
+import typing as T
+
+from testlib import bench, traffic
+from testlib.log import log
+from testlib.test import Test
+from testlib.tunnel import Tunnel, require_netns
+
+# How long to send probes in each measurement, in seconds
+DURATION = bench.duration(2)
+
+# Probes per second
+RATES = (100, 1000)
+
+# Probe size, typical for interactive traffic
+SIZE = 200
+
+# (name, tinc script, wait for UDP before measuring)
+CASES = (
+    ("udp", "", True),
+    ("tcp", "set TCPOnly yes", False),
+    ("cold start", "", False),
+)
+
+
+def jitter(rtts: T.Sequence[int]) -> float:
+    """Mean absolute difference between consecutive round-trip times."""
+    if len(rtts) < 2:
+        return 0.0
+    return sum(abs(b - a) for a, b in zip(rtts, rtts[1:])) / (len(rtts) - 1)
+
+
+def measure(tunnel: Tunnel, name: str, rate: int) -> bench.Result:
+    """Measure latency at one rate. Failures are reported instead of raised."""
+    result: bench.Result = {
+        "case": name,
+        "rate": rate,
+        "size": SIZE,
+        "udp_ready": tunnel.udp_ready,
+    }
+    try:
+        rtts = traffic.latency(
+            tunnel.bar.name,
+            tunnel.foo.name,
+            tunnel.foo.address,
+            rate=rate,
+            duration=DURATION,
+            size=SIZE,
+        )
+    except RuntimeError as ex:
+        log.error('measurement "%s" at %d/s failed', name, rate, exc_info=ex)
+        result["error"] = str(ex)
+        return result
+
+    received = [rtt for rtt in rtts if rtt is not None]
+    hist = bench.Histogram()
+    for rtt in received:
+        hist.record(rtt)
+
+    result.update(
+        {
+            "sent": len(rtts),
+            "lost": len(rtts) - len(received),
+            "rtt_us": hist.summary() if received else None,
+            "jitter_us": jitter(received),
+        }
+    )
+    log.info("%s", result)
+    return result
+
+
+def run_case(ctx: Test, name: str, config: str, warm_up: bool) -> T.List[bench.Result]:
+    """Measure latency at each rate. The cold start case is only meaningful
+    for the first measurement, so each of its rates gets a fresh tunnel.
+    """
+    log.info('benchmarking "%s"', name)
+    results = []
+
+    if warm_up or config:
+        tunnel = Tunnel(ctx, config)
+        tunnel.start(warm_up=warm_up)
+        results = [measure(tunnel, name, rate) for rate in RATES]
+        tunnel.stop()
+    else:
+        for rate in RATES:
+            tunnel = Tunnel(ctx, config)
+            tunnel.start(warm_up=False)
+            results.append(measure(tunnel, name, rate))
+            tunnel.stop()
+
+    return results
+
+
+def run_benchmarks() -> None:
+    """Run benchmarks for all cases and save results."""
+    results = []
+
+    with Test("latency and jitter") as ctx:
+        for name, config, warm_up in CASES:
+            results += run_case(ctx, name, config, warm_up)
+
+    bench.report(results)
+
+
+require_netns()
+run_benchmarks()
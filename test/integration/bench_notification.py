@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+"""Benchmark delivery of notifications from tincd scripts to the test process,
+and how long the scripts take to start."""
+
+import os
+import sys
+import json
+import time
+import subprocess as subp
+import typing as T
+
+from testlib import bench, check, path
+from testlib.event import Notification, Notifier
+from testlib.log import log
+from testlib.notification import notifications
+from testlib.proc import Script
+from testlib.test import Test
+
+# Number of notifications sent directly through the transport as fast as possible
+EVENTS = 5000
+
+# Number of notifications sent one by one with a pause to measure latency
+PACED_EVENTS = 500
+PACED_INTERVAL = 0.002
+
+# Number of subnets (and subnet-up script invocations) for the end-to-end benchmark
+SUBNETS = 30
+
+# Median latency for sending a notification through the transport must stay below this
+LATENCY_TARGET_MS = 10.0
+
+# Number of times each script is run to measure its startup time
+STARTUP_RUNS = 30
+
+# Script sources for the startup benchmark: one only needs the lightweight runtime,
+# the other one refers to the node running it and so imports the full testlib
+STARTUP_SCRIPTS = {
+    "runtime": "",
+    "full testlib": "    this.name",
+}
+
+NODE = "bench"
+SCRIPT = "transport"
+
+
+def run_sender(events: int, persistent: bool, interval: float) -> None:
+    """Send notifications to the server specified in environment variables.
+    Runs in a separate process, like tincd scripts do.
+    """
+    addr = json.loads(os.environ["NOTIFY_ADDR"])
+    address = tuple(addr) if isinstance(addr, list) else addr
+    authkey = bytes.fromhex(os.environ["NOTIFY_KEY"])
+
+    def notification() -> Notification:
+        evt = Notification()
+        evt.test = path.TEST_NAME
+        evt.node = NODE
+        evt.script = SCRIPT
+        evt.args = {}
+        evt.error = None
+        return evt
+
+    if persistent:
+        with Notifier(address, authkey) as conn:
+            for _ in range(events):
+                conn.send(notification())
+                time.sleep(interval)
+    else:
+        for _ in range(events):
+            with Notifier(address, authkey) as conn:
+                conn.send(notification())
+            time.sleep(interval)
+
+
+def receive(count: int, node: str, script: str) -> T.List[Notification]:
+    """Wait for count notifications from the script."""
+    result: T.List[Notification] = []
+    for _ in range(count):
+        evt = notifications.get(node, script, timeout=30)
+        assert evt, f"received {len(result)} of {count} notifications"
+        check.false(evt.error)
+        result.append(evt)
+    return result
+
+
+def describe(mode: str, events: T.List[Notification]) -> bench.Result:
+    """Calculate throughput and latency for received notifications."""
+    latency_ms = [evt.latency / 1e6 for evt in events if evt.latency is not None]
+    first = min(evt.created_at for evt in events if evt.created_at is not None)
+    last = max(evt.received_at for evt in events if evt.received_at is not None)
+    spent = max(last - first, 1) / 1e9
+
+    result = {
+        "mode": mode,
+        "events": len(events),
+        "seconds": spent,
+        "events_per_second": len(events) / spent,
+        "latency_ms": bench.summary(latency_ms),
+    }
+    log.info("%s: %.0f events/s", mode, result["events_per_second"])
+    return result
+
+
+def bench_transport(persistent: bool, paced: bool) -> bench.Result:
+    """Measure sending notifications directly from another process. Without
+    pacing, notifications are sent back to back to measure maximum throughput
+    (latency then mostly shows the time spent waiting in queues).
+    """
+    mode = "persistent connection" if persistent else "connection per event"
+    mode += ", paced" if paced else ", flood"
+    count, interval = (PACED_EVENTS, PACED_INTERVAL) if paced else (EVENTS, 0)
+    log.info("benchmark transport: %s", mode)
+
+    env = {
+        **os.environ,
+        "NOTIFY_ADDR": json.dumps(notifications.address),
+        "NOTIFY_KEY": notifications.authkey.hex(),
+    }
+    flag = "--send-persistent" if persistent else "--send"
+    cmd = [path.PYTHON_PATH, __file__, flag, str(count), str(interval)]
+
+    with subp.Popen(cmd, env=env) as sender:
+        events = receive(count, NODE, SCRIPT)
+        check.success(sender.wait())
+
+    result = describe(mode, events)
+    if paced:
+        check.greater(LATENCY_TARGET_MS, result["latency_ms"]["p50"])
+    return result
+
+
+def bench_scripts(ctx: Test) -> bench.Result:
+    """Measure delivery from real subnet-up scripts executed by tincd."""
+    subnets = os.linesep.join(f"add Subnet 10.{i}.0.0/16" for i in range(SUBNETS))
+    foo = ctx.node(init=subnets)
+    foo.add_script(Script.SUBNET_UP)
+
+    start = time.monotonic()
+    foo.cmd("start")
+    events = receive(SUBNETS, foo.name, Script.SUBNET_UP.value)
+    log.info(
+        "received %d script notifications in %f s", SUBNETS, time.monotonic() - start
+    )
+
+    return describe("subnet-up scripts", events)
+
+
+def bench_startup(ctx: Test) -> T.List[bench.Result]:
+    """Measure how long a tincd script takes to start, notify the test and exit."""
+    foo = ctx.node()
+    results: T.List[bench.Result] = []
+    medians: T.Dict[str, float] = {}
+
+    for i, (mode, source) in enumerate(STARTUP_SCRIPTS.items()):
+        script = foo.add_script(f"startup-{i}", source)
+        startup_ms: T.List[float] = []
+
+        for _ in range(STARTUP_RUNS):
+            start = time.monotonic()
+            subp.run([path.PYTHON_PATH, foo.sub(script.name)], check=True)
+            startup_ms.append((time.monotonic() - start) * 1e3)
+
+        receive(STARTUP_RUNS, foo.name, script.name)
+        summary = bench.summary(startup_ms)
+        log.info("script startup, %s: %.1f ms", mode, summary["p50"])
+        results.append({"mode": f"script startup, {mode}", "startup_ms": summary})
+        medians[mode] = summary["p50"]
+
+    check.greater(medians["full testlib"], medians["runtime"])
+    return results
+
+
+def run_benchmarks() -> None:
+    """Run all benchmarks and save results."""
+    results = [
+        bench_transport(persistent, paced)
+        for persistent in (True, False)
+        for paced in (False, True)
+    ]
+    with Test("notifications from subnet-up scripts") as context:
+        results.append(bench_scripts(context))
+    with Test("script startup time") as context:
+        results += bench_startup(context)
+    bench.report(results)
+
+
+if len(sys.argv) == 4 and sys.argv[1].startswith("--send"):
+    run_sender(int(sys.argv[2]), sys.argv[1] == "--send-persistent", float(sys.argv[3]))
+else:
+    run_benchmarks()
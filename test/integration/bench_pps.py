@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+"""Benchmark how many small packets per second the data plane can forward.
+
+Small datagrams make per-packet costs (syscalls, event loop wakeups) dominate
+over encryption, which is what this benchmark is meant to show. Results include
+CPU time spent by both tincd processes per forwarded packet.
+
+To compare two builds, run the benchmark with the first one and
+BENCH_UPDATE_BASELINE set, then with the second one. Results of the second
+run include the change of each metric against the first one. The benchmark
+never fails because of them: packet rates on a loaded machine are too noisy.
+"""
+
+import os
+import typing as T
+
+from testlib import bench, traffic
+from testlib.log import log
+from testlib.test import Test
+from testlib.tunnel import Tunnel, require_netns
+
+# How long to send data in each measurement, in seconds
+DURATION = bench.duration(2)
+
+# UDP payload sizes in bytes
+SIZES = (16, 64, 256, 1400)
+
+# Number of flows sent in parallel
+STREAMS = (1, 4)
+
+# Results are compared with the baseline stored under this name
+BASELINE = os.getenv("BENCH_BASELINE_KEY", "pps")
+
+
+def run_case(tunnel: Tunnel, size: int, streams: int) -> bench.Result:
+    """Send datagrams of size bytes and describe how many of them got through."""
+    result: bench.Result = {"size": size, "streams": streams}
+    cpu = tunnel.cpu_seconds()
+    try:
+        sent, received = traffic.measure(
+            "udp",
+            tunnel.bar.name,
+            tunnel.foo.name,
+            tunnel.foo.address,
+            duration=DURATION,
+            size=size,
+            streams=streams,
+        )
+    except RuntimeError as ex:
+        log.error("measurement of %d byte packets failed", size, exc_info=ex)
+        result["error"] = str(ex)
+        return result
+
+    cpu = tunnel.cpu_seconds() - cpu
+    packets = received["packets"]
+    result.update(
+        {
+            "sent_packets_per_second": sent["packets_per_second"],
+            "packets_per_second": received["packets_per_second"],
+            "loss": 1 - packets / sent["packets"] if sent["packets"] else None,
+            "cpu_seconds": cpu,
+            "cpu_microseconds_per_packet": cpu / packets * 1e6 if packets else None,
+        }
+    )
+    log.info("%s", result)
+    return result
+
+
+def to_metrics(results: T.List[bench.Result]) -> bench.Metrics:
+    """Extract metrics where higher values are better from successful results."""
+    metrics: bench.Metrics = {}
+    for result in results:
+        if result.get("error"):
+            continue
+        case = f"{result['size']}/{result['streams']}"
+        metrics[f"{case}/packets_per_second"] = result["packets_per_second"]
+        if result["cpu_microseconds_per_packet"]:
+            per_cpu = 1e6 / result["cpu_microseconds_per_packet"]
+            metrics[f"{case}/packets_per_cpu_second"] = per_cpu
+    return metrics
+
+
+def run_benchmarks() -> None:
+    """Measure all combinations of packet sizes and flow counts, and save results."""
+    results: T.List[bench.Result] = []
+
+    with Test("packets per second") as ctx:
+        tunnel = Tunnel(ctx)
+        tunnel.start()
+        for size in SIZES:
+            for streams in STREAMS:
+                results.append(run_case(tunnel, size, streams))
+        tunnel.stop()
+
+    metrics = to_metrics(results)
+    baseline = bench.load_baseline(BASELINE)
+
+    if baseline:
+        changes = bench.changes(baseline, metrics)
+        for result in results:
+            case = f"{result['size']}/{result['streams']}/"
+            result["change_percent"] = {
+                name[len(case) :]: change
+                for name, change in changes.items()
+                if name.startswith(case)
+            }
+
+    bench.report(results)
+
+    if baseline is None or os.getenv("BENCH_UPDATE_BASELINE"):
+        bench.save_baseline(BASELINE, metrics)
+
+
+require_netns()
+run_benchmarks()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+"""Benchmark packet handling while a peer keeps changing its UDP source port.
+
+bar sends packets to foo through the relay from testlib.relay, which moves them
+to a new source port every few seconds or milliseconds, like a NAT whose
+mappings expire. Nodes use the legacy protocol, whose packets don't carry the
+ID of their sender. Until foo confirms the new address of bar with a path MTU
+probe, it has to find out who sent each packet by checking it against session
+keys of nodes known to use the same IP address, and once a second, some others.
+
+To make that search expensive, foo also gets connections from PEERS other
+nodes, each at an address of its own, which get session keys like bar. For each
+number of peers and rebinding interval, the benchmark measures one-way latency
+and loss at a fixed packet rate, and CPU time spent by foo per received packet.
+"""
+
+import os
+import sys
+import time
+import typing as T
+
+from testlib import bench, traffic
+from testlib.cmd import exchange_all, run_all, start_all
+from testlib.const import EXIT_SKIP
+from testlib.control import NodeStatus
+from testlib.fd_tunnel import FdTunnel
+from testlib.log import log
+from testlib.proc import Feature, Tinc, features
+from testlib.relay import BIND_ADDRESS, Impairment, Relay
+from testlib.test import Test
+from testlib.tunnel import cpu_seconds
+
+# How long to send data in each measurement, in seconds
+DURATION = bench.duration(2)
+
+# Numbers of other nodes connected to foo
+PEERS = (0, int(os.getenv("BENCH_PEERS", "64")))
+
+# Seconds between changes of the source port, 0 for never
+REBINDS = (0.0, 1.0, 0.1, 0.01)
+
+# IPv4 packet size in bytes
+SIZE = 512
+
+# Packets per second
+RATE = 2000
+
+# How long to wait until foo has session keys of all peers, in seconds
+KEY_TIMEOUT = 30
+
+
+def add_peers(ctx: Test, foo: Tinc, count: int) -> T.List[Tinc]:
+    """Start count nodes that connect to foo directly, bypassing the relay, so
+    that it sees each of them at its own random address.
+    """
+    peers = [ctx.node() for _ in range(count)]
+
+    def configure(node: Tinc) -> None:
+        node.init_fast(
+            os.linesep.join(
+                [
+                    f"set Port {node.randomize_port()}",
+                    f"set Address {node.address}",
+                    f"set BindToAddress {node.address}",
+                    "set DeviceType dummy",
+                    "set AutoConnect no",
+                    "set ExperimentalProtocol no",
+                    f"set ConnectTo {foo}",
+                ]
+            )
+        )
+
+    run_all(peers, configure)
+    exchange_all(
+        [foo, *peers], {foo.name: peers, **{p.name: [foo] for p in peers}}, direct=True
+    )
+
+    # foo advertises the relay, so point peers at the address it listens on
+    for peer in peers:
+        with open(peer.sub("hosts", foo.name), "r+", encoding="utf-8") as f:
+            lines = [line for line in f if not line.startswith("Address")]
+            f.seek(0)
+            f.truncate()
+            f.writelines([f"Address = {BIND_ADDRESS}\n", *lines])
+
+    start_all(peers)
+    return peers
+
+
+def wait_keys(foo: Tinc, peers: T.List[Tinc]) -> None:
+    """Wait until foo has session keys of all peers."""
+    names = {peer.name for peer in peers}
+    deadline = time.monotonic() + KEY_TIMEOUT
+    while True:
+        keyed = {
+            rec.name
+            for rec in foo.control.dump_nodes()
+            if NodeStatus.VALIDKEY_IN in rec.status
+        }
+        if names <= keyed:
+            return
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{foo} has keys of {len(names & keyed)} peers")
+        time.sleep(0.1)
+
+
+def measure(tunnel: FdTunnel, rebind: float) -> bench.Result:
+    """Send packets from bar to foo. Failures are reported instead of raised."""
+    foo, bar = tunnel.nodes
+    cpu = cpu_seconds(foo.pid)
+    try:
+        sent, received = traffic.inject(
+            tunnel.devices[bar.name].fileno(),
+            tunnel.devices[foo.name].fileno(),
+            bar.address,
+            foo.address,
+            rate=RATE,
+            duration=DURATION,
+            size=SIZE,
+        )
+    except RuntimeError as ex:
+        log.error("measurement with rebinding every %fs failed", rebind, exc_info=ex)
+        return {"rebind": rebind, "error": str(ex)}
+
+    cpu = cpu_seconds(foo.pid) - cpu
+    packets = received["packets"]
+    return {
+        "rebind": rebind,
+        "loss": 1 - packets / sent["packets"] if sent["packets"] else None,
+        "latency_us": received["latency_us"],
+        "cpu_microseconds_per_packet": cpu / packets * 1e6 if packets else None,
+    }
+
+
+def run_peers(ctx: Test, count: int) -> T.List[bench.Result]:
+    """Start a tunnel with count other nodes connected to foo, and measure it
+    at all rebinding intervals.
+    """
+    results: T.List[bench.Result] = []
+
+    with Relay(seed=0) as relay:
+        tunnel = FdTunnel(ctx, "set ExperimentalProtocol no", relay=relay)
+        tunnel.start()
+        foo, bar = tunnel.nodes
+        relay.roam(bar)
+
+        peers = add_peers(ctx, foo, count)
+        wait_keys(foo, [bar, *peers])
+        log.info("%s has session keys of %d peers", foo, count)
+
+        for rebind in REBINDS:
+            relay.impairment = Impairment(rebind=rebind)
+            result = measure(tunnel, rebind)
+            result.update({"peers": count, "relay": relay.stats()})
+            log.info("%s", result)
+            results.append(result)
+
+        run_all(peers, lambda node: node.cmd("stop"))
+        tunnel.stop()
+
+    return results
+
+
+def run_benchmarks() -> None:
+    """Measure all combinations of peer counts and rebinding intervals."""
+    results: T.List[bench.Result] = []
+
+    for count in PEERS:
+        with Test(f"roaming with {count} peers") as ctx:
+            results += run_peers(ctx, count)
+
+    bench.report(results)
+
+
+if Feature.LEGACY_PROTOCOL not in features():
+    log.info("legacy protocol is not supported, skipping benchmark")
+    sys.exit(EXIT_SKIP)
+
+run_benchmarks()
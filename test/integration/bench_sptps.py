@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+"""Benchmark the SPTPS record layer with sptps_test under simulated network damage.
+
+Each scenario (packet loss, reordering or duplication) is measured in datagram
+mode with several replay window sizes, along with stream mode as a baseline.
+Besides goodput and handshake time, results count how often sptps_check_seqno()
+dropped late, replayed or far-future packets, or gave up and resynchronized.
+
+Uniform loss alone barely exercises the window: it only matters when a burst
+of losses is longer than the window. Reordering by more packets than the window
+covers makes packets late, and duplicates are only caught while the window is
+enabled.
+"""
+
+import os
+import typing as T
+
+from testlib import bench, path
+from testlib.log import log
+from testlib.sptps import Impairment, Keypair, transfer
+
+# How much data to send in each measurement, in bytes
+SIZE = int(os.getenv("BENCH_SIZE", str(8 << 20)))
+
+# Datagram records per second (about 115 Mbit/s), low enough for the relay
+# and the receiver to keep up, so that only simulated damage affects the results
+RATE = float(os.getenv("BENCH_RATE", "10000"))
+
+# (name, packet loss in percent applied on receipt by both sides, damage)
+SCENARIOS = (
+    ("clean", 0, Impairment()),
+    ("loss 5%", 5, Impairment()),
+    ("loss 50%", 50, Impairment()),
+    ("reorder 1% by 16", 0, Impairment(reorder=1, distance=16)),
+    ("reorder 1% by 64", 0, Impairment(reorder=1, distance=64)),
+    ("reorder 1% by 256", 0, Impairment(reorder=1, distance=256)),
+    ("duplicate 1%", 0, Impairment(duplicate=1)),
+)
+
+# Replay window sizes in bytes (each byte covers 8 packets). 0 disables the
+# window, 16 is the default (ReplayWindow in tinc.conf).
+REPLAY_WINDOWS = (0, 1, 4, 16, 64)
+
+
+def make_payload() -> str:
+    """Write SIZE random bytes to a file and return its path. sptps_test
+    treats reads starting with '*' or '!' specially, so these are avoided.
+    """
+    result = os.path.join(path.TEST_WD, "payload")
+    table = bytes.maketrans(b"*!", b"+#")
+    with open(result, "wb") as f:
+        f.write(os.urandom(SIZE).translate(table))
+    return result
+
+
+def measure(
+    server: Keypair, client: Keypair, data: str, **kwargs: T.Any
+) -> bench.Result:
+    """Run one transfer. Failures are reported instead of raised."""
+    impair = kwargs.get("impair") or Impairment()
+    result: bench.Result = {
+        "mode": "datagram" if kwargs.get("datagram") else "stream",
+        "loss": kwargs.get("loss", 0),
+        **impair._asdict(),
+        "replay_window": kwargs.get("replay_window"),
+        "rate": kwargs.get("rate"),
+    }
+    try:
+        result.update(transfer(server, client, data, **kwargs))
+    except RuntimeError as ex:
+        log.error("transfer %s failed", result, exc_info=ex)
+        result["error"] = str(ex)
+    return result
+
+
+def run_benchmarks() -> None:
+    """Run all combinations and save results."""
+    server, client = Keypair("server"), Keypair("client")
+    data = make_payload()
+
+    results = [measure(server, client, data)]
+    for name, loss, impair in SCENARIOS:
+        for window in REPLAY_WINDOWS:
+            kwargs = {
+                "datagram": True,
+                "loss": loss,
+                "impair": impair,
+                "replay_window": window,
+                "rate": RATE,
+            }
+            result = measure(server, client, data, **kwargs)
+            results.append({"scenario": name, **result})
+
+    bench.report(results)
+
+
+run_benchmarks()
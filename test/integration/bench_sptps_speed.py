@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+"""Track crypto performance of the current build with sptps_speed.
+
+Ed25519, ECDH and SPTPS results are compared with a baseline kept for each
+crypto backend (openssl, gcrypt or nolegacy), and the benchmark fails if any of
+them got slower by more than BENCH_THRESHOLD percent. If there is no baseline
+for the backend yet, or BENCH_UPDATE_BASELINE is set, results are saved as the
+new baseline instead.
+"""
+
+import os
+import sys
+import json
+import subprocess as subp
+
+from testlib import bench, path
+from testlib.const import EXIT_SKIP
+from testlib.log import log
+
+# How long to run each measurement, in seconds of CPU time
+DURATION = bench.duration(2)
+
+# SPTPS record sizes in bytes: small packets, full VPN packets and meta connection bursts
+RECORD_SIZES = os.getenv("BENCH_RECORD_SIZES", "64,1451,16384")
+
+
+def run_sptps_speed() -> bench.Result:
+    """Run sptps_speed and return its parsed output."""
+    cmd = [
+        path.SPTPS_SPEED_PATH,
+        "--json",
+        "--record-size",
+        RECORD_SIZES,
+        str(DURATION),
+    ]
+    log.info('running "%s"', cmd)
+    proc = subp.run(cmd, stdout=subp.PIPE, check=True, encoding="utf-8")
+    return json.loads(proc.stdout)
+
+
+def to_metrics(output: bench.Result) -> bench.Metrics:
+    """Convert sptps_speed results to metrics keyed by name and record size."""
+    metrics: bench.Metrics = {}
+    for result in output["results"]:
+        name = result["name"]
+        if "record_size" in result:
+            name = f"{name}/{result['record_size']}"
+        metrics[name] = result["value"]
+    return metrics
+
+
+def run_benchmark() -> None:
+    """Measure, compare with the baseline and save results."""
+    output = run_sptps_speed()
+    crypto = output["crypto"]
+    metrics = to_metrics(output)
+
+    baseline = bench.load_baseline(crypto)
+    slower = bench.regressions(baseline, metrics) if baseline else []
+
+    bench.report(
+        [
+            {
+                "crypto": crypto,
+                "duration": output["duration"],
+                "metrics": metrics,
+                "baseline": baseline,
+                "regressions": slower,
+            }
+        ]
+    )
+
+    if baseline is None or os.getenv("BENCH_UPDATE_BASELINE"):
+        bench.save_baseline(crypto, metrics)
+    elif slower:
+        for reg in slower:
+            log.error("%s regressed by %.1f%%", reg["metric"], -reg["change"])
+        raise RuntimeError(f"{len(slower)} {crypto} metrics regressed")
+
+
+if not path.SPTPS_SPEED_PATH:
+    log.info("sptps_speed is not available, skipping")
+    sys.exit(EXIT_SKIP)
+
+run_benchmark()
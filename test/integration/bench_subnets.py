@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+"""Benchmark routing of packets to a node that owns many subnets.
+
+foo owns 10.0.0.0/8 and up to BENCH_SUBNETS /24 networks inside it. bar routes
+all of 10.0.0.0/8 into the tunnel, and sends small datagrams either to a single
+address, which is answered from the subnet lookup cache, or to many different
+addresses, which makes most packets miss the cache and go through the full
+lookup. Nothing receives them on foo's side, so throughput is taken from bar's
+traffic counters, together with CPU time bar spent per routed packet.
+
+Results include how long it took bar to learn all subnets of foo.
+"""
+
+import os
+import time
+import typing as T
+
+from testlib import bench, external as ext, traffic
+from testlib.log import log
+from testlib.proc import Tinc
+from testlib.test import Test
+from testlib.tunnel import Tunnel, cpu_seconds, require_netns
+
+# How long to send data in each measurement, in seconds
+DURATION = bench.duration(2)
+
+# Largest number of subnets to load into foo (at most 65536)
+SUBNETS = int(os.getenv("BENCH_SUBNETS", "50000"))
+
+# Network that contains all subnets of foo
+NETWORK = "10.0.0.0/8"
+
+# Destinations used to miss the lookup cache: many more than it has slots by default
+SPREAD = 1 << 18
+
+# How long to wait for bar to learn all subnets of foo
+LOAD_TIMEOUT = 120.0
+
+
+def add_subnets(node: Tinc, count: int) -> None:
+    """Add NETWORK and count /24 networks inside it to the host config of node.
+    Running `tinc add Subnet` for each of them rescans the whole file every time,
+    which takes minutes for tens of thousands of subnets, so only the first one
+    is added through tinc and the rest is written directly.
+    """
+    node.cmd("add", "Subnet", NETWORK)
+    with open(node.sub("hosts", node.name), "a", encoding="utf-8") as f:
+        for i in range(count):
+            f.write(f"Subnet = 10.{i >> 8 & 255}.{i & 255}.0/24\n")
+
+
+def wait_subnets(node: Tinc, owner: Tinc, count: int) -> None:
+    """Wait until node knows at least count subnets of owner."""
+    deadline = time.monotonic() + LOAD_TIMEOUT
+    while True:
+        known = sum(1 for s in node.control.dump_subnets() if s.owner == owner.name)
+        if known >= count:
+            return
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{node} learned only {known} of {count} subnets")
+        time.sleep(0.5)
+
+
+def forwarded_packets(node: Tinc, peer: Tinc) -> int:
+    """Number of packets node has sent to peer so far."""
+    for rec in node.control.dump_traffic():
+        if rec.name == peer.name:
+            return rec.out_packets
+    return 0
+
+
+def run_pattern(tunnel: Tunnel, subnets: int, destinations: int) -> bench.Result:
+    """Spray datagrams over the number of destinations and describe how many got routed."""
+    result: bench.Result = {"subnets": subnets, "destinations": destinations}
+    bar, foo = tunnel.bar, tunnel.foo
+
+    packets = forwarded_packets(bar, foo)
+    cpu = cpu_seconds(bar.pid)
+    start = time.monotonic()
+
+    try:
+        traffic.spray(bar.name, "10.0.0.1", destinations, step=64, duration=DURATION)
+    except RuntimeError as ex:
+        log.error("sending to %d destinations failed", destinations, exc_info=ex)
+        result["error"] = str(ex)
+        return result
+
+    seconds = time.monotonic() - start
+    cpu = cpu_seconds(bar.pid) - cpu
+    packets = forwarded_packets(bar, foo) - packets
+
+    result.update(
+        {
+            "packets_per_second": packets / seconds,
+            "cpu_microseconds_per_packet": cpu / packets * 1e6 if packets else None,
+        }
+    )
+    log.info("%s", result)
+    return result
+
+
+def run_case(ctx: Test, subnets: int) -> T.List[bench.Result]:
+    """Load the number of subnets into foo, and measure routing to them from bar."""
+    log.info("benchmarking %d subnets", subnets)
+    tunnel = Tunnel(ctx)
+    add_subnets(tunnel.foo, subnets)
+
+    start = time.monotonic()
+    tunnel.start()
+    wait_subnets(tunnel.bar, tunnel.foo, subnets + 2)
+    load_seconds = time.monotonic() - start
+
+    ext.netns_exec(
+        tunnel.bar.name, "ip", "route", "add", NETWORK, "dev", tunnel.bar.name
+    )
+
+    results = [run_pattern(tunnel, subnets, n) for n in (1, SPREAD)]
+    for result in results:
+        result["load_seconds"] = load_seconds
+
+    tunnel.stop()
+    return results
+
+
+def to_metrics(results: T.List[bench.Result]) -> bench.Metrics:
+    """Extract metrics where higher values are better from successful results."""
+    metrics: bench.Metrics = {}
+    for result in results:
+        if result.get("error"):
+            continue
+        case = f"{result['subnets']}/{result['destinations']}"
+        metrics[f"{case}/packets_per_second"] = result["packets_per_second"]
+        if result["cpu_microseconds_per_packet"]:
+            per_cpu = 1e6 / result["cpu_microseconds_per_packet"]
+            metrics[f"{case}/packets_per_cpu_second"] = per_cpu
+    return metrics
+
+
+def run_benchmarks() -> None:
+    """Measure routing with few and many subnets, and save results."""
+    results: T.List[bench.Result] = []
+
+    for subnets in sorted({1, min(1000, SUBNETS), SUBNETS}):
+        with Test(f"{subnets} subnets") as ctx:
+            results += run_case(ctx, subnets)
+
+    metrics = to_metrics(results)
+    baseline = bench.load_baseline("subnets")
+
+    if baseline:
+        changes = bench.changes(baseline, metrics)
+        for result in results:
+            case = f"{result['subnets']}/{result['destinations']}/"
+            result["change_percent"] = {
+                name[len(case) :]: change
+                for name, change in changes.items()
+                if name.startswith(case)
+            }
+
+    bench.report(results)
+
+    if baseline is None or os.getenv("BENCH_UPDATE_BASELINE"):
+        bench.save_baseline("subnets", metrics)
+
+
+require_netns()
+run_benchmarks()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+"""Benchmark data plane throughput between two nodes in network namespaces."""
+
+import typing as T
+
+from testlib import bench
+from testlib.proc import Feature, features
+from testlib.tunnel import benchmark, require_netns
+
+# (digest, cipher) pairs for the legacy protocol, same as in algorithms.py
+LEGACY_ALGORITHMS = [
+    (digest, cipher)
+    for digest in ("none", "sha256", "sha512")
+    for cipher in ("none", "aes-256-cbc")
+]
+
+# Compression levels supported by each feature
+COMPRESSION = (
+    (Feature.COMP_ZLIB, range(1, 10)),
+    (Feature.COMP_LZO, range(10, 12)),
+    (Feature.COMP_LZ4, range(12, 13)),
+)
+
+
+def get_cases(available: T.Container[Feature]) -> T.List[T.Tuple[str, str]]:
+    """Get (name, tinc script) for each configuration to benchmark."""
+    cases = [("sptps", "set ExperimentalProtocol yes")]
+
+    if Feature.LEGACY_PROTOCOL in available:
+        for digest, cipher in LEGACY_ALGORITHMS:
+            config = f"""
+                set ExperimentalProtocol no
+                set Digest {digest}
+                set Cipher {cipher}
+            """
+            cases.append((f"legacy {cipher}/{digest}", config))
+
+    for feature, levels in COMPRESSION:
+        if feature in available:
+            for level in levels:
+                cases.append((f"sptps compression {level}", f"set Compression {level}"))
+
+    return cases
+
+
+require_netns()
+benchmark(
+    "data plane throughput",
+    (({"case": name}, config) for name, config in get_cases(features())),
+    duration=bench.duration(1),
+)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+"""Benchmark a tunnel under emulated WAN conditions.
+
+Nodes use fd devices (see testlib.fd_tunnel), and all traffic between them goes
+through the relay from testlib.relay, which adds delay, loss, reordering or a
+bandwidth cap, so the benchmark needs no root. For each profile it measures:
+
+    startup_seconds     time until path MTU discovery finishes (or until the
+                        tunnel is up, for profiles where UDP never works)
+    saturated           throughput when sending as fast as tincd takes packets
+    probing             one-way latency and loss at a fixed packet rate
+
+The relay runs in Python, so absolute throughput is limited by it. Compare
+profiles with each other rather than with other benchmarks.
+"""
+
+import time
+import typing as T
+
+from testlib import bench, traffic
+from testlib.fd_tunnel import FdTunnel
+from testlib.log import log
+from testlib.relay import Impairment, Relay
+from testlib.test import Test
+
+# How long to send data in each measurement, in seconds
+DURATION = bench.duration(2)
+
+# IPv4 packet size in bytes
+SIZE = 1400
+
+# Packets per second sent to measure latency
+RATE = 200
+
+# (name, conditions of the link, wait for UDP before measuring)
+PROFILES = (
+    ("lan", Impairment(), True),
+    ("wan", Impairment(delay=0.025, jitter=0.002), True),
+    ("lossy", Impairment(delay=0.025, loss=0.01), True),
+    ("reordering", Impairment(delay=0.025, reorder=0.05), True),
+    ("capped", Impairment(delay=0.025, rate=1.25e6), True),
+    ("udp blocked", Impairment(delay=0.025, loss=1.0), False),
+)
+
+
+def measure(tunnel: FdTunnel, rate: int) -> bench.Result:
+    """Send packets from bar to foo. Failures are reported instead of raised."""
+    foo, bar = tunnel.nodes
+    try:
+        sent, received = traffic.inject(
+            tunnel.devices[bar.name].fileno(),
+            tunnel.devices[foo.name].fileno(),
+            bar.address,
+            foo.address,
+            rate=rate,
+            duration=DURATION,
+            size=SIZE,
+        )
+    except RuntimeError as ex:
+        log.error("measurement at rate %d failed", rate, exc_info=ex)
+        return {"error": str(ex)}
+
+    packets = received["packets"]
+    return {
+        "mbit_per_second": received["mbit_per_second"],
+        "packets_per_second": received["packets_per_second"],
+        "loss": 1 - packets / sent["packets"] if sent["packets"] else None,
+        "reordered": received["reordered"],
+        "latency_us": received["latency_us"],
+    }
+
+
+def run_profile(
+    ctx: Test, name: str, impairment: Impairment, warm_up: bool
+) -> bench.Result:
+    """Start a tunnel through a relay with the impairment, and measure it."""
+    log.info('benchmarking profile "%s": %s', name, impairment)
+    result: bench.Result = {"profile": name, "impairment": impairment._asdict()}
+
+    with Relay(impairment, seed=0) as relay:
+        tunnel = FdTunnel(ctx, relay=relay)
+        start = time.monotonic()
+        tunnel.start(warm_up=warm_up)
+
+        result.update(
+            {
+                "startup_seconds": time.monotonic() - start,
+                "udp_ready": tunnel.udp_ready,
+                "saturated": measure(tunnel, 0),
+                "probing": measure(tunnel, RATE),
+                "relay": relay.stats(),
+            }
+        )
+        tunnel.stop()
+
+    log.info("%s", result)
+    return result
+
+
+def run_benchmarks() -> None:
+    """Measure all profiles and save results."""
+    results: T.List[bench.Result] = []
+
+    with Test("WAN profiles") as ctx:
+        for name, impairment, warm_up in PROFILES:
+            results.append(run_profile(ctx, name, impairment, warm_up))
+
+    bench.report(results)
+
+
+run_benchmarks()
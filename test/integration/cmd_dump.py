@@ -27,6 +27,7 @@ ONLINE_REQUESTS = (
     ("graph",),
     ("nodes",),
     ("reachable", "nodes"),
+    ("subnet-cache",),
     ("subnets",),
 )
 
@@ -90,6 +91,12 @@ def run_unconnected_tests(foo: Tinc, bar: Tinc) -> None:
     for sub in SUBNETS_FOO:
         check.is_in(sub, out)
 
+    log.info("dump subnet cache statistics")
+    out, _ = foo.cmd("dump", "subnet-cache")
+    check.lines(out, 3)
+    for kind in "mac", "ipv4", "ipv6":
+        check.is_in(f"{kind} size ", out)
+
     log.info("dump unconnected connections")
     out, _ = foo.cmd("dump", "connections")
     check.lines(out, 1)
@@ -9,10 +9,10 @@ import typing as T
 from testlib import check
 from testlib.const import RUN_ACCESS_CHECKS
 from testlib.log import log
-from testlib.proc import Tinc, Feature
+from testlib.proc import Tinc, Feature, features
 from testlib.util import read_text, read_lines, write_lines, append_line, write_text
 
-RUN_LEGACY_CHECKS = Feature.LEGACY_PROTOCOL in Tinc().features
+RUN_LEGACY_CHECKS = Feature.LEGACY_PROTOCOL in features()
 RUN_EXECUTABILITY_CHECKS = os.name != "nt"
 RUN_PERMISSION_CHECKS = RUN_EXECUTABILITY_CHECKS
 
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+"""Test the control socket client against `tinc dump`."""
+
+import time
+
+from testlib import check, cmd
+from testlib.control import Control, NodeStatus
+from testlib.log import log
+from testlib.proc import Tinc
+from testlib.test import Test
+
+SUBNET_FOO = "10.0.0.0/16"
+SUBNET_BAR = "10.1.0.0/16"
+
+# Number of requests used to compare the client with running tinc
+REQUESTS = 20
+
+
+def dump(node: Tinc, *what: str) -> list:
+    """Run `tinc dump` and split its output into lines of fields."""
+    out, _ = node.cmd("dump", *what)
+    return [line.split() for line in out.splitlines()]
+
+
+def test_dump(foo: Tinc, bar: Tinc) -> None:
+    """Compare records returned by the client with the output of `tinc dump`."""
+    ctl = foo.control
+
+    log.info("dump nodes")
+    nodes = {node.name: node for node in ctl.dump_nodes()}
+    check.equals({foo.name, bar.name}, set(nodes))
+    check.equals(foo.pid, ctl.pid)
+    for node in nodes.values():
+        check.true(node.reachable)
+        check.true(NodeStatus.SPTPS in node.status)
+    check.equals(
+        sorted(row[0] for row in dump(foo, "reachable", "nodes")),
+        sorted(n.name for n in ctl.dump_reachable_nodes()),
+    )
+    check.equals(bar.name, nodes[bar.name].nexthop)
+
+    log.info("dump edges")
+    edges = {(e.src, e.dst) for e in ctl.dump_edges()}
+    check.equals({(foo.name, bar.name), (bar.name, foo.name)}, edges)
+    check.equals(len(dump(foo, "edges")), len(edges))
+
+    log.info("dump subnets")
+    subnets = {(s.subnet, s.owner) for s in ctl.dump_subnets()}
+    check.is_in((SUBNET_FOO, foo.name), subnets)
+    check.is_in((SUBNET_BAR, bar.name), subnets)
+    check.equals(len(dump(foo, "subnets")), len(subnets))
+
+    log.info("dump connections")
+    names = [c.name for c in ctl.dump_connections()]
+    check.is_in(bar.name, names)
+    check.is_in("<control>", names)
+
+    log.info("dump traffic")
+    traffic = {t.name for t in ctl.dump_traffic()}
+    check.equals({foo.name, bar.name}, traffic)
+
+
+def test_log(foo: Tinc) -> None:
+    """Receive log messages through a separate control connection."""
+    messages = foo.control.log(timeout=5)
+    foo.cmd("reload")
+    for message in messages:
+        log.info('received log message "%s"', message)
+        if "reload" in message:
+            break
+    messages.close()
+
+
+def test_restart(foo: Tinc) -> None:
+    """Persistent connection must survive daemon restart."""
+    old_pid = foo.control.pid
+    foo.cmd("stop")
+    foo.start()
+    check.nodes(foo, 1)
+    check.equals(foo.pid, foo.control.pid)
+    check.not_in(old_pid, (foo.control.pid,))
+
+
+def test_speed(foo: Tinc) -> None:
+    """Compare request time with running tinc for each query."""
+    start = time.monotonic()
+    for _ in range(REQUESTS):
+        foo.cmd("dump", "reachable", "nodes")
+    spent_tinc = time.monotonic() - start
+
+    start = time.monotonic()
+    for _ in range(REQUESTS):
+        foo.control.dump_reachable_nodes()
+    spent_ctl = time.monotonic() - start
+
+    log.info(
+        "%d requests: tinc %f s, control socket %f s", REQUESTS, spent_tinc, spent_ctl
+    )
+    check.greater(spent_tinc, spent_ctl)
+
+
+def test_stopped(ctx: Test) -> None:
+    """Requests must fail if tincd is not running."""
+    foo = ctx.node(init=True, fast=True)
+    with Control(foo.pid_file) as ctl:
+        try:
+            ctl.dump_nodes()
+            raise RuntimeError("request to stopped tincd succeeded")
+        except OSError:
+            pass
+
+
+with Test("control socket client") as context:
+    foo_node = context.node(init=f"add Subnet {SUBNET_FOO}", fast=True)
+    bar_node = context.node(init=f"add Subnet {SUBNET_BAR}", fast=True)
+    cmd.connect(foo_node, bar_node)
+
+    test_dump(foo_node, bar_node)
+    test_log(foo_node)
+    test_speed(foo_node)
+    test_restart(foo_node)
+
+with Test("stopped daemon") as context:
+    test_stopped(context)
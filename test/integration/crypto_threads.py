@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+"""Test encryption and decryption of packets on worker threads (CryptoThreads)."""
+
+import sys
+
+from testlib import check, traffic
+from testlib.const import EXIT_SKIP
+from testlib.log import log
+from testlib.proc import Feature, features
+from testlib.test import Test
+from testlib.tunnel import Tunnel, require_netns
+
+THREADS = 2
+
+
+def test_invalid_threads(ctx: Test) -> None:
+    """Test that out of range thread counts are rejected."""
+    foo = ctx.node(init=True)
+
+    for threads in -1, 65:
+        log.info("starting with %d threads must fail", threads)
+        opts = ("-o", "DeviceType=dummy", "-o", f"CryptoThreads={threads}")
+        _, err = foo.cmd("start", *opts, code=1)
+        check.is_in("CryptoThreads must be between 0 and 64", err)
+
+
+def test_threads(ctx: Test) -> None:
+    """Test that traffic flows in both directions when packets are handled by threads."""
+    tunnel = Tunnel(ctx, f"set CryptoThreads {THREADS}")
+    tunnel.start()
+    check.true(tunnel.udp_ready)
+
+    for src, dst in (tunnel.bar, tunnel.foo), (tunnel.foo, tunnel.bar):
+        for proto in "tcp", "udp":
+            log.info("sending %s from %s to %s", proto, src, dst)
+            _, received = traffic.measure(
+                proto, src.name, dst.name, dst.address, duration=1, streams=2
+            )
+            check.greater(received["bytes"], 0)
+
+    tunnel.stop()
+
+
+def test_rekey(ctx: Test) -> None:
+    """Test that traffic keeps flowing while keys are renegotiated with records
+    still being encrypted on worker threads."""
+    tunnel = Tunnel(ctx, f"set CryptoThreads {THREADS}\nset KeyExpire 1")
+    tunnel.start()
+
+    _, received = traffic.measure(
+        "udp", tunnel.bar.name, tunnel.foo.name, tunnel.foo.address, duration=3
+    )
+    check.greater(received["bytes"], 0)
+
+    _, received = traffic.measure(
+        "tcp", tunnel.bar.name, tunnel.foo.name, tunnel.foo.address, duration=1
+    )
+    check.greater(received["bytes"], 0)
+
+    tunnel.stop()
+
+
+with Test("invalid CryptoThreads") as context:
+    test_invalid_threads(context)
+
+if Feature.CRYPTO_THREADS not in features():
+    log.info("worker threads are not supported, skipping test")
+    sys.exit(EXIT_SKIP)
+
+require_netns()
+
+with Test("traffic through worker threads") as context:
+    test_threads(context)
+
+with Test("rekey with worker threads") as context:
+    test_rekey(context)
@@ -8,7 +8,8 @@ import tempfile
 import threading
 import time
 
-from testlib import check
+from testlib import check, traffic
+from testlib.fd_tunnel import FdTunnel
 from testlib.log import log
 from testlib.test import Test
 from testlib.proc import Script
@@ -95,5 +96,30 @@ def test_device_fd(ctx: Test) -> None:
     check.in_file(foo_log, "Unknown IP version while reading packet from fd/")
 
 
+def test_fd_tunnel(ctx: Test) -> None:
+    """Test that packets injected into one FD device come out of another."""
+    tunnel = FdTunnel(ctx)
+    tunnel.start()
+    foo, bar = tunnel.nodes
+
+    sent, received = traffic.inject(
+        tunnel.devices[bar.name].fileno(),
+        tunnel.devices[foo.name].fileno(),
+        bar.address,
+        foo.address,
+        rate=200,
+        duration=0.5,
+        size=100,
+    )
+    check.equals(sent["packets"], received["packets"])
+    check.equals(100 * received["packets"], received["bytes"])
+    check.true(received["latency_us"])
+
+    tunnel.stop()
+
+
 with Test("test FD device") as context:
     test_device_fd(context)
+
+with Test("test traffic through FD devices") as context:
+    test_fd_tunnel(context)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+"""Test multi-queue TUN devices (DeviceQueues)."""
+
+import os
+import subprocess as subp
+
+from testlib import check, traffic
+from testlib.external import netns_exec
+from testlib.log import log
+from testlib.proc import Feature, features
+from testlib.test import Test
+from testlib.tunnel import Tunnel, require_netns
+
+QUEUES = 4
+
+
+def test_invalid_queues(ctx: Test) -> None:
+    """Test that out of range queue counts are rejected."""
+    foo = ctx.node(init=True)
+
+    for queues in 0, 17:
+        log.info("starting with %d queues must fail", queues)
+        opts = ("-o", "DeviceType=tun", "-o", f"DeviceQueues={queues}")
+        _, err = foo.cmd("start", *opts, code=1)
+        check.is_in("DeviceQueues must be between 1 and 16", err)
+
+
+def test_queues(ctx: Test, threads: int) -> None:
+    """Test that every queue is created and that traffic flows through them."""
+    tunnel = Tunnel(
+        ctx,
+        os.linesep.join([f"set DeviceQueues {QUEUES}", f"set CryptoThreads {threads}"]),
+    )
+    tunnel.start(warm_up=False)
+
+    for node in tunnel.nodes:
+        log.info("checking queues of %s", node)
+        sysfs = f"/sys/class/net/{node}/queues"
+        proc = netns_exec(node.name, "ls", sysfs, stdout=subp.PIPE, encoding="utf-8")
+        check.success(proc.returncode)
+        for queue in range(QUEUES):
+            check.is_in(f"tx-{queue}", proc.stdout.split())
+        check.not_in(f"tx-{QUEUES}", proc.stdout.split())
+
+    log.info("sending several flows through the tunnel")
+    _, received = traffic.measure(
+        "udp",
+        tunnel.bar.name,
+        tunnel.foo.name,
+        tunnel.foo.address,
+        duration=1,
+        streams=QUEUES,
+    )
+    check.greater(received["packets"], 0)
+
+    tunnel.stop()
+
+
+with Test("invalid DeviceQueues") as context:
+    test_invalid_queues(context)
+
+require_netns()
+
+with Test("multi-queue TUN") as context:
+    test_queues(context, 0)
+
+if Feature.CRYPTO_THREADS in features():
+    with Test("multi-queue TUN read by worker threads") as context:
+        test_queues(context, QUEUES)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+"""Test that features of tinc and tincd are cached between test processes."""
+
+import json
+import os
+import shutil
+import subprocess as subp
+import typing as T
+
+from testlib import check, path
+from testlib.log import log
+from testlib.proc import feature_cache_file, features
+
+# Prints features detected in a separate test process
+PRINT_FEATURES = """
+from testlib.proc import features
+print(*sorted(f.value for f in features()))
+"""
+
+
+def copy_binaries() -> T.Dict[str, str]:
+    """Copy tinc and tincd, so that their cache entries can be changed without
+    affecting tests running at the same time. Returns environment using the copies.
+    """
+    bin_dir = os.path.join(path.TEST_WD, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    env = dict(os.environ, PYTHONPATH=str(path.TEST_SRC_ROOT))
+
+    for var in "TINC_PATH", "TINCD_PATH":
+        copy = os.path.join(bin_dir, os.path.basename(path.env[var] or ""))
+        shutil.copy2(path.env[var] or "", copy)
+        env[var] = copy
+
+    return env
+
+
+def detect(env: T.Dict[str, str]) -> str:
+    """Detect features in a new process, like another test script would."""
+    res = subp.run(
+        [path.PYTHON_PATH, "-c", PRINT_FEATURES],
+        check=True,
+        cwd=path.CWD,
+        env=env,
+        stdout=subp.PIPE,
+        encoding="utf-8",
+    )
+    return res.stdout.strip()
+
+
+def read_cached(binary: str) -> T.Dict[str, T.Any]:
+    """Read the cache entry of binary."""
+    with open(feature_cache_file(binary), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def set_cached(binary: str, tokens: T.List[str]) -> None:
+    """Replace cached features of binary, keeping the rest of its entry."""
+    entry = read_cached(binary)
+    entry["features"] = tokens
+    with open(feature_cache_file(binary), "w", encoding="utf-8") as f:
+        json.dump(entry, f)
+
+
+def test_cache() -> None:
+    """Test that features are reused while binaries don't change."""
+    expected = " ".join(sorted(f.value for f in features()))
+    env = copy_binaries()
+    binaries = [env["TINC_PATH"], env["TINCD_PATH"]]
+
+    log.info("features of new binaries must be detected and cached")
+    check.equals(expected, detect(env))
+    for binary in binaries:
+        check.equals(os.stat(binary).st_mtime_ns, read_cached(binary)["mtime_ns"])
+
+    log.info("other processes must use cached features")
+    for binary in binaries:
+        set_cached(binary, ["watchdog"])
+    check.equals("watchdog watchdog", detect(env))
+
+    log.info("changed binaries must be detected again")
+    for binary in binaries:
+        stat = os.stat(binary)
+        os.utime(binary, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    check.equals(expected, detect(env))
+
+
+test_cache()
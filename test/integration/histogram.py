@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+"""Test the latency histogram used by benchmarks."""
+
+import random
+
+from testlib import check
+from testlib.bench import Histogram, percentile
+
+PRECISION = 7
+
+
+def test_small_values() -> None:
+    """Values below 2**(precision+1) are stored exactly."""
+    values = list(range(2 ** (PRECISION + 1)))
+    hist = Histogram(PRECISION)
+    for value in reversed(values):
+        hist.record(value)
+
+    check.equals(len(values), hist.count)
+    for pct in 0, 1, 25, 50, 90, 99, 99.9, 100:
+        check.equals(percentile(values, pct), float(hist.percentile(pct)))
+
+
+def test_large_values() -> None:
+    """Larger values are stored with relative error below 2**-precision."""
+    rand = random.Random(1)
+    for _ in range(1000):
+        value = rand.randrange(1, 1 << 40)
+        hist = Histogram(PRECISION)
+        hist.record(value)
+        hist.record(value * 4)
+
+        low = hist.percentile(50)
+        check.in_range(low, value, value * (1 + 2**-PRECISION))
+        check.equals(value * 4, hist.percentile(100))
+
+
+def test_summary() -> None:
+    """Exact minimum, maximum and mean are kept regardless of bucketing."""
+    hist = Histogram(PRECISION)
+    hist.record(1000, count=3)
+    hist.record(123456789)
+
+    summary = hist.summary()
+    check.equals(4, summary["count"])
+    check.equals(1000.0, summary["min"])
+    check.equals(123456789.0, summary["max"])
+    check.equals((3000 + 123456789) / 4, summary["mean"])
+    check.equals(123456789, hist.percentile(100))
+
+
+def test_merge() -> None:
+    """Merging gives the same result as recording everything in one histogram."""
+    rand = random.Random(2)
+    values = [rand.randrange(1 << 20) for _ in range(5000)]
+
+    whole, first, second, empty = (Histogram(PRECISION) for _ in range(4))
+    for i, value in enumerate(values):
+        whole.record(value)
+        (first if i % 3 else second).record(value)
+
+    first.merge(second)
+    first.merge(empty)
+    check.equals(whole.summary(), first.summary())
+
+    empty.merge(first)
+    check.equals(whole.summary(), empty.summary())
+
+
+test_small_values()
+test_large_values()
+test_summary()
+test_merge()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+"""Test that nodes initialized without running tinc have valid configuration."""
+
+import time
+
+from testlib import check, cmd, keys
+from testlib.log import log
+from testlib.proc import Feature, features
+from testlib.test import Test
+
+NODES = 100
+
+
+def test_config(ctx: Test) -> None:
+    """Check that variables go into the same files `tinc set` would put them."""
+    foo = ctx.node()
+    foo.init_fast("""
+        set Port 0
+        set Port 12345
+        set DeviceType dummy
+        add Subnet 10.0.0.1
+        add Subnet 10.0.0.2
+        add ConnectTo bar
+        set bar.Address 127.0.0.1
+        """)
+
+    log.info("fsck must find no problems")
+    _, err = foo.cmd("fsck")
+    check.not_in("WARNING", err)
+    check.not_in("ERROR", err)
+
+    check.equals("12345", cmd.get(foo, "Port"))
+    check.equals("dummy", cmd.get(foo, "DeviceType"))
+    check.equals("bar", cmd.get(foo, "ConnectTo"))
+    check.equals("127.0.0.1", cmd.get(foo, "bar.Address"))
+    check.equals(["10.0.0.1", "10.0.0.2"], cmd.get(foo, "Subnet").splitlines())
+    check.in_file(foo.sub("hosts", foo.name), "Subnet = 10.0.0.2")
+    check.not_in_file(foo.sub("tinc.conf"), "Port")
+
+    log.info("unsupported commands must be rejected")
+    try:
+        ctx.node().init_fast("del Subnet")
+        raise RuntimeError("init_fast accepted unsupported command")
+    except ValueError:
+        pass
+
+
+def test_keys_are_unique(ctx: Test) -> None:
+    """Check that nodes get different keys."""
+    foo, bar = ctx.node(init=True, fast=True), ctx.node(init=True, fast=True)
+    pub_foo = cmd.get(foo, f"{foo}.Ed25519PublicKey")
+    pub_bar = cmd.get(bar, f"{bar}.Ed25519PublicKey")
+    check.true(pub_foo)
+    check.true(pub_bar)
+    check.not_in(pub_foo, pub_bar)
+
+
+def test_connect(ctx: Test) -> None:
+    """Check that fast initialized nodes can connect to each other."""
+    foo, bar = ctx.node(init=True, fast=True), ctx.node(init=True, fast=True)
+    cmd.connect(foo, bar)
+    check.nodes(foo, 2)
+    check.nodes(bar, 2)
+
+
+def test_many_nodes(ctx: Test) -> None:
+    """Measure time required to create many nodes."""
+    # Key generation is not what is measured, so do it before starting the clock
+    keys.reserve(NODES, Feature.LEGACY_PROTOCOL in features())
+
+    start = time.monotonic()
+    nodes = [ctx.node(init=True, fast=True) for _ in range(NODES)]
+    log.info("created %d nodes in %f s", len(nodes), time.monotonic() - start)
+
+    for node in nodes[:: NODES // 10]:
+        check.file_exists(node.sub("hosts", node.name))
+        check.file_exists(node.sub("ed25519_key.priv"))
+
+
+with Test("variables are put into correct files") as context:
+    test_config(context)
+
+with Test("nodes get unique keys") as context:
+    test_keys_are_unique(context)
+
+with Test("fast initialized nodes can connect") as context:
+    test_connect(context)
+
+with Test("create many nodes") as context:
+    test_many_nodes(context)
@@ -0,0 +1,12 @@
+#!/usr/bin/env python3
+
+"""Fill the pool of node keys used by Tinc.init_fast() (see testlib.keys).
+
+meson runs this alone before all other tests, so none of them pays for key
+generation. Keys are reused by later runs, which makes this a no-op for them.
+"""
+
+from testlib import keys
+from testlib.proc import Feature, features
+
+keys.fill(keys.POOL_SIZE, Feature.LEGACY_PROTOCOL in features())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+"""Test per-node statistics dumped in binary blocks."""
+
+import sys
+
+from testlib import check, traffic
+from testlib.control import NodePath
+from testlib.const import EXIT_SKIP
+from testlib.log import log
+from testlib.proc import Feature, features
+from testlib.test import Test
+from testlib.tunnel import Tunnel, require_netns
+
+# Enough nodes with long names to need several blocks
+NODES = 300
+
+
+def test_many_nodes(ctx: Test) -> None:
+    """Test that all nodes are dumped, even if they don't fit into one block."""
+    foo = ctx.node(init="set DeviceType dummy")
+    names = [f"{foo.name}_{'x' * 32}_{i:03}" for i in range(NODES)]
+
+    for name in names:
+        with open(foo.sub("hosts", name), "w", encoding="utf-8") as f:
+            f.write("Subnet = 10.0.0.0/8\n")
+
+    foo.start()
+
+    stats = foo.control.dump_node_stats()
+    check.equals(sorted(names + [foo.name]), [s.name for s in stats])
+
+    counters = {rec.name: rec for rec in foo.control.dump_traffic()}
+    for rec in stats:
+        expect = NodePath.MYSELF if rec.name == foo.name else NodePath.UNREACHABLE
+        check.equals(expect, rec.path)
+        check.equals(counters[rec.name].in_packets, rec.in_packets)
+        check.equals(counters[rec.name].out_bytes, rec.out_bytes)
+
+    foo.cmd("stop")
+
+
+def test_tunnel(ctx: Test) -> None:
+    """Test path, traffic and compression statistics of a working tunnel."""
+    tunnel = Tunnel(ctx, "set Compression 9")
+    tunnel.start()
+    foo, bar = tunnel.nodes
+
+    traffic.spray(bar.name, foo.address, 1, duration=0.5, size=1000)
+
+    stats = {rec.name: rec for rec in bar.control.dump_node_stats()}
+    log.info("statistics of %s: %s", foo, stats[foo.name])
+
+    rec = stats[foo.name]
+    check.equals(NodePath.UDP, rec.path)
+    check.greater(rec.mtu, 0)
+    check.greater(rec.out_packets, 0)
+    check.equals(0, rec.in_replayed)
+
+    ratio = rec.compression_ratio
+    assert ratio is not None
+    check.greater(1.0, ratio)
+
+    tunnel.stop()
+
+
+with Test("node statistics in several blocks") as context:
+    test_many_nodes(context)
+
+if Feature.COMP_ZLIB not in features():
+    log.info("zlib compression is not supported, skipping test")
+    sys.exit(EXIT_SKIP)
+
+require_netns()
+
+with Test("node statistics of a tunnel") as context:
+    test_tunnel(context)
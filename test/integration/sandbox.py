@@ -8,6 +8,7 @@ import time
 from testlib import check, cmd, path, util
 from testlib.proc import Tinc, Script
 from testlib.test import Test
+from testlib.parallel import Runner
 from testlib.log import log
 from testlib.feature import HAVE_SANDBOX
 
@@ -123,25 +124,41 @@ def test_exec_proxy_high(ctx: Test) -> None:
     foo.cmd("stop")
 
 
-with Test("all scripts work at level 'off'") as context:
-    test_scripts_work(context, "off")
-
-if HAVE_SANDBOX:
-    with Test("all scripts work at level 'normal'") as context:
-        test_scripts_work(context, "normal")
-
-    with Test("only tinc-up and first subnet-up work at level 'high'") as context:
-        test_high_scripts(context)
+def run_tests() -> None:
+    """Run all tests concurrently."""
+    runner = Runner()
+
+    runner.add("all scripts work at level 'off'", test_scripts_work, "off")
+
+    if HAVE_SANDBOX:
+        runner.add("all scripts work at level 'normal'", test_scripts_work, "normal")
+        runner.add(
+            "only tinc-up and first subnet-up work at level 'high'",
+            test_high_scripts,
+        )
+        runner.add(
+            "tincd does not start with exec proxy and level 'high'",
+            test_exec_proxy_does_not_start_on_high,
+        )
+        runner.add(
+            "tincd does not start with bad sandbox level",
+            test_bad_sandbox_level,
+            "foobar",
+        )
+        runner.add(
+            "exec proxy does not work at level 'high'",
+            test_exec_proxy_high,
+        )
+    else:
+        for lvl in "normal", "high", "foobar":
+            runner.add(
+                f"tincd does not start with bad sandbox level '{lvl}'",
+                test_bad_sandbox_level,
+                lvl,
+            )
 
-    with Test("tincd does not start with exec proxy and level 'high'") as context:
-        test_exec_proxy_does_not_start_on_high(context)
+    runner.run()
 
-    with Test("tincd does not start with bad sandbox level") as context:
-        test_bad_sandbox_level(context, "foobar")
 
-    with Test("exec proxy does not work at level 'high'") as context:
-        test_exec_proxy_high(context)
-else:
-    with Test("tincd does not start with bad sandbox level") as context:
-        for lvl in "normal", "high", "foobar":
-            test_bad_sandbox_level(context, lvl)
+if __name__ == "__main__":
+    run_tests()
@@ -3,6 +3,8 @@
 """Test that all tincd scripts execute in correct order and contain expected env vars."""
 
 import os
+import asyncio
+import subprocess as subp
 import typing as T
 
 from testlib import check, path
@@ -19,6 +21,16 @@ NETNAMES = {
     "client": "net_" + random_string(8),
 }
 
+# Modules of testlib which tincd scripts load if they don't need Tinc
+RUNTIME_MODULES = "testlib testlib.event testlib.runtime"
+
+# Runs in a separate interpreter to check side effects of importing the runtime
+RUNTIME_IMPORT = """
+import sys, threading
+import testlib.runtime
+print(threading.active_count(), *sorted(m for m in sys.modules if m.startswith('testlib')))
+"""
+
 # Creation time for the last notification event we've received.
 # Used for checking that scripts are called in the correct order.
 # dict is to avoid angering linters by using `global` to update this value.
@@ -243,9 +255,74 @@ def run_script_interpreter_test(ctx: Test) -> None:
     foo.cmd("stop")
 
 
+async def wait_nodes_async(nodes: T.List[Tinc]) -> None:
+    """Wait for tinc-up from all nodes concurrently, then for tinc-down from any."""
+    up = [node[Script.TINC_UP] for node in nodes]
+    for msg in await asyncio.gather(*(script.wait_async(10) for script in up)):
+        assert msg
+        check.false(msg.error)
+
+    nodes[-1].cmd("stop")
+    down = [node[Script.TINC_DOWN] for node in nodes]
+    res = await TincScript.wait_any(*down, timeout=10)
+    assert res
+    check.equals(down[-1], res[0])
+
+    log.info("other scripts must not be reported")
+    check.false(await TincScript.wait_any(*down, timeout=0.1))
+
+
+def run_async_wait_test(ctx: Test) -> None:
+    """Check that notifications from many nodes can be awaited concurrently."""
+    nodes = [ctx.node(init=True) for _ in range(4)]
+    for node in nodes:
+        node.add_script(Script.TINC_UP)
+        node.add_script(Script.TINC_DOWN)
+        node.cmd("start")
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(wait_nodes_async(nodes))
+    finally:
+        loop.close()
+
+
+def run_runtime_test(ctx: Test) -> None:
+    """Check that scripts only load the lightweight runtime, and that importing
+    it does not start threads or pull in the rest of testlib.
+    """
+    res = subp.run(
+        [path.PYTHON_PATH, "-c", RUNTIME_IMPORT],
+        cwd=path.TEST_SRC_ROOT,
+        check=True,
+        stdout=subp.PIPE,
+        encoding="utf-8",
+    )
+    check.equals(f"1 {RUNTIME_MODULES}", res.stdout.strip())
+
+    foo = ctx.node(init="set DeviceType dummy")
+    source = """
+    modules = (m for m in sys.modules if m.startswith('testlib'))
+    os.environ['TESTLIB_MODULES'] = ' '.join(sorted(modules))
+    """
+    foo_up = foo.add_script(Script.TINC_UP, source)
+    foo.cmd("start")
+
+    msg = foo_up.wait()
+    check.false(msg.error)
+    check.equals(RUNTIME_MODULES, msg.env["TESTLIB_MODULES"])
+    foo.cmd("stop")
+
+
 with Test("scripts test") as context:
     run_tests(context)
 
 if os.name != "nt":
     with Test("works with ScriptInterpreter") as context:
         run_script_interpreter_test(context)
+
+with Test("await notifications from many nodes") as context:
+    run_async_wait_test(context)
+
+with Test("lightweight script runtime") as context:
+    run_runtime_test(context)
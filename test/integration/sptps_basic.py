@@ -2,28 +2,16 @@
 
 """Test basic SPTPS features."""
 
-import os
 import subprocess as subp
 import re
 
 from testlib import path, util, check
 from testlib.log import log
+from testlib.sptps import Keypair
 
 port_re = re.compile(r"Listening on (\d+)\.\.\.")
 
 
-class Keypair:
-    """Create public/private keypair using sptps_keypair."""
-
-    private: str
-    public: str
-
-    def __init__(self, name: str) -> None:
-        self.private = os.path.join(path.TEST_WD, f"{name}.priv")
-        self.public = os.path.join(path.TEST_WD, f"{name}.pub")
-        subp.run([path.SPTPS_KEYPAIR_PATH, self.private, self.public], check=True)
-
-
 log.info("generate keys")
 server_key = Keypair("server")
 client_key = Keypair("client")
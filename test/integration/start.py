@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+"""Test that Tinc.start() reports correct ports and pids for many nodes."""
+
+import time
+
+from testlib import check, cmd
+from testlib.log import log
+from testlib.script import Script
+from testlib.test import Test
+
+NODES = 20
+
+
+def test_start(ctx: Test) -> None:
+    """Start one node and check what it reports."""
+    foo = ctx.node(init=True, fast=True)
+    foo.add_script(Script.TINC_UP)
+
+    port = foo.start()
+    check.equals(port, foo.port)
+    check.equals(str(port), cmd.get(foo, "Port"))
+
+    out, _ = foo.cmd("pid")
+    check.equals(str(foo.pid), out.strip())
+
+    log.info("restart must update port and consume tinc-up notification")
+    foo.cmd("stop")
+    check.equals(port, foo.start())
+    check.false(foo[Script.TINC_UP].wait(timeout=0.5))
+
+
+def test_start_many(ctx: Test) -> None:
+    """Start many nodes concurrently."""
+    nodes = [ctx.node(init=True, fast=True) for _ in range(NODES)]
+
+    start = time.monotonic()
+    ports = cmd.start_all(nodes)
+    log.info("started %d nodes in %f s", NODES, time.monotonic() - start)
+
+    check.equals(NODES, len(set(ports)))
+    check.equals(NODES, len({node.pid for node in nodes}))
+
+    for node, port in zip(nodes, ports):
+        check.equals(str(port), cmd.get(node, "Port"))
+
+
+with Test("start a single node") as context:
+    test_start(context)
+
+with Test("start many nodes") as context:
+    test_start_many(context)
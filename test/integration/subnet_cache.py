@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""Test sizing, statistics and invalidation of the subnet lookup cache."""
+
+import time
+
+from testlib import check, traffic
+from testlib.log import log
+from testlib.proc import Tinc
+from testlib.test import Test
+from testlib.tunnel import Tunnel, require_netns
+
+# How long to wait for a node to learn a subnet of its peer
+SUBNET_TIMEOUT = 10.0
+
+
+def test_invalid_size(ctx: Test) -> None:
+    """Test that out of range cache sizes are rejected."""
+    foo = ctx.node(init=True)
+
+    for size in -1, 0x1000001:
+        log.info("starting with cache size %d must fail", size)
+        opts = ("-o", "DeviceType=dummy", "-o", f"SubnetCacheSize={size}")
+        _, err = foo.cmd("start", *opts, code=1)
+        check.is_in("SubnetCacheSize must be between 0 and 16777216", err)
+
+
+def test_size(ctx: Test) -> None:
+    """Test that the cache size is rounded up, and can be changed on reload."""
+    foo = ctx.node(init="set DeviceType dummy\nset SubnetCacheSize 1000")
+    foo.start()
+
+    caches = foo.control.dump_subnet_cache()
+    check.equals({"mac", "ipv4", "ipv6"}, set(caches))
+    for cache in caches.values():
+        check.equals(1024, cache.size)
+
+    log.info("disable the cache")
+    foo.cmd("set", "SubnetCacheSize", "0")
+    foo.cmd("reload")
+
+    for cache in foo.control.dump_subnet_cache().values():
+        check.equals(0, cache.size)
+        check.equals(0, cache.entries)
+
+    foo.cmd("stop")
+
+
+def add_subnet(owner: Tinc, peer: Tinc, subnet: str) -> None:
+    """Add subnet to a running node, and wait until its peer learns about it."""
+    log.info("add subnet %s to %s", subnet, owner)
+    owner.cmd("add", "Subnet", subnet)
+
+    deadline = time.monotonic() + SUBNET_TIMEOUT
+    while not any(
+        s.subnet.startswith(subnet) and s.owner == owner.name
+        for s in peer.control.dump_subnets()
+    ):
+        check.true(time.monotonic() < deadline)
+        time.sleep(0.1)
+
+
+def test_invalidation(ctx: Test) -> None:
+    """Test that changing a subnet only removes cached lookups it covers."""
+    tunnel = Tunnel(ctx)
+    tunnel.start()
+    foo, bar = tunnel.nodes
+
+    traffic.spray(bar.name, foo.address, 1, duration=0.5)
+    before = bar.control.dump_subnet_cache()["ipv4"]
+    log.info("cache after sending packets: %s", before)
+    check.greater(before.hits, 0)
+    check.greater(before.entries, 0)
+
+    add_subnet(foo, bar, "10.0.0.0/8")
+    after = bar.control.dump_subnet_cache()["ipv4"]
+    log.info("cache after adding an unrelated subnet: %s", after)
+    check.greater(after.flushes, before.flushes)
+    check.equals(before.invalidations, after.invalidations)
+    check.equals(before.entries, after.entries)
+
+    before = after
+    add_subnet(foo, bar, "192.168.0.0/16")
+    after = bar.control.dump_subnet_cache()["ipv4"]
+    log.info("cache after adding a covering subnet: %s", after)
+    check.greater(after.flushes, before.flushes)
+    check.greater(after.invalidations, before.invalidations)
+    check.greater(before.entries, after.entries)
+
+    log.info("resizing the cache must flush it")
+    traffic.spray(bar.name, foo.address, 1, duration=0.5)
+    before = bar.control.dump_subnet_cache()["ipv4"]
+    check.greater(before.entries, 0)
+    bar.cmd("set", "SubnetCacheSize", "2048")
+    bar.cmd("reload")
+    after = bar.control.dump_subnet_cache()["ipv4"]
+    log.info("cache after resizing: %s", after)
+    check.equals(2048, after.size)
+    check.equals(0, after.entries)
+    check.greater(after.flushes, before.flushes)
+
+    tunnel.stop()
+
+
+with Test("invalid SubnetCacheSize") as context:
+    test_invalid_size(context)
+
+with Test("subnet cache size") as context:
+    test_size(context)
+
+require_netns()
+
+with Test("targeted subnet cache invalidation") as context:
+    test_invalidation(context)
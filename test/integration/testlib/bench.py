@@ -0,0 +1,210 @@
+"""Helpers for benchmarks: statistics and machine-readable results."""
+
+import os
+import json
+import math
+import collections
+import typing as T
+
+from . import path
+from .log import log
+
+Num = T.Union[int, float]
+
+# Result of a single benchmark run. Must be serializable to JSON.
+Result = T.Dict[str, T.Any]
+
+# Metric name to value, where higher values are better
+Metrics = T.Dict[str, float]
+
+# How much slower than the baseline a metric may get, in percent
+THRESHOLD = float(os.getenv("BENCH_THRESHOLD", "15"))
+
+
+def duration(default: float) -> float:
+    """How long to send data in each measurement, in seconds. Taken from the
+    BENCH_DURATION environment variable, or default if it's not set.
+    """
+    return float(os.getenv("BENCH_DURATION", str(default)))
+
+
+def percentile(values: T.Sequence[Num], pct: float) -> float:
+    """Return the pct-th percentile (0 to 100) of values using nearest-rank method."""
+    assert values and 0 <= pct <= 100
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return float(ordered[rank - 1])
+
+
+def summary(values: T.Sequence[Num]) -> T.Dict[str, float]:
+    """Describe distribution of values with the most often used statistics."""
+    assert values
+    return {
+        "count": len(values),
+        "min": float(min(values)),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "p99.9": percentile(values, 99.9),
+        "max": float(max(values)),
+    }
+
+
+class Histogram:
+    """Histogram of non-negative integers (like latencies in microseconds) in the
+    style of HdrHistogram: buckets grow exponentially, and each of them is split
+    into 2**precision sub-buckets, so every value is stored with relative error
+    below 2**-precision no matter how large it is, in constant memory per
+    order of magnitude.
+    """
+
+    precision: int
+    count: int
+    total: int
+    min: int
+    max: int
+    _buckets: T.Dict[int, int]
+
+    def __init__(self, precision: int = 7) -> None:
+        assert precision >= 1
+        self.precision = precision
+        self.count = self.total = self.min = self.max = 0
+        self._buckets = collections.defaultdict(int)
+
+    def _shift(self, value: int) -> int:
+        return max(0, value.bit_length() - self.precision - 1)
+
+    def record(self, value: int, count: int = 1) -> None:
+        """Add value to the histogram count times."""
+        assert value >= 0 and count > 0
+        shift = self._shift(value)
+        self._buckets[(value >> shift) << shift] += count
+
+        self.min = value if not self.count else min(self.min, value)
+        self.max = max(self.max, value)
+        self.count += count
+        self.total += value * count
+
+    def merge(self, other: "Histogram") -> None:
+        """Add all values recorded by another histogram with the same precision."""
+        assert self.precision == other.precision
+        if not other.count:
+            return
+        for low, count in other._buckets.items():  # pylint: disable=protected-access
+            self._buckets[low] += count
+        self.min = other.min if not self.count else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(self, pct: float) -> int:
+        """Return the highest value equivalent (within precision) to the pct-th
+        percentile (0 to 100), never exceeding the largest recorded value.
+        """
+        assert self.count and 0 <= pct <= 100
+        rank = max(1, math.ceil(pct / 100 * self.count))
+        seen = 0
+        for low in sorted(self._buckets):
+            seen += self._buckets[low]
+            if seen >= rank:
+                return min(low + (1 << self._shift(low)) - 1, self.max)
+        return self.max
+
+    def summary(self) -> T.Dict[str, float]:
+        """Describe the distribution with the same statistics as summary()."""
+        assert self.count
+        return {
+            "count": self.count,
+            "min": float(self.min),
+            "mean": self.total / self.count,
+            "p50": float(self.percentile(50)),
+            "p90": float(self.percentile(90)),
+            "p99": float(self.percentile(99)),
+            "p99.9": float(self.percentile(99.9)),
+            "max": float(self.max),
+        }
+
+
+def report(results: T.List[Result]) -> str:
+    """Save benchmark results as JSON. Results go to the file specified in
+    the BENCH_OUTPUT environment variable, or to bench.json in the test working
+    directory. Returns the path to the created file.
+    """
+    out = os.getenv("BENCH_OUTPUT") or os.path.join(path.TEST_WD, "bench.json")
+    text = json.dumps({"test": path.TEST_NAME, "results": results}, indent=2)
+
+    log.info("benchmark results: %s", text)
+    with open(out, "w", encoding="utf-8") as f:
+        f.write(text)
+
+    log.info("benchmark results saved to %s", out)
+    return out
+
+
+def baseline_path() -> str:
+    """Return the path to the baseline file of the current benchmark. It's taken
+    from the BENCH_BASELINE environment variable, or kept in the shared working
+    directory, which survives between runs (but not removal of the build directory).
+    """
+    default = os.path.join(path.BASELINE_DIR, f"{path.TEST_NAME}.json")
+    return os.getenv("BENCH_BASELINE") or default
+
+
+def load_baseline(key: str) -> T.Optional[Metrics]:
+    """Load metrics stored under key (like the build configuration),
+    or None if there are none.
+    """
+    try:
+        with open(baseline_path(), "r", encoding="utf-8") as f:
+            return json.load(f).get(key)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(key: str, metrics: Metrics) -> None:
+    """Store metrics under key, keeping baselines for other keys."""
+    out = baseline_path()
+    try:
+        with open(out, "r", encoding="utf-8") as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {}
+
+    baselines[key] = metrics
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+    log.info("saved baseline %s to %s", key, out)
+
+
+def changes(baseline: Metrics, current: Metrics) -> Metrics:
+    """Return the change of each metric against the baseline, in percent.
+    Metrics missing from either side are ignored.
+    """
+    result: Metrics = {}
+    for name, base in sorted(baseline.items()):
+        value = current.get(name)
+        if value is None or base <= 0:
+            continue
+        result[name] = (value - base) / base * 100
+        log.info("%s: %.2f (baseline %.2f, %+.1f%%)", name, value, base, result[name])
+    return result
+
+
+def regressions(
+    baseline: Metrics, current: Metrics, threshold: float = THRESHOLD
+) -> T.List[Result]:
+    """Return metrics that dropped by more than threshold percent.
+    Metrics missing from either side are ignored.
+    """
+    return [
+        {
+            "metric": name,
+            "baseline": baseline[name],
+            "value": current[name],
+            "change": change,
+        }
+        for name, change in changes(baseline, current).items()
+        if change < -threshold
+    ]
@@ -66,7 +66,7 @@ def greater(value: Num, than: Num) -> None:
 
 def in_range(value: Num, gte: Num, lte: Num) -> None:
     """Check that value lies in the range [min, max]."""
-    if not gte >= value >= lte:
+    if not gte <= value <= lte:
         raise ValueError(f"value {value} must be between {gte} and {lte}")
 
 
@@ -115,8 +115,9 @@ def not_in_file(path: T.Union[str, os.PathLike], text: T.AnyStr) -> None:
 def nodes(node, want_nodes: int) -> None:
     """Check that node can reach exactly N nodes (including itself)."""
     log.debug("want %d reachable nodes from tinc %s", want_nodes, node)
-    stdout, _ = node.cmd("dump", "reachable", "nodes")
-    lines(stdout, want_nodes)
+    reachable = [n.name for n in node.control.dump_reachable_nodes()]
+    if len(reachable) != want_nodes:
+        raise ValueError(f"expected {want_nodes} reachable nodes, got {reachable}")
 
 
 def files_eq(path0: str, path1: str) -> None:
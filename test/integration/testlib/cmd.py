@@ -1,10 +1,16 @@
 """Wrappers for more complicated tinc/tincd commands."""
 
+import os
+import random
 import typing as T
+from enum import Enum
+from concurrent.futures import ThreadPoolExecutor
 
-from . import check
+from . import check, keys
+from .converge import wait_converged, EdgeName
 from .log import log
-from .proc import Tinc
+from .proc import Feature, Tinc, features
+from .test import Test
 
 ExchangeIO = T.Tuple[
     T.Tuple[str, str],
@@ -62,3 +68,226 @@ def get(tinc: Tinc, var: str) -> str:
     assert var
     stdout, _ = tinc.cmd("get", var)
     return stdout.strip()
+
+
+# Maximum number of tinc processes started at the same time by the functions below
+_MAX_JOBS = 32
+
+Val = T.TypeVar("Val")
+
+
+def run_all(nodes: T.Iterable[Tinc], func: T.Callable[[Tinc], Val]) -> T.List[Val]:
+    """Call func on each node concurrently. Since most of the time is spent waiting
+    for tinc processes to finish, this uses a thread pool. Returns the results in
+    the same order as nodes. Exceptions raised by func are propagated.
+    """
+    with ThreadPoolExecutor(max_workers=_MAX_JOBS) as pool:
+        return list(pool.map(func, nodes))
+
+
+def start_all(nodes: T.Iterable[Tinc], *args: str) -> T.List[int]:
+    """Start nodes concurrently with Tinc.start(). Returns their ports."""
+    return run_all(nodes, lambda node: node.start(*args))
+
+
+def _host_config(node: Tinc) -> str:
+    """Return host configuration in the same format as `tinc export`."""
+    with open(node.sub("hosts", node.name), "r", encoding="utf-8") as f:
+        content = f.read()
+    if not content.endswith("\n"):
+        content += "\n"
+    return f"Name = {node.name}\n{content}"
+
+
+def exchange_all(
+    nodes: T.Sequence[Tinc],
+    peers: T.Mapping[str, T.Iterable[Tinc]],
+    direct: bool = False,
+) -> None:
+    """Give each node host configuration files of its peers (peers[node.name]).
+    Runs one `export` and one `import` per node, concurrently, instead of
+    `export | exchange | import` for each pair. If direct is set to True,
+    host files are copied without running tinc at all.
+    """
+    if direct:
+        configs = {node.name: _host_config(node) for node in nodes}
+    else:
+        outputs = run_all(nodes, lambda node: node.cmd("export")[0])
+        configs = {node.name: out for node, out in zip(nodes, outputs)}
+
+    def distribute(node: Tinc) -> None:
+        names = [peer.name for peer in peers.get(node.name, ())]
+        if not names:
+            return
+        if direct:
+            for name in names:
+                _, _, content = configs[name].partition("\n")
+                with open(node.sub("hosts", name), "w", encoding="utf-8") as f:
+                    f.write(content)
+        else:
+            _, err = node.cmd("import", stdin="".join(configs[n] for n in names))
+            check.is_in(f"Imported {len(names)} ", err)
+
+    log.debug("distributing host files between %d nodes", len(nodes))
+    run_all(nodes, distribute)
+
+
+class Topology(Enum):
+    """Shapes of node graphs that Mesh can build."""
+
+    STAR = "star"  # all nodes connect to the first one
+    RING = "ring"  # each node connects to the next one, the last one to the first
+    FULL = "full"  # each node connects to all others
+    RANDOM = "random"  # random connected graph with the specified average degree
+
+
+def make_edges(
+    count: int, shape: Topology, degree: int = 3, seed: T.Optional[int] = None
+) -> T.List[T.Tuple[int, int]]:
+    """Generate (i, j) pairs meaning 'node i has ConnectTo = node j'.
+    Each pair of nodes is connected at most once.
+    """
+    if shape == Topology.STAR:
+        return [(i, 0) for i in range(1, count)]
+
+    if shape == Topology.RING:
+        if count < 3:
+            return [(i, 0) for i in range(1, count)]
+        return [(i, (i + 1) % count) for i in range(count)]
+
+    if shape == Topology.FULL:
+        return [(i, j) for i in range(count) for j in range(i)]
+
+    rng = random.Random(seed)
+
+    # Random spanning tree first to make sure the graph is connected
+    edges = {(i, rng.randrange(i)) for i in range(1, count)}
+    want = min(count * degree // 2, count * (count - 1) // 2)
+
+    while len(edges) < want:
+        i, j = rng.sample(range(count), 2)
+        if (j, i) not in edges:
+            edges.add((i, j))
+
+    return sorted(edges)
+
+
+def _mesh_config(node: Tinc, connect_to: T.List[Tinc], init: str) -> str:
+    """Build the tinc script used to configure a Mesh node."""
+    targets = [f"add ConnectTo {peer}" for peer in connect_to]
+    return os.linesep.join(
+        [
+            f"set Port {node.randomize_port()}",
+            f"set Address {node.address}",
+            "set DeviceType dummy",
+            "set AutoConnect no",
+            *targets,
+            init,
+        ]
+    )
+
+
+class Mesh:
+    """Builder for graphs of many nodes. Creates nodes in the passed test context,
+    configures them to connect to each other in the requested shape, and starts
+    all daemons concurrently.
+
+    Nodes get random fixed ports, so host files are complete before any daemon
+    starts, and AutoConnect is disabled to keep the requested shape. Host files
+    are only given to nodes that are directly connected — keys of other nodes
+    are requested by tincd through the meta protocol.
+    """
+
+    nodes: T.List[Tinc]
+    edges: T.List[T.Tuple[int, int]]
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        ctx: Test,
+        count: int,
+        shape: Topology = Topology.FULL,
+        *,
+        init: str = "",
+        degree: int = 3,
+        seed: T.Optional[int] = None,
+        direct: bool = True,
+        fast: bool = True,
+    ) -> None:
+        """Create and configure count nodes. init is an additional tinc script
+        applied to all nodes. direct is passed to exchange_all(). If fast is
+        True, nodes are initialized with Tinc.init_fast() instead of `tinc init`.
+        """
+        self.nodes = [ctx.node() for _ in range(count)]
+        self.edges = make_edges(count, shape, degree, seed)
+        log.info(
+            "creating %s mesh of %d nodes and %d edges", shape, count, len(self.edges)
+        )
+
+        connect_to: T.Dict[str, T.List[Tinc]] = {node.name: [] for node in self.nodes}
+        peers: T.Dict[str, T.List[Tinc]] = {node.name: [] for node in self.nodes}
+        for src, dst in ((self.nodes[i], self.nodes[j]) for i, j in self.edges):
+            connect_to[src.name].append(dst)
+            peers[src.name].append(dst)
+            peers[dst.name].append(src)
+
+        def configure(node: Tinc) -> None:
+            config = _mesh_config(node, connect_to[node.name], init)
+            if fast:
+                node.init_fast(config)
+            else:
+                node.cmd(stdin=f"init {node}{os.linesep}{config}")
+
+        if fast:
+            # Generate missing keys at once, not one batch after another
+            keys.reserve(count, Feature.LEGACY_PROTOCOL in features())
+
+        run_all(self.nodes, configure)
+        exchange_all(self.nodes, peers, direct)
+
+    def __getitem__(self, index: int) -> Tinc:
+        return self.nodes[index]
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def neighbors(self, index: int) -> T.List[Tinc]:
+        """Return nodes that have a direct connection with the node."""
+        result = [self.nodes[j] for i, j in self.edges if i == index]
+        result += [self.nodes[i] for i, j in self.edges if j == index]
+        return result
+
+    def start(self, wait: bool = True) -> None:
+        """Start all daemons concurrently. If wait is True, block until
+        the graph converges (see wait_converged()).
+        """
+        log.info("starting %d nodes", len(self.nodes))
+        start_all(self.nodes)
+
+        # `tinc start` returns after the daemon is listening, so all connections
+        # can be retried right away instead of waiting for reconnection timeouts
+        # of attempts made before their peers were ready.
+        run_all(self.nodes, lambda node: node.control.retry())
+
+        if wait:
+            self.wait_converged()
+
+    @property
+    def edge_names(self) -> T.Set[EdgeName]:
+        """Edges of the mesh as tincd reports them: by node name, in both directions."""
+        names = set()
+        for i, j in self.edges:
+            src, dst = self.nodes[i].name, self.nodes[j].name
+            names |= {(src, dst), (dst, src)}
+        return names
+
+    def wait_converged(
+        self, timeout: float = 30.0, since: T.Optional[float] = None
+    ) -> T.Dict[str, float]:
+        """Wait until every node sees all nodes and edges of the mesh.
+        Returns time each node took to converge (see converge.wait_converged).
+        """
+        return wait_converged(self.nodes, timeout, self.edge_names, since)
+
+    def stop(self) -> None:
+        """Stop all daemons concurrently."""
+        run_all(self.nodes, lambda node: node.cmd("stop"))
@@ -0,0 +1,504 @@
+"""Client for the tincd control socket, used instead of running `tinc dump`."""
+
+import os
+import socket
+import struct
+import threading
+import typing as T
+from enum import IntEnum, IntFlag
+
+from .log import log
+
+# Request numbers from src/protocol.h
+_ID = 0
+_ACK = 4
+_CONTROL = 18
+
+Val = T.TypeVar("Val")
+
+# TINC_CTL_VERSION_CURRENT from src/control_common.h
+_CTL_VERSION = 0
+
+
+class Request(IntEnum):
+    """Control requests from src/control_common.h."""
+
+    STOP = 0
+    RELOAD = 1
+    RESTART = 2
+    DUMP_NODES = 3
+    DUMP_EDGES = 4
+    DUMP_SUBNETS = 5
+    DUMP_CONNECTIONS = 6
+    DUMP_GRAPH = 7
+    PURGE = 8
+    SET_DEBUG = 9
+    RETRY = 10
+    CONNECT = 11
+    DISCONNECT = 12
+    DUMP_TRAFFIC = 13
+    PCAP = 14
+    LOG = 15
+    DUMP_SUBNET_CACHE = 16
+    DUMP_NODE_STATS = 17
+
+
+class NodePath(IntEnum):
+    """How packets reach a node (node_path_t from src/control_common.h)."""
+
+    UNREACHABLE = 0
+    MYSELF = 1
+    INDIRECT = 2
+    UNKNOWN = 3
+    UDP = 4
+    TCP = 5
+    FORWARDED = 6
+
+
+class NodeStatus(IntFlag):
+    """Bits of node_status_t from src/node.h."""
+
+    VALIDKEY = 1 << 1
+    WAITINGFORKEY = 1 << 2
+    VISITED = 1 << 3
+    REACHABLE = 1 << 4
+    INDIRECT = 1 << 5
+    SPTPS = 1 << 6
+    UDP_CONFIRMED = 1 << 7
+    SEND_LOCALLY = 1 << 8
+    UDPPACKET = 1 << 9
+    VALIDKEY_IN = 1 << 10
+    HAS_ADDRESS = 1 << 11
+    PING_SENT = 1 << 12
+
+
+class Node(T.NamedTuple):
+    """A node known to tincd (see dump_nodes() in src/node.c)."""
+
+    name: str
+    id: str
+    host: str
+    port: str
+    cipher: int
+    digest: int
+    mac_length: int
+    compression: int
+    options: int
+    status: NodeStatus
+    nexthop: str
+    via: str
+    distance: int
+    mtu: int
+    min_mtu: int
+    max_mtu: int
+    last_state_change: int
+    udp_ping_rtt: int
+    in_packets: int
+    in_bytes: int
+    out_packets: int
+    out_bytes: int
+
+    @property
+    def reachable(self) -> bool:
+        """Is the node reachable through the graph?"""
+        return NodeStatus.REACHABLE in self.status
+
+
+class Edge(T.NamedTuple):
+    """An edge in the graph (see dump_edges() in src/edge.c)."""
+
+    src: str
+    dst: str
+    host: str
+    port: str
+    local_host: str
+    local_port: str
+    options: int
+    weight: int
+
+
+class Subnet(T.NamedTuple):
+    """A subnet and its owner (see dump_subnets() in src/subnet.c)."""
+
+    subnet: str
+    owner: str
+
+
+class Connection(T.NamedTuple):
+    """A meta connection (see dump_connections() in src/connection.c)."""
+
+    name: str
+    host: str
+    port: str
+    options: int
+    socket: int
+    status: int
+
+
+class Traffic(T.NamedTuple):
+    """Traffic counters of a node (see dump_traffic() in src/node.c)."""
+
+    name: str
+    in_packets: int
+    in_bytes: int
+    out_packets: int
+    out_bytes: int
+
+
+class SubnetCache(T.NamedTuple):
+    """Statistics of a subnet lookup cache (see dump_subnet_cache() in src/subnet.c)."""
+
+    type: str
+    size: int
+    entries: int
+    hits: int
+    misses: int
+    flushes: int
+    invalidations: int
+
+
+class NodeStats(T.NamedTuple):
+    """Statistics of a node (see dump_node_stats() in src/node.c)."""
+
+    name: str
+    in_packets: int
+    in_bytes: int
+    out_packets: int
+    out_bytes: int
+    in_dropped: int
+    out_dropped: int
+    in_replayed: int
+    uncompressed_bytes: int
+    compressed_bytes: int
+    udp_ping_rtt: int
+    mtu: int
+    path: NodePath
+
+    @property
+    def compression_ratio(self) -> T.Optional[float]:
+        """Size of compressed outgoing data relative to the original, if any was compressed."""
+        if not self.uncompressed_bytes:
+            return None
+        return self.compressed_bytes / self.uncompressed_bytes
+
+
+# Fixed part of a REQ_DUMP_NODE_STATS record, and the length of the name after it
+_NODE_STATS = struct.Struct("!9QiHB")
+_NAME_LENGTH = struct.Struct("!H")
+
+
+def _parse_node(t: T.List[str]) -> Node:
+    return Node(
+        name=t[0],
+        id=t[1],
+        host=t[2],
+        port=t[4],
+        cipher=int(t[5]),
+        digest=int(t[6]),
+        mac_length=int(t[7]),
+        compression=int(t[8]),
+        options=int(t[9], 16),
+        status=NodeStatus(int(t[10], 16)),
+        nexthop=t[11],
+        via=t[12],
+        distance=int(t[13]),
+        mtu=int(t[14]),
+        min_mtu=int(t[15]),
+        max_mtu=int(t[16]),
+        last_state_change=int(t[17]),
+        udp_ping_rtt=int(t[18]),
+        in_packets=int(t[19]),
+        in_bytes=int(t[20]),
+        out_packets=int(t[21]),
+        out_bytes=int(t[22]),
+    )
+
+
+def _parse_edge(t: T.List[str]) -> Edge:
+    return Edge(t[0], t[1], t[2], t[4], t[5], t[7], int(t[8], 16), int(t[9]))
+
+
+def _parse_subnet(t: T.List[str]) -> Subnet:
+    return Subnet(t[0], t[1])
+
+
+def _parse_connection(t: T.List[str]) -> Connection:
+    return Connection(t[0], t[1], t[3], int(t[4], 16), int(t[5]), int(t[6], 16))
+
+
+def _parse_traffic(t: T.List[str]) -> Traffic:
+    return Traffic(t[0], *map(int, t[1:5]))
+
+
+def _parse_subnet_cache(t: T.List[str]) -> SubnetCache:
+    return SubnetCache(t[0], *map(int, t[1:7]))
+
+
+def _node_stats(name: str, fields: T.Tuple[T.Any, ...]) -> NodeStats:
+    (
+        in_packets,
+        in_bytes,
+        out_packets,
+        out_bytes,
+        in_dropped,
+        out_dropped,
+        in_replayed,
+        uncompressed_bytes,
+        compressed_bytes,
+        rtt,
+        mtu,
+        path,
+    ) = fields
+    return NodeStats(
+        name=name,
+        in_packets=in_packets,
+        in_bytes=in_bytes,
+        out_packets=out_packets,
+        out_bytes=out_bytes,
+        in_dropped=in_dropped,
+        out_dropped=out_dropped,
+        in_replayed=in_replayed,
+        uncompressed_bytes=uncompressed_bytes,
+        compressed_bytes=compressed_bytes,
+        udp_ping_rtt=rtt,
+        mtu=mtu,
+        path=NodePath(path),
+    )
+
+
+def _parse_node_stats(data: bytes, records: int, size: int) -> T.List[NodeStats]:
+    result: T.List[NodeStats] = []
+    offset = 0
+    for _ in range(records):
+        fields = _NODE_STATS.unpack_from(data, offset)
+        offset += size
+        (length,) = _NAME_LENGTH.unpack_from(data, offset)
+        offset += _NAME_LENGTH.size
+        name = data[offset : offset + length].decode("utf-8")
+        offset += length
+        result.append(_node_stats(name, fields))
+    return result
+
+
+class Control:
+    """Persistent connection to the control socket of a tincd instance. It's
+    opened on first use and reopened if tincd closes it (for example, when the
+    daemon is restarted). Requests can be made from multiple threads.
+    """
+
+    _pid_file: str
+    _sock: T.Optional[socket.socket]
+    _reader: T.Optional[T.BinaryIO]
+    _lock: threading.Lock
+    pid: int
+
+    def __init__(self, pid_file: str) -> None:
+        self._pid_file = pid_file
+        self._sock = None
+        self._reader = None
+        self._lock = threading.Lock()
+        self.pid = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        """Close the connection. It will be reopened by the next request."""
+        with self._lock:
+            self._close()
+
+    def dump_nodes(self) -> T.List[Node]:
+        """Get all nodes known to tincd."""
+        return [_parse_node(t) for t in self.request(Request.DUMP_NODES)]
+
+    def dump_reachable_nodes(self) -> T.List[Node]:
+        """Get nodes reachable from this one (including itself)."""
+        return [node for node in self.dump_nodes() if node.reachable]
+
+    def dump_edges(self) -> T.List[Edge]:
+        """Get all edges of the graph."""
+        return [_parse_edge(t) for t in self.request(Request.DUMP_EDGES)]
+
+    def dump_subnets(self) -> T.List[Subnet]:
+        """Get all known subnets."""
+        return [_parse_subnet(t) for t in self.request(Request.DUMP_SUBNETS)]
+
+    def dump_connections(self) -> T.List[Connection]:
+        """Get all meta connections, including control connections."""
+        return [_parse_connection(t) for t in self.request(Request.DUMP_CONNECTIONS)]
+
+    def dump_traffic(self) -> T.List[Traffic]:
+        """Get traffic counters of all nodes."""
+        return [_parse_traffic(t) for t in self.request(Request.DUMP_TRAFFIC)]
+
+    def dump_subnet_cache(self) -> T.Dict[str, SubnetCache]:
+        """Get statistics of the subnet lookup caches, keyed by address type."""
+        caches = map(_parse_subnet_cache, self.request(Request.DUMP_SUBNET_CACHE))
+        return {cache.type: cache for cache in caches}
+
+    def dump_node_stats(self) -> T.List[NodeStats]:
+        """Get statistics of all nodes. Unlike other dumps, they're sent in
+        binary blocks, which is cheaper for tincd and for us with many nodes.
+        """
+        return self._locked(self._dump_node_stats)
+
+    def retry(self) -> None:
+        """Retry all outgoing connections right away, like `tinc retry`."""
+        code = self.command(Request.RETRY)
+        if code:
+            raise ValueError(f"retry failed with code {code}")
+
+    def request(self, req: Request, *args: T.Any) -> T.List[T.List[str]]:
+        """Send a dump request and return the fields of each reply line
+        (without the leading request numbers). If the connection turns out
+        to be broken, it's reopened and the request is sent again once.
+        """
+        return self._locked(self._request, req, args)
+
+    def command(self, req: Request, *args: T.Any) -> int:
+        """Send a request which is answered with a single result code
+        (like REQ_RETRY or REQ_PURGE), and return that code.
+        """
+        return self._locked(self._command, req, args)
+
+    def _locked(self, func: T.Callable[..., Val], *args: T.Any) -> Val:
+        with self._lock:
+            try:
+                return func(*args)
+            except (OSError, EOFError) as ex:
+                log.debug("control connection to %s lost", self._pid_file, exc_info=ex)
+                self._close()
+                return func(*args)
+
+    def log(
+        self, level: int = 0, timeout: T.Optional[float] = None
+    ) -> T.Generator[str, None, None]:
+        """Stream log messages up to debug level from tincd. Messages logged
+        after this call returns are received. Uses a separate connection, which
+        is closed when the generator is closed or garbage collected. If timeout
+        is set and no message arrives in time, socket.timeout is raised.
+        """
+        sock, reader = self._connect()
+        try:
+            sock.settimeout(timeout)
+            _send(sock, _CONTROL, Request.LOG, level, 0)
+        except BaseException:
+            reader.close()
+            sock.close()
+            raise
+        return _read_log(sock, reader)
+
+    def _send(self, req: Request, args: T.Tuple[T.Any, ...]) -> T.BinaryIO:
+        if not self._sock:
+            self._sock, self._reader = self._connect()
+        assert self._reader
+        _send(self._sock, _CONTROL, req, *args)
+        return self._reader
+
+    def _request(self, req: Request, args: T.Tuple[T.Any, ...]) -> T.List[T.List[str]]:
+        reader = self._send(req, args)
+        result: T.List[T.List[str]] = []
+        while True:
+            tokens = _read_reply(reader, req)
+            if not tokens:
+                return result
+            result.append(tokens)
+
+    def _dump_node_stats(self) -> T.List[NodeStats]:
+        reader = self._send(Request.DUMP_NODE_STATS, ())
+        result: T.List[NodeStats] = []
+        while True:
+            tokens = _read_reply(reader, Request.DUMP_NODE_STATS)
+            if not tokens:
+                return result
+            records, size, length = map(int, tokens)
+            data = reader.read(length)
+            if len(data) != length:
+                raise EOFError("control connection closed")
+            result += _parse_node_stats(data, records, size)
+
+    def _command(self, req: Request, args: T.Tuple[T.Any, ...]) -> int:
+        reader = self._send(req, args)
+        (code,) = _read_reply(reader, req)
+        return int(code)
+
+    def _connect(self) -> T.Tuple[socket.socket, T.BinaryIO]:
+        """Connect to tincd and authenticate with the cookie from the pid file."""
+        with open(self._pid_file, "r", encoding="utf-8") as f:
+            pid, cookie, host, _, port = f.read().split()
+
+        if os.name == "nt":
+            sock = socket.create_connection((host, int(port)))
+        else:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(f"{self._pid_file}.socket")
+            except OSError:
+                sock.close()
+                raise
+
+        reader = sock.makefile("rb")
+        try:
+            _send(sock, _ID, f"^{cookie}", _CTL_VERSION)
+            code, _, _ = _read_line(reader)
+            if code != str(_ID):
+                raise ValueError(f"unexpected greeting from tincd: {code}")
+
+            code, version, pid = _read_line(reader)
+            if code != str(_ACK) or version != str(_CTL_VERSION):
+                raise ValueError("could not establish control connection")
+        except BaseException:
+            reader.close()
+            sock.close()
+            raise
+
+        self.pid = int(pid)
+        log.debug("connected to control socket of tincd %d", self.pid)
+        return sock, reader
+
+    def _close(self) -> None:
+        if self._reader:
+            self._reader.close()
+            self._reader = None
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+
+
+def _read_log(sock: socket.socket, reader: T.BinaryIO) -> T.Generator[str, None, None]:
+    try:
+        while True:
+            code, req, size = _read_line(reader)
+            assert code == str(_CONTROL) and req == str(int(Request.LOG))
+            data = reader.read(int(size))
+            if len(data) != int(size):
+                return
+            yield data.decode("utf-8", "replace")
+    except EOFError:
+        return
+    finally:
+        reader.close()
+        sock.close()
+
+
+def _read_reply(reader: T.BinaryIO, req: Request) -> T.List[str]:
+    """Read reply to req and return its fields without the request numbers."""
+    tokens = _read_line(reader)
+    if tokens[:2] != [str(_CONTROL), str(int(req))]:
+        raise ValueError(f"unexpected reply to request {req!r}: {tokens}")
+    return tokens[2:]
+
+
+def _send(sock: socket.socket, *tokens: T.Any) -> None:
+    line = " ".join(str(int(t)) if isinstance(t, IntEnum) else str(t) for t in tokens)
+    sock.sendall(f"{line}\n".encode("utf-8"))
+
+
+def _read_line(reader: T.BinaryIO) -> T.List[str]:
+    line = reader.readline()
+    if not line.endswith(b"\n"):
+        raise EOFError("control connection closed")
+    return line.decode("utf-8").split()
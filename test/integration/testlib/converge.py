@@ -0,0 +1,76 @@
+"""Waiting for tinc daemons to agree on the state of the graph."""
+
+import time
+import typing as T
+
+from .log import log
+from .proc import Tinc
+
+# How often daemons are queried while waiting
+_POLL_INTERVAL = 0.01
+
+# Directed edge, as (from, to) node names
+EdgeName = T.Tuple[str, str]
+
+
+def _converged(
+    node: Tinc, names: T.Set[str], edges: T.Optional[T.Set[EdgeName]]
+) -> bool:
+    """Check if node sees the expected graph. Errors (for example, because the
+    daemon is restarting) are treated as 'not yet'.
+    """
+    try:
+        reachable = {n.name for n in node.control.dump_reachable_nodes()}
+        if reachable != names:
+            return False
+        if edges is None:
+            return True
+        return {(e.src, e.dst) for e in node.control.dump_edges()} == edges
+    except (OSError, EOFError) as ex:
+        log.debug("could not query node %s", node, exc_info=ex)
+        return False
+
+
+def wait_converged(
+    nodes: T.Sequence[Tinc],
+    timeout: float = 30.0,
+    edges: T.Optional[T.Iterable[EdgeName]] = None,
+    since: T.Optional[float] = None,
+) -> T.Dict[str, float]:
+    """Block until every node can reach all the other nodes. If edges are
+    passed, each node must also know exactly these edges (in the same
+    direction as tincd reports them, so usually both ways).
+
+    Returns the time it took each node to converge, in seconds since the
+    moment specified by since (a time.monotonic() value, for example when a
+    link was brought down), or since the call if it's omitted. Raises
+    TimeoutError if some nodes did not converge in time.
+    """
+    start = time.monotonic() if since is None else since
+    deadline = time.monotonic() + timeout
+    names = {node.name for node in nodes}
+    want_edges = None if edges is None else set(edges)
+
+    log.info("waiting for %d nodes to converge", len(nodes))
+    result: T.Dict[str, float] = {}
+    pending = list(nodes)
+
+    while True:
+        now = time.monotonic()
+        for node in pending:
+            if _converged(node, names, want_edges):
+                result[node.name] = time.monotonic() - start
+
+        pending = [node for node in pending if node.name not in result]
+        if not pending:
+            break
+
+        if now > deadline:
+            raise TimeoutError(
+                f"{len(pending)} nodes did not converge in {timeout} s: "
+                f"{[node.name for node in pending]}"
+            )
+        time.sleep(_POLL_INTERVAL)
+
+    log.info("converged in %f s", max(result.values(), default=0))
+    return result
@@ -2,7 +2,11 @@
 
 import os
 import sys
+import hmac
 import time
+import pickle
+import socket
+import struct
 import platform
 import typing as T
 
@@ -11,10 +15,29 @@ _MONOTONIC_IS_SYSTEMWIDE = not (
 )
 
 
-def _time_ns() -> int:
-    if sys.version_info <= (3, 7):
-        return int(time.monotonic() * 1e9)
-    return time.monotonic_ns()
+def time_ns() -> int:
+    """Like time.monotonic_ns(), which is missing before Python 3.7."""
+    if sys.version_info >= (3, 7):
+        return time.monotonic_ns()
+    return int(time.monotonic() * 1e9)
+
+
+# Every connection starts with the server sending a random challenge, to which
+# the client replies with its HMAC keyed by the authkey. It is followed by any
+# number of frames, each a 4-byte big-endian length and a pickled Notification.
+FRAME_HEADER = struct.Struct("!I")
+
+# Size of the challenge sent by the server
+CHALLENGE_SIZE = 16
+
+
+def respond(authkey: bytes, challenge: bytes) -> bytes:
+    """Compute the reply to the server's challenge."""
+    return hmac.new(authkey, challenge, "sha256").digest()
+
+
+# UNIX socket path, or (host, port) on Windows
+Address = T.Union[str, T.Tuple[str, int]]
 
 
 class Notification:
@@ -24,6 +47,7 @@ class Notification:
     node: str
     script: str
     created_at: T.Optional[int] = None
+    received_at: T.Optional[int] = None
     env: T.Dict[str, str]
     args: T.Dict[str, str]
     error: T.Optional[Exception]
@@ -44,6 +68,57 @@ class Notification:
         return f"{self.test}/{self.node}/{self.script}"
 
     def update_time(self) -> None:
-        """Update creation time if it was not assigned previously."""
+        """Update creation time if it was not assigned previously,
+        and record the time the notification was received.
+        """
+        self.received_at = time_ns()
         if self.created_at is None:
-            self.created_at = _time_ns()
+            self.created_at = self.received_at
+
+    @property
+    def latency(self) -> T.Optional[int]:
+        """Nanoseconds between creating and receiving the notification."""
+        if self.created_at is None or self.received_at is None:
+            return None
+        return self.received_at - self.created_at
+
+
+class Notifier:
+    """Connection to the notification server in the test process.
+    The server's challenge is answered once when the connection is opened, after
+    which every notification is written as a single frame without waiting for a
+    response. Can be kept open to send any number of notifications.
+    """
+
+    _sock: socket.socket
+
+    def __init__(self, address: Address, authkey: bytes) -> None:
+        family = socket.AF_INET if isinstance(address, tuple) else socket.AF_UNIX
+        self._sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            self._sock.connect(address)
+            challenge = b""
+            while len(challenge) < CHALLENGE_SIZE:
+                chunk = self._sock.recv(CHALLENGE_SIZE - len(challenge))
+                if not chunk:
+                    raise ConnectionError("server closed connection")
+                challenge += chunk
+            self._sock.sendall(respond(authkey, challenge))
+        except OSError:
+            self._sock.close()
+            raise
+
+    def send(self, evt: Notification) -> None:
+        """Send notification to the test process."""
+        payload = pickle.dumps(evt)
+        self._sock.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+    def close(self) -> None:
+        """Close connection to the server."""
+        self._sock.close()
+
+    def __enter__(self) -> "Notifier":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
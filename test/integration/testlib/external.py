@@ -51,9 +51,19 @@ def netns_add(namespace: str) -> bool:
     return success
 
 
-def netns_exec(netns: str, *args: str, check: bool = False) -> subp.CompletedProcess:
-    """Execute command in the network namespace."""
-    return subp.run(["ip", "netns", "exec", netns, *args], check=check)
+def netns_exec(
+    netns: str, *args: str, check: bool = False, **kwargs: T.Any
+) -> subp.CompletedProcess:
+    """Execute command in the network namespace. kwargs are passed to subprocess.run()."""
+    return subp.run(["ip", "netns", "exec", netns, *args], check=check, **kwargs)
+
+
+def netns_popen(netns: str, *args: str, **kwargs: T.Any) -> subp.Popen:
+    """Start command in the network namespace without waiting for it.
+    If netns is empty, the command runs in the current namespace.
+    """
+    cmd = ["ip", "netns", "exec", netns, *args] if netns else list(args)
+    return subp.Popen(cmd, **kwargs)
 
 
 def ping(address: str, netns: T.Optional[str] = None) -> bool:
@@ -0,0 +1,124 @@
+"""Two tinc nodes with fd devices, whose other ends are held by the test.
+
+tincd reads packets written into these sockets as if they came from a TUN
+device, and writes packets routed to its node back into them, so traffic can
+be generated and received by ordinary processes (see traffic.inject()).
+Unlike testlib.tunnel, this needs neither root, network namespaces nor /dev/net/tun.
+"""
+
+import array
+import contextlib
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import typing as T
+
+from . import traffic
+from .proc import Tinc
+from .relay import Relay
+from .test import Test
+from .tunnel import Tunnel
+
+# Buffer size requested for sockets between tincd and the test
+_BUFFER = 1 << 22
+
+# Interval between packets sent while waiting for path MTU discovery
+_TRICKLE_INTERVAL = 0.05
+
+
+def _drain(sock: socket.socket) -> int:
+    """Throw away packets waiting in sock, and return how many there were."""
+    count = 0
+    with contextlib.suppress(BlockingIOError):
+        while True:
+            sock.recv(1 << 16, socket.MSG_DONTWAIT)
+            count += 1
+    return count
+
+
+def _serve_fd(server: socket.socket, sock: socket.socket) -> None:
+    """Pass sock to the first process that connects to server, which is how
+    tincd gets its device with DeviceType = fd when Device is a UNIX socket.
+    """
+    with server:
+        conn, _ = server.accept()
+    with conn, sock:
+        fds = array.array("i", [sock.fileno()])
+        conn.sendmsg([b" "], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds)])
+
+
+class FdTunnel(Tunnel):
+    """Like Tunnel, but each node gets a DeviceType = fd device: one end of a
+    datagram socket pair, with the other end in devices[node.name]. Packets
+    written there go into the tunnel, and packets tincd routes to the node can
+    be read from there. They must be read, or tincd blocks once the socket
+    fills up.
+    """
+
+    devices: T.Dict[str, socket.socket]
+    _dir: str
+
+    def __init__(
+        self, ctx: Test, config: str = "", relay: T.Optional[Relay] = None
+    ) -> None:
+        self.devices = {}
+        # UNIX socket paths are too short to live in the build directory
+        self._dir = tempfile.mkdtemp(prefix="tinc-fd-")
+        super().__init__(ctx, config, relay)
+
+    def _setup_device(self, node: Tinc) -> str:
+        ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        for sock in ours, theirs:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, _BUFFER)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, _BUFFER)
+        self.devices[node.name] = ours
+
+        unix_path = os.path.join(self._dir, node.name)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(unix_path)
+        server.listen(1)
+        threading.Thread(target=_serve_fd, args=(server, theirs), daemon=True).start()
+
+        return os.linesep.join(["set DeviceType fd", f"set Device {unix_path}"])
+
+    def drain(self) -> None:
+        """Throw away packets waiting in all devices."""
+        for sock in self.devices.values():
+            _drain(sock)
+
+    @contextlib.contextmanager
+    def _trickle(self) -> T.Iterator[None]:
+        stop = threading.Event()
+        foo, bar = self.devices[self.foo.name], self.devices[self.bar.name]
+        to_foo = traffic.ipv4_packet(self.bar.address, self.foo.address, b"")
+        to_bar = traffic.ipv4_packet(self.foo.address, self.bar.address, b"")
+
+        def send() -> None:
+            # foo answers only after packets from bar get through. If both nodes
+            # started sending at once, they could request keys from each other at
+            # the same time, which stalls both until the requests time out.
+            answering = False
+            while not stop.wait(_TRICKLE_INTERVAL):
+                bar.send(to_foo)
+                if answering:
+                    foo.send(to_bar)
+                answering = _drain(foo) > 0 or answering
+                _drain(bar)
+
+        thread = threading.Thread(target=send)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+            self.drain()
+
+    def stop(self) -> None:
+        """Stop both nodes, and close their devices."""
+        super().stop()
+        for sock in self.devices.values():
+            sock.close()
+        shutil.rmtree(self._dir, ignore_errors=True)
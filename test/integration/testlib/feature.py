@@ -1,9 +1,9 @@
 """Some hardcoded constants."""
 
-from .proc import Feature, Tinc
+from .proc import Feature, features
 
 # True if tincd has sandbox support
-HAVE_SANDBOX = Feature.SANDBOX in Tinc().features
+HAVE_SANDBOX = Feature.SANDBOX in features()
 
 # Maximum supported sandbox level
-SANDBOX_LEVEL = "high" if Feature.SANDBOX in Tinc().features else "off"
+SANDBOX_LEVEL = "high" if HAVE_SANDBOX else "off"
@@ -0,0 +1,158 @@
+"""Pool of pre-generated node keys, used to initialize nodes without running tinc.
+
+The pool is filled by key_pool.py, which meson runs alone before all other
+tests. Keys are kept in the shared working directory and reused by later runs.
+If a process needs more keys than the pool has, they are generated on demand.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import subprocess as subp
+import typing as T
+
+from . import path
+from .log import log
+
+# Number of keys generated by key_pool.py. Must cover the most nodes any single
+# test process initializes with init_fast().
+POOL_SIZE = 128
+
+# Private key files installed into nodes (RSA only with legacy protocol support)
+PRIVATE_KEYS = ("ed25519_key.priv", "rsa_key.priv")
+
+# How many keys are generated at once when the pool runs out
+_BATCH = 16
+
+# Size of generated RSA keys, same as the default of `tinc init`
+_RSA_BITS = 2048
+
+_lock = threading.Lock()
+_next = {"index": 0}
+
+
+class KeyPair:
+    """A set of node keys: private key files, and host config lines with public keys."""
+
+    dir: str
+    public: str
+
+    def __init__(self, key_dir: str) -> None:
+        self.dir = key_dir
+        with open(os.path.join(key_dir, "hosts", "key"), "r", encoding="utf-8") as f:
+            self.public = f.read()
+
+    def install(self, work_dir: str) -> None:
+        """Copy private keys into node working directory."""
+        for name in PRIVATE_KEYS:
+            src = os.path.join(self.dir, name)
+            if os.path.exists(src):
+                shutil.copyfile(src, os.path.join(work_dir, name))
+                os.chmod(os.path.join(work_dir, name), 0o600)
+
+
+def _key_dir(index: int, legacy: bool) -> str:
+    # Keys without RSA can't be used by builds with the legacy protocol
+    return os.path.join(path.KEY_POOL_DIR, "rsa" if legacy else "ed25519", str(index))
+
+
+def _commands(tmp: str, legacy: bool) -> T.List[T.List[str]]:
+    """Commands that generate keys of one node in tmp."""
+    ed25519 = os.path.join(tmp, "ed25519_key")
+    cmds = [[path.SPTPS_KEYPAIR_PATH, f"{ed25519}.priv", f"{ed25519}.pub"]]
+    if legacy:
+        cmds.append(
+            [path.TINC_PATH, "--config", tmp, "generate-rsa-keys", str(_RSA_BITS)]
+        )
+    return cmds
+
+
+def _write_public(tmp: str, legacy: bool) -> None:
+    """Put public keys into host config lines, like `tinc init` does."""
+    with open(os.path.join(tmp, "ed25519_key.pub"), "r", encoding="utf-8") as f:
+        # The key itself is the only line between the PEM-like header and footer
+        ed25519 = f.read().splitlines()[1]
+    public = ""
+    if legacy:
+        with open(os.path.join(tmp, "rsa_key.pub"), "r", encoding="utf-8") as f:
+            public = f.read()
+    os.makedirs(os.path.join(tmp, "hosts"))
+    with open(os.path.join(tmp, "hosts", "key"), "w", encoding="utf-8") as f:
+        f.write(f"{public}Ed25519PublicKey = {ed25519}\n")
+
+
+def _generate(indexes: T.List[int], legacy: bool) -> None:
+    """Generate keys in temporary directories, running as many key generators at
+    once as there are CPUs, then atomically move them into the pool. If another
+    test process has generated the same key in the meantime, its key is used instead.
+    """
+    log.info("generating %d keys for the pool in %s", len(indexes), path.KEY_POOL_DIR)
+    os.makedirs(os.path.dirname(_key_dir(0, legacy)), exist_ok=True)
+
+    jobs = []
+    for index in indexes:
+        tmp = tempfile.mkdtemp(dir=path.KEY_POOL_DIR, prefix=f".{index}-")
+        jobs.append((index, tmp, _commands(tmp, legacy)))
+
+    running: T.List[T.Tuple[T.List[str], subp.Popen]] = []
+    pending = [cmd for _, _, cmds in jobs for cmd in cmds]
+
+    def wait_one() -> None:
+        cmd, proc = running.pop(0)
+        _, err = proc.communicate()
+        if proc.returncode:
+            raise RuntimeError(f'"{" ".join(cmd)}" failed: {err!r}')
+
+    while pending:
+        if len(running) >= (os.cpu_count() or 1):
+            wait_one()
+        cmd = pending.pop(0)
+        # pylint: disable=consider-using-with
+        proc = subp.Popen(
+            cmd, stdin=subp.DEVNULL, stdout=subp.DEVNULL, stderr=subp.PIPE
+        )
+        running.append((cmd, proc))
+
+    while running:
+        wait_one()
+
+    for index, tmp, _ in jobs:
+        _write_public(tmp, legacy)
+        try:
+            os.rename(tmp, _key_dir(index, legacy))
+        except OSError:
+            log.debug("key %d was generated by somebody else", index)
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+def fill(count: int, legacy: bool) -> None:
+    """Make sure the pool has keys with indexes up to count (exclusive).
+    legacy must be True if tinc supports the legacy protocol, which needs RSA keys.
+    """
+    missing = [i for i in range(count) if not os.path.isdir(_key_dir(i, legacy))]
+    if missing:
+        _generate(missing, legacy)
+
+
+def reserve(count: int, legacy: bool) -> None:
+    """Make sure the next count calls to take() will not generate keys."""
+    with _lock:
+        fill(_next["index"] + count, legacy)
+
+
+def take(legacy: bool) -> KeyPair:
+    """Take the next unused key pair from the pool, generating more if needed.
+    Keys are unique within the current process (but not between processes).
+    """
+    with _lock:
+        index = _next["index"]
+        _next["index"] += 1
+
+        if not os.path.isdir(_key_dir(index, legacy)):
+            batch = range(index, index + _BATCH)
+            _generate(
+                [i for i in batch if not os.path.isdir(_key_dir(i, legacy))], legacy
+            )
+
+    return KeyPair(_key_dir(index, legacy))
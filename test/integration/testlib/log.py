@@ -6,36 +6,49 @@ import sys
 import typing as T
 from types import TracebackType
 
-from .path import TEST_WD, TEST_NAME
+from . import path
+from .runtime import LOG_FORMAT
 
 logging.basicConfig(level=logging.DEBUG)
 
-_fmt = logging.Formatter(
-    "%(asctime)s %(name)s %(filename)s:%(lineno)d %(levelname)s %(message)s"
-)
+_fmt = logging.Formatter(LOG_FORMAT)
 
-# Where to put log files for this test and nodes started by it
-_log_dir = os.path.join(TEST_WD, "logs")
+
+def _file_handler(name: str) -> logging.FileHandler:
+    """Open logfile 'name.log' in the log directory of the current working
+    directory (which is different for each context of a parallel test).
+    """
+    log_dir = os.path.join(path.TEST_WD, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+
+    file = logging.FileHandler(os.path.join(log_dir, name + ".log"))
+    file.setFormatter(_fmt)
+    return file
 
 
 def new_logger(name: str) -> logging.Logger:
     """Create a new named logger with common logging format.
     Log entries will go into a separate logfile named 'name.log'.
     """
-    os.makedirs(_log_dir, exist_ok=True)
-
     logger = logging.getLogger(name)
     logger.setLevel(logging.DEBUG)
+    logger.addHandler(_file_handler(name))
+    return logger
 
-    file = logging.FileHandler(os.path.join(_log_dir, name + ".log"))
-    file.setFormatter(_fmt)
-    logger.addHandler(file)
 
-    return logger
+def reopen_logs() -> None:
+    """Move the main logfile into the current path.TEST_WD, after it has been
+    changed. Entries written so far stay in the old file.
+    """
+    for handler in log.handlers[:]:
+        if isinstance(handler, logging.FileHandler):
+            log.removeHandler(handler)
+            handler.close()
+    log.addHandler(_file_handler(path.TEST_NAME))
 
 
 # Main logger used by most tests
-log = new_logger(TEST_NAME)
+log = new_logger(path.TEST_NAME)
 
 
 def _exc_hook(
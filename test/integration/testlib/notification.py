@@ -1,15 +1,24 @@
 """Support for receiving notifications from tincd scripts."""
 
 import os
+import hmac
 import signal
+import pickle
+import atexit
+import asyncio
+import tempfile
 import threading
-import queue
-import multiprocessing.connection as mp
+import functools
+import collections
+import concurrent.futures as cf
 import typing as T
 
 from .log import log
-from .event import Notification
-from .const import MPC_FAMILY
+from .event import Notification, Address, FRAME_HEADER, CHALLENGE_SIZE, respond
+from .util import remove_file
+
+# (key, notification) for the first script that finished, or None on timeout
+KeyedNotification = T.Optional[T.Tuple[str, Notification]]
 
 
 def _get_key(name, script) -> str:
@@ -17,29 +26,41 @@ def _get_key(name, script) -> str:
 
 
 class NotificationServer:
-    """Receive event notifications from tincd scripts."""
-
-    address: T.Union[str, bytes]
-    authkey: bytes  # only to prevent accidental connections to wrong servers
-    _lock: threading.Lock
-    _ready: threading.Event
-    _worker: T.Optional[threading.Thread]
-    _notifications: T.Dict[str, queue.Queue]
+    """Receive event notifications from tincd scripts.
+
+    All connections are accepted and served concurrently by an asyncio event loop
+    which runs in a single background thread. Received notifications are queued per
+    node/script pair. Coroutines (get_async, get_any_async) can be awaited from any
+    other event loop without blocking a thread, and get() is a thin synchronous
+    wrapper around them.
+    """
+
+    address: Address
+    authkey: bytes  # shared with scripts, which prove they know it when connecting
+    _loop: asyncio.AbstractEventLoop
+    _worker: threading.Thread
+    _server: asyncio.AbstractServer
+    _arrived: asyncio.Condition
+    _notifications: T.Dict[str, T.Deque[Notification]]
 
     def __init__(self) -> None:
         self.address = ""
         self.authkey = os.urandom(8)
-        self._lock = threading.Lock()
-        self._ready = threading.Event()
-        self._worker = threading.Thread(target=self._recv, daemon=True)
-        self._notifications = {}
+        self._loop = asyncio.new_event_loop()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._notifications = collections.defaultdict(collections.deque)
 
         log.debug("using authkey %s", self.authkey)
 
         self._worker.start()
         log.debug("waiting for notification worker to become ready")
 
-        self._ready.wait()
+        try:
+            self._call(self._listen())
+        except OSError as ex:
+            log.error("recv notifications failed", exc_info=ex)
+            os.kill(0, signal.SIGTERM)
+            raise
         log.debug("notification worker is ready")
 
     @T.overload
@@ -60,46 +81,109 @@ class NotificationServer:
         self, node: str, script: str, timeout: T.Optional[float] = None
     ) -> T.Optional[Notification]:
         """Receive notification from specified node and script. See overloads above."""
+        res = self._call(self._get_any([_get_key(node, script)], timeout))
+        return res[1] if res else None
 
-        key = _get_key(node, script)
-        with self._lock:
-            que = self._notifications.get(key, queue.Queue())
-            self._notifications[key] = que
+    async def get_async(
+        self, node: str, script: str, timeout: T.Optional[float] = None
+    ) -> T.Optional[Notification]:
+        """Receive notification from the specified node and script without blocking
+        the calling event loop. Returns None if timeout expires first.
+        """
+        res = await self.get_any_async([(node, script)], timeout)
+        return res[1] if res else None
+
+    async def get_any_async(
+        self,
+        scripts: T.Iterable[T.Tuple[str, str]],
+        timeout: T.Optional[float] = None,
+    ) -> KeyedNotification:
+        """Receive the first notification from any of the (node, script) pairs.
+        Returns the 'node/script' key and the notification, or None on timeout.
+        Notifications from other scripts are left in place for later calls.
+        """
+        keys = [_get_key(node, script) for node, script in scripts]
+        fut = asyncio.run_coroutine_threadsafe(self._get_any(keys, timeout), self._loop)
+        return await asyncio.wrap_future(fut)
+
+    def _call(self, coro: T.Coroutine[T.Any, T.Any, T.Any]) -> T.Any:
+        """Run coroutine on the worker event loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    async def _listen(self) -> None:
+        self._arrived = asyncio.Condition()
+
+        if os.name == "nt":
+            self._server = await asyncio.start_server(self._handle_conn, "127.0.0.1", 0)
+            self.address = self._server.sockets[0].getsockname()[:2]
+        else:
+            path = tempfile.mktemp(prefix="tinc-notify-")
+            self._server = await asyncio.start_unix_server(self._handle_conn, path)
+            atexit.register(remove_file, path)
+            self.address = path
+
+    def _pop_any(self, keys: T.List[str]) -> KeyedNotification:
+        for key in keys:
+            que = self._notifications.get(key)
+            if que:
+                return key, que.popleft()
+        return None
+
+    async def _get_any(
+        self, keys: T.List[str], timeout: T.Optional[float]
+    ) -> KeyedNotification:
+        """Runs on the worker loop, where all queues are modified."""
+        pop = functools.partial(self._pop_any, keys)
+        async with self._arrived:
+            try:
+                return await asyncio.wait_for(self._arrived.wait_for(pop), timeout)
+            except (asyncio.TimeoutError, cf.TimeoutError):
+                return None
+
+    async def _handle_conn(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        log.debug("accepted connection")
         try:
-            return que.get(timeout=timeout)
-        except queue.Empty:
-            return None
-
-    def _recv(self) -> None:
+            challenge = os.urandom(CHALLENGE_SIZE)
+            writer.write(challenge)
+            expected = respond(self.authkey, challenge)
+            response = await reader.readexactly(len(expected))
+            if not hmac.compare_digest(response, expected):
+                raise ValueError("client failed to authenticate")
+            while await self._handle_frame(reader):
+                pass
+        except (OSError, ValueError, EOFError, asyncio.IncompleteReadError) as ex:
+            log.error("receiving notification failed", exc_info=ex)
+        finally:
+            writer.close()
+
+    async def _handle_frame(self, reader: asyncio.StreamReader) -> bool:
+        """Receive one notification. Returns False if the client closed connection."""
         try:
-            self._listen()
-        except (OSError, AssertionError) as ex:
-            log.error("recv notifications failed", exc_info=ex)
-            os.kill(0, signal.SIGTERM)
-
-    def _listen(self) -> None:
-        with mp.Listener(family=MPC_FAMILY, authkey=self.authkey) as listener:
-            assert not isinstance(listener.address, tuple)
-            self.address = listener.address
-            self._ready.set()
-            while True:
-                with listener.accept() as conn:
-                    self._handle_conn(conn)
-
-    def _handle_conn(self, conn: mp.Connection) -> None:
-        log.debug("accepted connection")
-
-        data: Notification = conn.recv()
+            header = await reader.readexactly(FRAME_HEADER.size)
+        except asyncio.IncompleteReadError as ex:
+            if ex.partial:
+                raise
+            return False
+
+        (size,) = FRAME_HEADER.unpack(header)
+        data = pickle.loads(await reader.readexactly(size))
         assert isinstance(data, Notification)
         data.update_time()
 
         key = _get_key(data.node, data.script)
         log.debug('from "%s" received data "%s"', key, data)
 
-        with self._lock:
-            que = self._notifications.get(key, queue.Queue())
-            self._notifications[key] = que
-        que.put(data)
+        async with self._arrived:
+            self._notifications[key].append(data)
+            self._arrived.notify_all()
+
+        return True
 
 
 notifications = NotificationServer()
@@ -0,0 +1,107 @@
+"""Run independent test contexts concurrently in a pool of worker processes."""
+
+import os
+import time
+import traceback
+import multiprocessing as mp
+import typing as T
+
+from . import path, proc
+from .log import log, reopen_logs
+from .test import Test
+
+# Test function. Receives the Test context followed by any extra arguments.
+TestFunc = T.Callable[..., None]
+
+# (index, context name, test function, extra arguments)
+_Task = T.Tuple[int, str, TestFunc, T.Tuple[T.Any, ...]]
+
+# (context name, seconds spent, formatted exception or None on success)
+_Result = T.Tuple[str, float, T.Optional[str]]
+
+
+def _isolate(index: int) -> None:
+    """Give the current worker its own working directory, logfile and loopback
+    range. tincd scripts inherit TEST_CONTEXT and compute the same TEST_WD.
+    """
+    context = f"ctx{index:03d}"
+    os.environ["TEST_CONTEXT"] = context
+    path.TEST_CONTEXT = context
+    path.TEST_WD = os.path.join(path.TEST_WD, context)
+    os.makedirs(path.TEST_WD, exist_ok=True)
+    reopen_logs()
+
+    net = proc.use_localhost_range(index)
+    log.info("context %s uses working directory %s and %s", context, path.TEST_WD, net)
+
+
+def _run_task(task: _Task) -> _Result:
+    """Run one test context. Executed inside a freshly spawned worker process,
+    which has its own NotificationServer created when testlib is imported.
+    """
+    index, name, func, args = task
+    _isolate(index)
+
+    start = time.monotonic()
+    try:
+        with Test(name) as ctx:
+            func(ctx, *args)
+        error = None
+    except BaseException:  # pylint: disable=broad-except
+        # Includes SystemExit, which would otherwise kill the worker and hang the pool
+        error = traceback.format_exc()
+        log.error('context "%s" failed: %s', name, error)
+
+    return name, time.monotonic() - start, error
+
+
+class Runner:
+    """Collects independent test contexts and runs them concurrently.
+    Each context runs in its own process (started with the 'spawn' method, which
+    works the same on all supported operating systems), and gets its own working
+    directory under path.TEST_WD, its own 127.X.0.0/16 range for node addresses,
+    and its own NotificationServer.
+
+    Because worker processes import the main module again, test functions must
+    be defined at module level, and the code that creates and runs the Runner
+    must be guarded by `if __name__ == "__main__"`.
+    """
+
+    _tasks: T.List[_Task]
+    _jobs: int
+
+    def __init__(self, jobs: int = 0) -> None:
+        self._tasks = []
+        self._jobs = jobs if jobs > 0 else os.cpu_count() or 1
+
+    def add(self, name: str, func: TestFunc, *args: T.Any) -> None:
+        """Schedule test function to be called with a new Test context and args."""
+        self._tasks.append((len(self._tasks), name, func, args))
+
+    def run(self) -> None:
+        """Run all scheduled contexts, waiting for them to finish.
+        Raise RuntimeError if at least one of them failed.
+        """
+        if not self._tasks:
+            return
+
+        jobs = min(self._jobs, len(self._tasks))
+        log.info("running %d test contexts in %d processes", len(self._tasks), jobs)
+
+        start = time.monotonic()
+        spawn = mp.get_context("spawn")
+        with spawn.Pool(jobs, maxtasksperchild=1) as pool:
+            results: T.List[_Result] = pool.map(_run_task, self._tasks, chunksize=1)
+
+        failed = []
+        for name, spent, error in results:
+            if error is None:
+                log.info('context "%s" finished in %.2f s', name, spent)
+            else:
+                log.error('context "%s" failed in %.2f s:\n%s', name, spent, error)
+                failed.append(name)
+
+        log.info("all contexts finished in %.2f s", time.monotonic() - start)
+
+        if failed:
+            raise RuntimeError(f"{len(failed)} test contexts failed: {failed}")
@@ -23,6 +23,9 @@ PYTHON_PATH = str(env["PYTHON_PATH"])
 SPTPS_TEST_PATH = str(env["SPTPS_TEST_PATH"])
 SPTPS_KEYPAIR_PATH = str(env["SPTPS_KEYPAIR_PATH"])
 
+# sptps_speed is only built on Linux, so it's not required
+SPTPS_SPEED_PATH = os.getenv("SPTPS_SPEED_PATH", "")
+
 PYTHON_CMD = "runpython" if "meson.exe" in PYTHON_PATH.lower() else ""
 PYTHON_INTERPRETER = f"{PYTHON_PATH} {PYTHON_CMD}".rstrip()
 
@@ -63,5 +66,20 @@ if not os.path.exists(_gitignore):
     with open(_gitignore, "w", encoding="utf-8") as f:
         f.write("*")
 
+# Pre-generated node keys shared by all tests, see testlib.keys
+KEY_POOL_DIR = os.path.join(_wd, "keys")
+
+# Benchmark baselines kept between runs, see testlib.bench
+BASELINE_DIR = os.path.join(_wd, "baselines")
+
+# Features of tinc and tincd binaries shared by all test processes, see testlib.proc
+FEATURE_CACHE_DIR = os.path.join(_wd, "features")
+
 # Working directory for this test
 TEST_WD = os.path.join(_wd, TEST_NAME)
+
+# Name of an isolated test context started by testlib.parallel (empty if none).
+# Each context gets its own subtree within the test working directory.
+TEST_CONTEXT = os.getenv("TEST_CONTEXT", "")
+if TEST_CONTEXT:
+    TEST_WD = os.path.join(TEST_WD, TEST_CONTEXT)
@@ -1,6 +1,9 @@
 """Classes for working with compiled instances of tinc and tincd binaries."""
 
 import os
+import json
+import time
+import hashlib
 import random
 import tempfile
 import typing as T
@@ -8,7 +11,8 @@ import subprocess as subp
 from enum import Enum
 from platform import system
 
-from . import check, path
+from . import check, keys, path
+from .control import Control
 from .log import log
 from .script import TincScript, Script, ScriptType
 from .template import make_script, make_cmd_wrap
@@ -20,6 +24,23 @@ _FULL_LOCALHOST_SUBNET = system() in ("Linux", "Windows")
 # Path to the system temporary directory.
 _TEMPDIR = tempfile.gettempdir()
 
+# How long to wait for tincd to write its pid file after `tinc start` returns
+_READY_TIMEOUT = 10.0
+
+# Variables that `tinc set` puts into the node's own host configuration file.
+# Copied from the variables table in tincctl.c (VAR_HOST without VAR_SERVER).
+_HOST_VARIABLES = {
+    name.lower(): name
+    for name in (
+        "Address",
+        "Ed25519PublicKey",
+        "Port",
+        "PublicKey",
+        "Subnet",
+        "Weight",
+    )
+}
+
 
 def _make_wd(name: str) -> str:
     work_dir = os.path.join(path.TEST_WD, "data", name)
@@ -27,6 +48,11 @@ def _make_wd(name: str) -> str:
     return work_dir
 
 
+# Second octet of the 127.X.0.0/16 range that random node addresses are taken from.
+# None means the whole 127.0.0.0/8 subnet. See use_localhost_range().
+_localhost_range: T.Optional[int] = None  # pylint: disable=invalid-name
+
+
 def _random_octet() -> int:
     return random.randint(1, 254)
 
@@ -36,16 +62,28 @@ def _rand_localhost() -> str:
     it without additional configuration. For all others, return 127.0.0.1.
     """
     if _FULL_LOCALHOST_SUBNET:
-        return f"127.{_random_octet()}.{_random_octet()}.{_random_octet()}"
+        second = _random_octet() if _localhost_range is None else _localhost_range
+        return f"127.{second}.{_random_octet()}.{_random_octet()}"
     return "127.0.0.1"
 
 
+def use_localhost_range(index: int) -> str:
+    """Only assign random node addresses from 127.X.0.0/16, where X is derived
+    from index. Used to give each isolated test context its own set of addresses.
+    Return the range in CIDR notation.
+    """
+    global _localhost_range  # pylint: disable=global-statement
+    _localhost_range = index % 254 + 1
+    return f"127.{_localhost_range}.0.0/16"
+
+
 class Feature(Enum):
     """Optional features supported by both tinc and tincd."""
 
     COMP_LZ4 = "comp_lz4"
     COMP_LZO = "comp_lzo"
     COMP_ZLIB = "comp_zlib"
+    CRYPTO_THREADS = "crypto_threads"
     CURSES = "curses"
     JUMBOGRAMS = "jumbograms"
     LEGACY_PROTOCOL = "legacy_protocol"
@@ -60,7 +98,92 @@ class Feature(Enum):
     WATCHDOG = "watchdog"
 
 
-class Tinc:
+# Features of each binary, keyed by its path, modification time and size
+_features: T.Dict[T.Tuple[str, int, int], T.List[str]] = {}
+
+
+def _probe_features(binary: str) -> T.List[str]:
+    """Run `binary --version` and return tokens from its list of features."""
+    res = subp.run(
+        [binary, "--version"],
+        check=True,
+        stdin=subp.DEVNULL,
+        stdout=subp.PIPE,
+        encoding="utf-8",
+        timeout=5,
+    )
+    prefix = "Features: "
+    for line in res.stdout.splitlines():
+        if line.startswith(prefix):
+            return line[len(prefix) :].split()
+    return []
+
+
+def feature_cache_file(binary: str) -> str:
+    """Path to the file with cached features of binary."""
+    digest = hashlib.sha256(os.path.abspath(binary).encode("utf-8")).hexdigest()
+    return os.path.join(path.FEATURE_CACHE_DIR, f"{digest[:16]}.json")
+
+
+def _load_cached_features(binary: str, stat: os.stat_result) -> T.Optional[T.List[str]]:
+    try:
+        with open(feature_cache_file(binary), "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if [entry["mtime_ns"], entry["size"]] != [stat.st_mtime_ns, stat.st_size]:
+        return None
+    return entry["features"]
+
+
+def _save_cached_features(
+    binary: str, stat: os.stat_result, tokens: T.List[str]
+) -> None:
+    """Each binary has its own cache file, which is replaced atomically, so
+    concurrent test processes never see partially written entries.
+    """
+    os.makedirs(path.FEATURE_CACHE_DIR, exist_ok=True)
+    entry = {
+        "binary": binary,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "features": tokens,
+    }
+    fd, tmp = tempfile.mkstemp(dir=path.FEATURE_CACHE_DIR, prefix=".")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(entry, f)
+    os.replace(tmp, feature_cache_file(binary))
+
+
+def _binary_features(binary: str) -> T.List[str]:
+    """Features of binary, probed only if it has changed since it was cached."""
+    stat = os.stat(binary)
+    key = (binary, stat.st_mtime_ns, stat.st_size)
+    if key in _features:
+        return _features[key]
+
+    tokens = _load_cached_features(binary, stat)
+    if tokens is None:
+        tokens = _probe_features(binary)
+        log.info('features of %s: "%s"', binary, tokens)
+        _save_cached_features(binary, stat, tokens)
+
+    _features[key] = tokens
+    return tokens
+
+
+def features() -> T.List[Feature]:
+    """List of features supported by tinc and tincd. They are detected once per
+    build of the binaries, and shared between test processes through a cache file.
+    """
+    return [
+        Feature(token)
+        for binary in (path.TINC_PATH, path.TINCD_PATH)
+        for token in _binary_features(binary)
+    ]
+
+
+class Tinc:  # pylint: disable=too-many-instance-attributes
     """Thin wrapper around Popen that simplifies running tinc/tincd
     binaries by passing required arguments, checking exit codes, etc.
     """
@@ -72,6 +195,7 @@ class Tinc:
     _port: T.Optional[int]
     _scripts: T.Dict[str, TincScript]
     _procs: T.List[subp.Popen]
+    _control: T.Optional[Control]
 
     def __init__(self, name: str = "", addr: str = "") -> None:
         self.name = name if name else random_string(10)
@@ -81,6 +205,7 @@ class Tinc:
         self._port = None
         self._scripts = {}
         self._procs = []
+        self._control = None
 
     def randomize_port(self) -> int:
         """Use a random port for this node."""
@@ -92,21 +217,70 @@ class Tinc:
         """Get the path to the pid file."""
         return os.path.join(_TEMPDIR, f"tinc_{self.name}")
 
-    def read_port(self) -> int:
-        """Read port used by tincd from its pidfile and update the _port field."""
-        log.debug("reading pidfile at %s", self.pid_file)
-
-        with open(self.pid_file, "r", encoding="utf-8") as f:
-            content = f.read()
+    def _parse_pid_file(self) -> T.Optional[T.Tuple[int, int]]:
+        """Return (pid, port) from the pid file, or None if it's missing or incomplete."""
+        try:
+            with open(self.pid_file, "r", encoding="utf-8") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
         log.debug("found data %s", content)
 
+        if not content.endswith("\n"):
+            return None
+
         pid, _, _, token, port = content.split()
         check.equals("port", token)
+        return int(pid), int(port)
+
+    def read_port(self) -> int:
+        """Read port used by tincd from its pidfile and update the _port field."""
+        log.debug("reading pidfile at %s", self.pid_file)
+
+        result = self._parse_pid_file()
+        assert result, f"pidfile {self.pid_file} is missing or incomplete"
 
-        self._port = int(port)
-        self._pid = int(pid)
+        self._pid, self._port = result
         return self._port
 
+    def wait_ready(self, timeout: float = _READY_TIMEOUT) -> int:
+        """Wait until tincd has written its pid file and return the port it's
+        listening on. The pid file is written after all listening sockets are
+        bound, so once it's complete the daemon accepts connections.
+
+        On POSIX systems `tinc start` doesn't return until tincd reports through
+        the umbilical socket that setup is complete, so this returns immediately.
+        On Windows tincd may still be starting, and the pid file is polled.
+        """
+        deadline = time.monotonic() + timeout
+        delay = 0.001
+
+        while self._parse_pid_file() is None:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"node {self} did not start in {timeout} s")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+        return self.read_port()
+
+    def _save_port(self, port: int) -> None:
+        """Put port into the node's host configuration file, like `tinc set Port`."""
+        host = self.sub("hosts", self.name)
+        with open(host, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+
+        def is_port(line: str) -> bool:
+            var = line.replace("=", " ").split(maxsplit=1)
+            return bool(var) and var[0].lower() == "port"
+
+        # Like tinc, replace the first Port line in place, and remove the rest
+        first = next((i for i, line in enumerate(lines) if is_port(line)), len(lines))
+        lines = [line for line in lines if not is_port(line)]
+        lines.insert(first, f"Port = {port}")
+
+        with open(host, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
     @property
     def port(self) -> int:
         """Port that tincd is listening on."""
@@ -119,6 +293,13 @@ class Tinc:
         assert self._pid is not None
         return self._pid
 
+    @property
+    def control(self) -> Control:
+        """Persistent connection to the control socket of this node."""
+        if self._control is None:
+            self._control = Control(self.pid_file)
+        return self._control
+
     def __str__(self) -> str:
         return self.name
 
@@ -136,21 +317,7 @@ class Tinc:
     @property
     def features(self) -> T.List[Feature]:
         """List of features supported by tinc and tincd."""
-        tinc, _ = self.cmd("--version")
-        tincd, _ = self.tincd("--version").communicate(timeout=5)
-        prefix, features = "Features: ", []
-
-        for out in tinc, tincd:
-            for line in out.splitlines():
-                if not line.startswith(prefix):
-                    continue
-                tokens = line[len(prefix) :].split()
-                for token in tokens:
-                    features.append(Feature(token))
-                break
-
-        log.info('supported features: "%s"', features)
-        return features
+        return features()
 
     @property
     def _common_args(self) -> T.List[str]:
@@ -186,6 +353,9 @@ class Tinc:
         """Terminate all tinc and tincd processes started from this instance."""
         log.info("running node cleanup for %s", self)
 
+        if self._control:
+            self._control.close()
+
         try:
             self.cmd("stop")
         except (AssertionError, ValueError):
@@ -210,31 +380,23 @@ class Tinc:
         self._procs.clear()
 
     def start(self, *args: str) -> int:
-        """Start the node, wait for it to call tinc-up, and get the port it's
-        listening on from the pid file. Don't use this method unless you need
-        to know the port tincd is running on. Call .cmd("start"), it's faster.
-
-        Reading pidfile and setting the port cannot be done from tinc-up because
-        you can't send tinc commands to yourself there — the daemon doesn't
-        respond to them until tinc-up is finished. The port field on this Tinc
-        instance is updated to reflect the correct port. If tinc-up is missing,
-        this command creates a new one, and then disables it.
-        """
-        new_script = Script.TINC_UP.name not in self._scripts
-        if new_script:
-            self.add_script(Script.TINC_UP)
+        """Start the node, wait for it to become ready, and get the port it's
+        listening on from the pid file. The port is saved into the host
+        configuration file, so it's included into exported host configs, and
+        the port field on this Tinc instance is updated.
 
-        tinc_up = self[Script.TINC_UP]
+        If the node has an enabled tinc-up script, its notification is consumed
+        (tinc-up runs before tincd reports that it's ready, so this does not wait).
+        """
         self.cmd(*args, "start", "--logfile", self.sub("log"))
-        tinc_up.wait()
-
-        if new_script:
-            tinc_up.disable()
+        port = self.wait_ready()
 
-        self._port = self.read_port()
-        self.cmd("set", "Port", str(self._port))
+        tinc_up = self._scripts.get(Script.TINC_UP.name)
+        if tinc_up and tinc_up.enabled:
+            tinc_up.wait()
 
-        return self._port
+        self._save_port(port)
+        return port
 
     def cmd(
         self,
@@ -303,6 +465,51 @@ class Tinc:
         self._procs.append(proc)
         return proc
 
+    def init_fast(self, config: str = "") -> None:
+        """Initialize the node like `tinc init` followed by the passed tinc
+        script does, but without running tinc. Keys are taken from a pool of
+        pre-generated keys (see testlib.keys). Only `set VAR VALUE` and
+        `add VAR VALUE` commands are supported, with VAR optionally prefixed
+        by 'NODE.' to write into host configuration of another node.
+        """
+        server: T.List[T.Tuple[str, str]] = []
+        hosts: T.Dict[str, T.List[T.Tuple[str, str]]] = {self.name: []}
+
+        for line in config.splitlines():
+            tokens = line.split(maxsplit=2)
+            if not tokens:
+                continue
+            if len(tokens) != 3 or tokens[0] not in ("set", "add"):
+                raise ValueError(f'unsupported command "{line.strip()}"')
+
+            action, var, value = tokens
+            node, _, var = var.rpartition(".")
+            if not node and var.lower() in _HOST_VARIABLES:
+                node, var = self.name, _HOST_VARIABLES[var.lower()]
+
+            entries = hosts.setdefault(node, []) if node else server
+            if action == "set":
+                entries[:] = [(k, v) for k, v in entries if k.lower() != var.lower()]
+            if (var, value) not in entries:
+                entries.append((var, value))
+
+        def write(file: str, prefix: str, entries: T.List[T.Tuple[str, str]]) -> None:
+            lines = [prefix] + [f"{var} = {value}" for var, value in entries]
+            with open(file, "w", encoding="utf-8") as f:
+                f.write("\n".join(filter(None, lines)) + "\n")
+
+        log.debug("fast init of node %s", self.name)
+        for subdir in "hosts", "cache":
+            os.makedirs(self.sub(subdir), exist_ok=True)
+
+        key = keys.take(Feature.LEGACY_PROTOCOL in features())
+        key.install(self._work_dir)
+        write(self.sub("tinc.conf"), f"Name = {self.name}", server)
+
+        for node, entries in hosts.items():
+            public = key.public.strip() if node == self.name else ""
+            write(self.sub("hosts", node), public, entries)
+
     def add_script(self, script: ScriptType, source: str = "") -> TincScript:
         """Create a script with the passed Python source code.
         The source must either be empty, or start indentation with 4 spaces.
@@ -0,0 +1,382 @@
+"""Relay that emulates a WAN link between tinc nodes running on loopback.
+
+Each node added to the relay listens on BIND_ADDRESS, and the relay listens on
+RELAY_ADDRESS with the same port (TCP and UDP). Nodes advertise the relay's
+address as their own, so all traffic between them goes through the relay,
+which forwards it with the configured delay, jitter, loss, duplication,
+reordering and bandwidth cap. Since both addresses share the port, the address
+tincd learns from a meta connection leads back to the relay as well.
+
+The relay can also move UDP traffic of roaming nodes to a new source port from
+time to time, like a NAT whose mappings expire, so their peers see them roam.
+
+Everything runs in an asyncio event loop in a background thread of the test
+process, so neither root nor tc/netem is needed. Only Linux routes the whole
+127.0.0.0/8 network to the loopback interface without extra configuration.
+"""
+
+import os
+import socket
+import random
+import asyncio
+import threading
+import functools
+import contextlib
+import collections
+import typing as T
+
+from .log import log
+from .proc import Tinc
+
+# Address nodes listen on, not used by anything else
+BIND_ADDRESS = "127.0.0.2"
+
+# Address the relay listens on, advertised by nodes as theirs
+RELAY_ADDRESS = "127.0.0.1"
+
+# Size of buffers used to read from TCP connections
+_TCP_CHUNK = 1 << 16
+
+
+class Impairment(T.NamedTuple):
+    """Conditions applied to each direction of the link separately. Loss,
+    duplication and reordering only affect UDP: TCP data is delayed and rate
+    limited, but always arrives in order.
+    """
+
+    delay: float = 0.0  # one-way delay in seconds
+    jitter: float = 0.0  # delay varies uniformly by up to this much either way
+    loss: float = 0.0  # probability that a datagram is dropped
+    duplicate: float = 0.0  # probability that a datagram is sent twice
+    reorder: float = 0.0  # probability that a datagram is held back...
+    reorder_delay: float = 0.01  # ...by this many seconds, letting others pass
+    rate: float = 0.0  # bandwidth cap in bytes per second, 0 for none
+    limit: int = 1000  # datagrams held in one direction before the rest is dropped
+    rebind: float = 0.0  # seconds between source port changes of roaming nodes
+
+
+class _Link:
+    """State of one direction of the link."""
+
+    free_at: float  # when the bandwidth cap lets the next packet through
+    held: int  # datagrams waiting to be delivered
+    front: T.Optional["_Front"]  # replaces the sender's socket after rebinding
+    bound_at: float  # when front was opened
+    rebinding: bool  # a new front is being opened
+
+    def __init__(self) -> None:
+        self.free_at = 0.0
+        self.held = 0
+        self.front = None
+        self.bound_at = 0.0
+        self.rebinding = False
+
+
+class _Emulation:
+    """Link emulation state shared by all links of the relay."""
+
+    impairment: Impairment
+    rng: random.Random
+    # Ports of nodes whose source port changes (see Relay.roam())
+    roaming: T.Set[int]
+    # Directions of the link by (source port, destination port)
+    links: T.Dict[T.Tuple[int, int], _Link]
+    # Counters returned by Relay.stats()
+    stats: T.Dict[str, int]
+
+    def __init__(self, impairment: Impairment, rng: random.Random) -> None:
+        self.impairment = impairment
+        self.rng = rng
+        self.roaming = set()
+        self.links = collections.defaultdict(_Link)
+        self.stats = collections.defaultdict(int)
+
+
+# Called with a datagram, its source address and the port it came to
+_Forward = T.Callable[[bytes, T.Tuple[str, int], int], None]
+
+
+class _Front(asyncio.DatagramProtocol):
+    """UDP socket of the relay standing in for one node."""
+
+    transport: asyncio.DatagramTransport
+
+    def __init__(self, forward: _Forward, port: int) -> None:
+        self._forward = forward
+        self._port = port
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = T.cast(asyncio.DatagramTransport, transport)
+
+    def datagram_received(self, data: bytes, addr: T.Tuple[str, int]) -> None:
+        self._forward(data, addr, self._port)
+
+
+class Relay:
+    """WAN emulator for tinc nodes. Add nodes with add() before they start,
+    change impairment at any time, and close() the relay when done.
+    Counters of what happened to the traffic are returned by stats().
+    """
+
+    _emulation: _Emulation
+    _loop: asyncio.AbstractEventLoop
+    _worker: threading.Thread
+    _fronts: T.Dict[int, _Front]
+    _ports: T.Dict[str, int]
+    _servers: T.List[asyncio.AbstractServer]
+    _tasks: T.Set[asyncio.Task]
+
+    def __init__(
+        self, impairment: Impairment = Impairment(), seed: T.Optional[int] = None
+    ) -> None:
+        self._emulation = _Emulation(impairment, random.Random(seed))
+        self._fronts = {}
+        self._ports = {}
+        self._servers = []
+        self._tasks = set()
+        self._loop = asyncio.new_event_loop()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    @property
+    def impairment(self) -> Impairment:
+        """Conditions applied to traffic from now on."""
+        return self._emulation.impairment
+
+    @impairment.setter
+    def impairment(self, impairment: Impairment) -> None:
+        self._emulation.impairment = impairment
+
+    def add(self, node: Tinc) -> str:
+        """Open relay sockets for node, and return tinc commands which put the
+        node behind them. Apply them to the node before it starts, after any
+        other commands that set its address or port.
+        """
+        port = self._call(self._open())
+        log.info("relaying %s at %s port %d", node, RELAY_ADDRESS, port)
+        self._ports[node.name] = port
+        return os.linesep.join(
+            [
+                f"set Port {port}",
+                f"set BindToAddress {BIND_ADDRESS}",
+                f"set Address {RELAY_ADDRESS}",
+                "set LocalDiscovery no",
+            ]
+        )
+
+    def roam(self, node: Tinc) -> None:
+        """Move datagrams from node to a new source port every time the rebind
+        interval of the impairment passes. Replies to the old port are lost.
+        """
+        self._emulation.roaming.add(self._ports[node.name])
+
+    def stats(self) -> T.Dict[str, int]:
+        """Counters of forwarded, lost, duplicated, reordered and dropped
+        datagrams, and of bytes forwarded over TCP.
+        """
+        return self._call(self._copy_stats())
+
+    def close(self) -> None:
+        """Close all sockets and stop the relay."""
+        self._call(self._close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._worker.join()
+        self._loop.close()
+
+    def __enter__(self) -> "Relay":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def _call(self, coro: T.Coroutine[T.Any, T.Any, T.Any]) -> T.Any:
+        """Run coroutine on the worker event loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    async def _copy_stats(self) -> T.Dict[str, int]:
+        return dict(self._emulation.stats)
+
+    async def _open(self) -> int:
+        """Open UDP and TCP sockets on the same free port, and return it."""
+        while True:
+            udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            udp.bind((RELAY_ADDRESS, 0))
+            port = udp.getsockname()[1]
+            try:
+                server = await asyncio.start_server(
+                    functools.partial(self._accept_tcp, port=port),
+                    RELAY_ADDRESS,
+                    port,
+                )
+                break
+            except OSError:
+                udp.close()
+
+        _, front = await self._loop.create_datagram_endpoint(
+            lambda: _Front(self._forward_udp, port), sock=udp
+        )
+        self._fronts[port] = front
+        self._servers.append(server)
+        return port
+
+    async def _close(self) -> None:
+        for front in self._fronts.values():
+            front.transport.close()
+        for link in self._emulation.links.values():
+            if link.front:
+                link.front.transport.close()
+        for server in self._servers:
+            server.close()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _delay(self, link: _Link, size: int) -> float:
+        """Compute how long a packet of size bytes spends in link, including
+        waiting for the packets before it to get through the bandwidth cap.
+        """
+        imp = self.impairment
+        now = self._loop.time()
+        depart = now
+
+        if imp.rate:
+            depart = max(now, link.free_at)
+            link.free_at = depart + size / imp.rate
+
+        delay = depart - now + imp.delay
+        if imp.jitter:
+            delay += self._emulation.rng.uniform(-imp.jitter, imp.jitter)
+        return max(0.0, delay)
+
+    def _forward_udp(self, data: bytes, addr: T.Tuple[str, int], port: int) -> None:
+        """Forward a datagram from the node at addr to the node behind port."""
+        emu = self._emulation
+        src = self._fronts.get(addr[1])
+        if addr[0] != BIND_ADDRESS or not src:
+            emu.stats["udp_unknown"] += 1
+            return
+
+        imp = emu.impairment
+        if emu.rng.random() < imp.loss:
+            emu.stats["udp_lost"] += 1
+            return
+
+        copies = 1
+        if emu.rng.random() < imp.duplicate:
+            emu.stats["udp_duplicated"] += 1
+            copies = 2
+
+        link = emu.links[addr[1], port]
+        if imp.rebind and addr[1] in emu.roaming and not link.rebinding:
+            if self._loop.time() - link.bound_at >= imp.rebind:
+                link.rebinding = True
+                task = self._loop.create_task(self._rebind(link, addr[1]))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+        for _ in range(copies):
+            if link.held >= imp.limit:
+                emu.stats["udp_dropped"] += 1
+                continue
+
+            delay = self._delay(link, len(data))
+            if emu.rng.random() < imp.reorder:
+                emu.stats["udp_reordered"] += 1
+                delay += imp.reorder_delay
+
+            link.held += 1
+            self._loop.call_later(
+                delay, self._deliver_udp, src, link, data, (BIND_ADDRESS, port)
+            )
+
+    async def _rebind(self, link: _Link, port: int) -> None:
+        """Open a new socket for link, which carries datagrams from the node
+        behind port. Replies that come to it are passed back to that node.
+        """
+        _, front = await self._loop.create_datagram_endpoint(
+            lambda: _Front(self._forward_udp, port), local_addr=(RELAY_ADDRESS, 0)
+        )
+        if link.front:
+            link.front.transport.close()
+        link.front = front
+        link.bound_at = self._loop.time()
+        link.rebinding = False
+        self._emulation.stats["udp_rebound"] += 1
+
+    def _deliver_udp(
+        self, src: _Front, link: _Link, data: bytes, addr: T.Tuple[str, int]
+    ) -> None:
+        link.held -= 1
+        src = link.front or src
+        if not src.transport.is_closing():
+            src.transport.sendto(data, addr)
+            self._emulation.stats["udp_forwarded"] += 1
+
+    def _accept_tcp(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, port: int
+    ) -> None:
+        """Relay a connection that came to port on a task close() can cancel."""
+        task = self._loop.create_task(self._relay_tcp(reader, writer, port))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _relay_tcp(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, port: int
+    ) -> None:
+        """Connect to the node behind port, and pass data between it and the
+        connection that came to the relay in both directions.
+        """
+        try:
+            up_reader, up_writer = await asyncio.open_connection(
+                BIND_ADDRESS, port, local_addr=(RELAY_ADDRESS, 0)
+            )
+        except OSError as ex:
+            log.info("relay could not connect to port %d: %s", port, ex)
+            writer.close()
+            return
+
+        # Cancelled by close(). Both pipes close their writers on the way out,
+        # and the server expects the handler to finish without an error.
+        with contextlib.suppress(asyncio.CancelledError):
+            await asyncio.gather(
+                self._pipe(reader, up_writer), self._pipe(up_reader, writer)
+            )
+
+    async def _pipe(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Pass data from reader to writer, delaying it in order."""
+        link = _Link()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def send() -> None:
+            deliver_at = 0.0
+            while True:
+                at, data = await queue.get()
+                # Jitter must not reorder data within the stream
+                deliver_at = max(deliver_at, at)
+                await asyncio.sleep(deliver_at - self._loop.time())
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+                self._emulation.stats["tcp_bytes"] += len(data)
+
+        sender = self._loop.create_task(send())
+        try:
+            while True:
+                data = await reader.read(_TCP_CHUNK)
+                delay = self._delay(link, len(data))
+                queue.put_nowait((self._loop.time() + delay, data))
+                if not data:
+                    break
+            await sender
+        except OSError as ex:
+            log.debug("relayed connection failed", exc_info=ex)
+        finally:
+            sender.cancel()
+            writer.close()
@@ -0,0 +1,73 @@
+"""Minimal runtime for tincd scripts created from template/script.py.tpl.
+
+Each script invocation imports this module, so it is kept cheap: it only builds
+a Notification and sends it to the test process. Importing it does not start
+servers, configure logging or touch the filesystem, unlike testlib.proc and the
+modules it pulls in, which scripts should only import if they really need them.
+"""
+
+import logging
+import os
+import time
+import typing as T
+
+from .event import Address, Notification, Notifier
+
+LOG_FORMAT = "%(asctime)s %(name)s %(filename)s:%(lineno)d %(levelname)s %(message)s"
+
+# How many times to try sending a notification before giving up
+_ATTEMPTS = 10
+_RETRY_DELAY = 0.1
+
+
+def new_logger(name: str, log_dir: str) -> logging.Logger:
+    """Create a logger writing into 'name.log' in log_dir. The file is only
+    opened when the first message is logged.
+    """
+    handler = logging.FileHandler(os.path.join(log_dir, f"{name}.log"), delay=True)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+    return logger
+
+
+def make_notification(
+    test: str,
+    node: str,
+    script: str,
+    args: T.Optional[T.Dict[str, T.Any]] = None,
+    error: T.Optional[Exception] = None,
+) -> Notification:
+    """Create notification about a finished script."""
+    evt = Notification()
+    evt.test = test
+    evt.node = node
+    evt.script = script
+    evt.args = args or {}
+    evt.error = error
+    return evt
+
+
+def notify(
+    address: Address,
+    authkey: bytes,
+    evt: Notification,
+    log: logging.Logger,
+) -> bool:
+    """Send notification to the test process, retrying a few times if it cannot
+    be reached. Returns False if it was not sent.
+    """
+    log.debug("sending notification to %s", address)
+
+    for _ in range(_ATTEMPTS):
+        try:
+            with Notifier(address, authkey) as conn:
+                conn.send(evt)
+            log.debug("sent notification")
+            return True
+        except OSError as ex:
+            log.error("notification failed", exc_info=ex)
+            time.sleep(_RETRY_DELAY)
+
+    return False
@@ -44,6 +44,16 @@ class TincScript:
     def __str__(self):
         return f"{self._node}/{self._script}"
 
+    @property
+    def node(self) -> str:
+        """Name of the node the script belongs to."""
+        return self._node
+
+    @property
+    def name(self) -> str:
+        """Script path relative to the node's working directory."""
+        return self._script
+
     @T.overload
     def wait(self) -> Notification:
         """Wait for the script to finish, returning the notification sent by the script."""
@@ -62,6 +72,31 @@ class TincScript:
             return notifications.get(self._node, self._script)
         return notifications.get(self._node, self._script, timeout)
 
+    async def wait_async(
+        self, timeout: T.Optional[float] = None
+    ) -> T.Optional[Notification]:
+        """Wait for the script to finish without blocking the event loop or
+        occupying a thread. Returns None if nothing arrives before timeout expires.
+        """
+        log.debug("waiting asynchronously for script %s/%s", self._node, self._script)
+        return await notifications.get_async(self._node, self._script, timeout)
+
+    @staticmethod
+    async def wait_any(
+        *scripts: "TincScript", timeout: T.Optional[float] = None
+    ) -> T.Optional[T.Tuple["TincScript", Notification]]:
+        """Wait for the first of the passed scripts to finish. Returns the script
+        and its notification, or None if nothing arrives before timeout expires.
+        Notifications from other scripts are kept for later wait() calls.
+        """
+        by_key = {str(script): script for script in scripts}
+        pairs = [(script.node, script.name) for script in scripts]
+        res = await notifications.get_any_async(pairs, timeout)
+        if res is None:
+            return None
+        key, notification = res
+        return by_key[key], notification
+
     @property
     def enabled(self) -> bool:
         """Check if script is enabled."""
@@ -0,0 +1,377 @@
+"""Helpers for running sptps_test, the standalone SPTPS test program."""
+
+import os
+import re
+import time
+import random
+import socket
+import threading
+import subprocess as subp
+import typing as T
+
+from . import path
+from .log import log
+
+# Statistics of a single transfer. Must be serializable to JSON.
+Stats = T.Dict[str, T.Any]
+
+# Largest record sptps_test sends in datagram mode (one read from stdin)
+DATAGRAM_RECORD = 1460
+
+# How long to wait for the handshake before restarting both sides
+_HANDSHAKE_TIMEOUT = 1.0
+
+# How many times the handshake is attempted before giving up
+_HANDSHAKE_ATTEMPTS = 100
+
+# Datagram mode has no end of stream: the server is stopped after this much silence
+_IDLE = 0.5
+
+# How often the relay checks if it has been closed
+_RELAY_POLL = 0.1
+
+_PORT_RE = re.compile(r"Listening on (\d+)\.\.\.")
+_HANDSHAKE = "Handshake completed"
+
+# Messages printed by sptps_check_seqno() in src/sptps.c
+_WINDOW_EVENTS = {
+    "lost_resync": re.compile(r"^Lost \d+ packets"),
+    "dropped_future": re.compile(r"^Packet is \d+ seqs in the future"),
+    "dropped_late": re.compile(r"^Received late or replayed packet"),
+}
+
+
+class Impairment(T.NamedTuple):
+    """Damage done to datagrams sent by the client after the handshake, which
+    sptps_test can't simulate by itself. reorder percent of them are held back
+    and sent after the next distance datagrams, duplicate percent are sent twice.
+    """
+
+    reorder: float = 0.0
+    distance: int = 0
+    duplicate: float = 0.0
+
+
+class _Relay:  # pylint: disable=too-many-instance-attributes
+    """Forwards datagrams between an sptps_test client and server on localhost,
+    damaging the ones sent by the client once enabled.
+    """
+
+    port: int
+    enabled: bool
+    reordered: int
+    duplicated: int
+    _impair: Impairment
+    _sock: socket.socket
+    _server: T.Tuple[str, int]
+    _client: T.Optional[T.Tuple[str, int]]
+    _held: T.List[T.Tuple[int, bytes]]
+    _count: int
+    _rand: random.Random
+    _stop: threading.Event
+    _thread: threading.Thread
+
+    def __init__(self, server_port: int, impair: Impairment) -> None:
+        self._impair = impair
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.settimeout(_RELAY_POLL)
+        self.port = self._sock.getsockname()[1]
+        self._server = ("127.0.0.1", server_port)
+        self._client = None
+        self.enabled = False
+        self.reordered = self.duplicated = self._count = 0
+        self._held = []
+        self._rand = random.Random(server_port)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                data, addr = self._sock.recvfrom(1 << 16)
+            except socket.timeout:
+                continue
+            if addr == self._server:
+                if self._client:
+                    self._sock.sendto(data, self._client)
+            else:
+                self._client = addr
+                self._forward(data)
+
+    def _chance(self, percent: float) -> bool:
+        return self.enabled and self._rand.random() * 100 < percent
+
+    def _forward(self, data: bytes) -> None:
+        self._count += 1
+        if self._chance(self._impair.reorder):
+            self._held.append((self._count + self._impair.distance, data))
+            self.reordered += 1
+        else:
+            self._sock.sendto(data, self._server)
+            if self._chance(self._impair.duplicate):
+                self._sock.sendto(data, self._server)
+                self.duplicated += 1
+
+        while self._held and self._held[0][0] <= self._count:
+            self._sock.sendto(self._held.pop(0)[1], self._server)
+
+    def close(self) -> None:
+        """Stop forwarding. Datagrams still held back are dropped."""
+        self._stop.set()
+        self._thread.join()
+        self._sock.close()
+
+
+class Keypair:
+    """Create public/private keypair using sptps_keypair."""
+
+    private: str
+    public: str
+
+    def __init__(self, name: str) -> None:
+        self.private = os.path.join(path.TEST_WD, f"{name}.priv")
+        self.public = os.path.join(path.TEST_WD, f"{name}.pub")
+        subp.run([path.SPTPS_KEYPAIR_PATH, self.private, self.public], check=True)
+
+
+class _Peer:  # pylint: disable=too-many-instance-attributes
+    """A running sptps_test process whose output is consumed by background
+    threads, so it can't block on a full pipe while being measured.
+    """
+
+    proc: subp.Popen
+    port: int
+    connected: float
+    handshake: float
+    nbytes: int
+    last: float
+    events: T.Dict[str, int]
+    _ready: threading.Event
+    _done: threading.Event
+    _threads: T.List[threading.Thread]
+
+    def __init__(self, cmd: T.List[str], stdin: T.Any) -> None:
+        log.debug('starting "%s"', " ".join(cmd))
+        # pylint: disable=consider-using-with
+        self.proc = subp.Popen(cmd, stdin=stdin, stdout=subp.PIPE, stderr=subp.PIPE)
+        self.port = 0
+        self.connected = self.handshake = self.last = 0.0
+        self.nbytes = 0
+        self.events = dict.fromkeys(_WINDOW_EVENTS, 0)
+        self._ready = threading.Event()
+        self._done = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._read_stderr, daemon=True),
+            threading.Thread(target=self._read_stdout, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _read_stderr(self) -> None:
+        assert self.proc.stderr
+        for raw in self.proc.stderr:
+            line = raw.decode("utf-8", "replace").strip()
+            match = _PORT_RE.match(line)
+            if match:
+                self.port = int(match[1])
+                self._ready.set()
+            elif line == "Connected":
+                self.connected = time.monotonic()
+            elif line == _HANDSHAKE and not self.handshake:
+                self.handshake = time.monotonic()
+                self._done.set()
+            else:
+                self._count_event(line)
+        self._ready.set()
+        self._done.set()
+
+    def _count_event(self, line: str) -> None:
+        for name, regex in _WINDOW_EVENTS.items():
+            if regex.match(line):
+                self.events[name] += 1
+                return
+        log.debug("sptps_test %d: %s", self.proc.pid, line)
+
+    def _read_stdout(self) -> None:
+        assert self.proc.stdout
+        while True:
+            data = self.proc.stdout.read1(1 << 16)  # type: ignore
+            if not data:
+                break
+            self.nbytes += len(data)
+            self.last = time.monotonic()
+
+    def wait_port(self) -> int:
+        """Wait until the server starts listening and return its port."""
+        self._ready.wait(_HANDSHAKE_TIMEOUT)
+        return self.port
+
+    def wait_handshake(self, timeout: float) -> bool:
+        """Wait until the handshake completes or the process exits."""
+        return self._done.wait(timeout) and bool(self.handshake)
+
+    def idle(self, seconds: float) -> bool:
+        """Has nothing been received for this many seconds?"""
+        return time.monotonic() - max(self.last, self.handshake) > seconds
+
+    def stop(self) -> None:
+        """Kill the process if it's still running and wait for the output."""
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        for thread in self._threads:
+            thread.join()
+        for pipe in self.proc.stdout, self.proc.stderr:
+            assert pipe
+            pipe.close()
+
+
+def _feed(pipe: T.IO[bytes], data_path: str, rate: float) -> None:
+    """Write contents of data_path to pipe at rate datagram records per second,
+    then close the pipe.
+    """
+    with pipe:
+        with open(data_path, "rb") as f:
+            start = time.monotonic()
+            sent = 0
+            while True:
+                due = int((time.monotonic() - start) * rate) - sent
+                if due <= 0:
+                    time.sleep(1e-3)
+                    continue
+                data = f.read(due * DATAGRAM_RECORD)
+                if not data:
+                    return
+                pipe.write(data)
+                pipe.flush()
+                sent += due
+
+
+class _Pair(T.NamedTuple):
+    client: _Peer
+    server: _Peer
+    relay: T.Optional[_Relay]
+    attempts: int
+
+    def stop(self) -> None:
+        """Stop both sides and the relay between them."""
+        self.client.stop()
+        self.server.stop()
+        if self.relay:
+            self.relay.close()
+
+
+def _start_pair(
+    server_key: Keypair,
+    client_key: Keypair,
+    data_path: T.Optional[str],
+    flags: T.List[str],
+    impair: T.Optional[Impairment],
+) -> _Pair:
+    """Start server and client, and wait until both finish the handshake.
+    Lost handshake packets are not retransmitted by sptps_test, so both
+    sides are restarted if it takes too long. The client reads data_path,
+    or a pipe if it's None. If impair is set, the client talks to the server
+    through a relay, which starts damaging datagrams after the handshake.
+    """
+    for attempt in range(1, _HANDSHAKE_ATTEMPTS + 1):
+        cmd = [path.SPTPS_TEST_PATH, "-4", "-r", *flags]
+        server = _Peer([*cmd, server_key.private, client_key.public, "0"], subp.DEVNULL)
+        port = server.wait_port()
+
+        relay = _Relay(port, impair) if impair else None
+        if relay:
+            port = relay.port
+
+        cmd = [path.SPTPS_TEST_PATH, "-4", "-w", "-q", *flags]
+        cmd += [client_key.private, server_key.public, "localhost", str(port)]
+        if data_path is None:
+            client = _Peer(cmd, subp.PIPE)
+        else:
+            with open(data_path, "rb") as data:
+                client = _Peer(cmd, data)
+
+        pair = _Pair(client, server, relay, attempt)
+        if all(p.wait_handshake(_HANDSHAKE_TIMEOUT) for p in (client, server)):
+            if relay:
+                relay.enabled = True
+            return pair
+
+        log.debug("handshake attempt %d failed, restarting", attempt)
+        pair.stop()
+
+    raise RuntimeError(f"no handshake after {_HANDSHAKE_ATTEMPTS} attempts")
+
+
+def _flags(datagram: bool, loss: int, replay_window: T.Optional[int]) -> T.List[str]:
+    flags = [f"--packet-loss={loss}"]
+    if replay_window is not None:
+        flags.append(f"--replay-window={replay_window}")
+    if datagram:
+        flags.append("--datagram")
+    return flags
+
+
+def transfer(  # pylint: disable=too-many-arguments,too-many-locals
+    server_key: Keypair,
+    client_key: Keypair,
+    data_path: str,
+    *,
+    datagram: bool = False,
+    loss: int = 0,
+    replay_window: T.Optional[int] = None,
+    rate: T.Optional[float] = None,
+    impair: T.Optional[Impairment] = None,
+) -> Stats:
+    """Send the contents of data_path from an sptps_test client to a server
+    and return statistics. loss is the percentage of packets dropped by each
+    side on receipt (see --packet-loss), replay_window is the replay window
+    size in bytes (see --replay-window), None means the SPTPS default.
+
+    sptps_test sends as fast as it can read its input, so in datagram mode
+    most packets would be dropped by the kernel on the receiving side. If rate
+    is set, input is written at that many records per second instead.
+
+    --packet-loss drops packets uniformly and never changes their order, so
+    late, replayed and far-future packets (see sptps_check_seqno()) can only
+    be simulated by passing impair, which is applied in datagram mode.
+    """
+    flags = _flags(datagram, loss, replay_window)
+    size = os.path.getsize(data_path)
+    log.info("sending %d bytes through sptps_test with flags %s", size, flags)
+
+    source = None if rate else data_path
+    impair = impair if datagram else None
+    pair = _start_pair(server_key, client_key, source, flags, impair)
+    client, server, relay = pair.client, pair.server, pair.relay
+    try:
+        handshake = max(client.handshake, server.handshake)
+        if rate:
+            assert client.proc.stdin
+            _feed(client.proc.stdin, data_path, rate)
+        client.proc.wait()
+
+        # Stream mode server exits when the client closes the connection
+        while server.proc.poll() is None and not server.idle(_IDLE):
+            time.sleep(_IDLE / 10)
+    finally:
+        pair.stop()
+
+    seconds = max(server.last - handshake, 1e-9)
+    stats: Stats = {
+        "bytes_sent": size,
+        "bytes_received": server.nbytes,
+        "delivered": server.nbytes / size if size else 1.0,
+        "seconds": seconds,
+        "goodput_mbit_per_second": server.nbytes * 8 / seconds / 1e6,
+        "handshake_seconds": handshake - client.connected,
+        "handshake_attempts": pair.attempts,
+        "reordered": relay.reordered if relay else 0,
+        "duplicated": relay.duplicated if relay else 0,
+        **server.events,
+    }
+    log.info("sptps_test transfer: %s", stats)
+    return stats
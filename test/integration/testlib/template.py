@@ -1,6 +1,7 @@
 """Various script and configuration file templates."""
 
 import os
+import re
 import typing as T
 from string import Template
 
@@ -10,6 +11,9 @@ from .notification import notifications
 
 _CMD_VARS = os.linesep.join([f"set {var}={val}" for var, val in path.env.items()])
 
+# Names which make a script import the full testlib.proc
+_NODE_NAMES = re.compile(r"\b(Tinc|this)\b")
+
 
 def _read_template(tpl_name: str, maps: T.Dict[str, T.Any]) -> str:
     tpl_path = path.TESTLIB_ROOT.joinpath("template", tpl_name)
@@ -18,13 +22,20 @@ def _read_template(tpl_name: str, maps: T.Dict[str, T.Any]) -> str:
 
 
 def make_script(node: str, script: str, source: str) -> str:
-    """Create a tincd script."""
+    """Create a tincd script. Scripts only import the lightweight testlib.runtime,
+    unless their source refers to Tinc or to 'this' (the node running the script).
+    """
+    imports = ""
+    if _NODE_NAMES.search(source):
+        imports = f"from testlib.proc import Tinc\nthis = Tinc('{node}')\n"
     addr = notifications.address
     if isinstance(addr, str):
         addr = f'r"{addr}"'  # 'r' is for Windows pipes: \\.\foo\bar
     maps = {
         "AUTH_KEY": notifications.authkey,
         "CWD": path.CWD,
+        "LOG_DIR": os.path.join(path.TEST_WD, "logs"),
+        "NODE_IMPORTS": imports,
         "NODE_NAME": node,
         "NOTIFICATIONS_ADDR": addr,
         "PYTHON_PATH": path.PYTHON_PATH,
@@ -2,7 +2,6 @@
 
 import os
 import sys
-import multiprocessing.connection as mpc
 import typing as T
 import time
 import signal
@@ -19,33 +18,13 @@ sys.excepthook = on_error
 os.chdir(r'$CWD')
 sys.path.append(r'$SRC_ROOT')
 
-from testlib.proc import Tinc
-from testlib.event import Notification
-from testlib.log import new_logger
-from testlib.const import MPC_FAMILY
-
-this = Tinc('$NODE_NAME')
-log = new_logger(this.name)
-
-def notify_test(args: T.Dict[str, T.Any] = {}, error: T.Optional[Exception] = None):
-    log.debug(f'sending notification to %s', $NOTIFICATIONS_ADDR)
-
-    evt = Notification()
-    evt.test = '$TEST_NAME'
-    evt.node = '$NODE_NAME'
-    evt.script = '$SCRIPT_NAME'
-    evt.args = args
-    evt.error = error
-
-    for retry in range(1, 10):
-        try:
-            with mpc.Client($NOTIFICATIONS_ADDR, family=MPC_FAMILY, authkey=$AUTH_KEY) as conn:
-                conn.send(evt)
-            log.debug(f'sent notification')
-            break
-        except Exception as ex:
-            log.error(f'notification failed', exc_info=ex)
-            time.sleep(0.5)
+from testlib.runtime import make_notification, new_logger, notify
+$NODE_IMPORTS
+log = new_logger('$NODE_NAME', r'$LOG_DIR')
+
+def notify_test(args: T.Optional[T.Dict[str, T.Any]] = None, error: T.Optional[Exception] = None):
+    evt = make_notification('$TEST_NAME', '$NODE_NAME', '$SCRIPT_NAME', args, error)
+    notify($NOTIFICATIONS_ADDR, $AUTH_KEY, evt, log)
 
 try:
     log.debug('running user code')
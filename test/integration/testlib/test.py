@@ -21,21 +21,28 @@ class Test:
         self._nodes = []
         self.name = name
 
-    def node(self, addr: str = "", init: T.Union[str, bool] = "") -> Tinc:
-        """Create a Tinc instance and remember it for termination on exit."""
+    def node(
+        self, addr: str = "", init: T.Union[str, bool] = "", fast: bool = False
+    ) -> Tinc:
+        """Create a Tinc instance and remember it for termination on exit.
+        If fast is True, configuration is written directly (see Tinc.init_fast)
+        instead of running `tinc init`. Use it unless you're testing tinc itself.
+        """
         node = Tinc(addr=addr)
         self._nodes.append(node)
         if init:
             if isinstance(init, bool):
                 init = ""
             stdin = f"""
-                init {node}
                 set Port 0
                 set Address localhost
                 set DeviceType dummy
                 {init}
             """
-            node.cmd(stdin=stdin)
+            if fast:
+                node.init_fast(stdin)
+            else:
+                node.cmd(stdin=f"init {node}{stdin}")
         return node
 
     def __str__(self) -> str:
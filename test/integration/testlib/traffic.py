@@ -0,0 +1,609 @@
+"""Simple traffic generator for measuring throughput and latency through tinc tunnels.
+
+Senders and receivers run in separate processes (usually inside network
+namespaces) started with `python -m testlib.traffic`. Each of them prints
+a JSON object with statistics as the last line of its output.
+
+inject() bypasses the network stack: it writes IPv4 packets directly into
+the fd device of one tincd and reads them from the fd device of another
+(see testlib.fd_tunnel), so it needs neither root nor network namespaces.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import errno
+import select
+import contextlib
+import socket
+import struct
+import subprocess as subp
+import typing as T
+
+from . import bench, external as ext, path
+from .event import time_ns
+from .log import log
+
+# Statistics reported by senders and receivers
+Stats = T.Dict[str, float]
+
+# Directory that contains testlib, used as working directory for generator processes
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# UDP datagram size. Leaves space for headers within the default MTU.
+UDP_SIZE = 1400
+
+# Size of buffers passed to send() when TCP is used
+_TCP_CHUNK = 1 << 16
+
+# UDP receiver stops after not getting anything for this long
+_UDP_IDLE = 1.0
+
+# How long to wait for the first byte before giving up
+_START_TIMEOUT = 10.0
+
+# Latency probe header: sequence number and time it was sent (from time.perf_counter())
+_PROBE = struct.Struct("!Qd")
+
+# Header of injected packets: run ID, sequence number and time they were sent
+# (from time_ns(), which uses the same clock in all processes)
+_INJECTED = struct.Struct("!IQQ")
+
+# Size of IPv4 and UDP headers of injected packets
+_IP_UDP_HEADERS = 28
+
+# Errors ignored by UDP senders when the kernel or the tunnel is temporarily full
+_UDP_TRANSIENT = (errno.ENOBUFS, errno.EAGAIN, errno.ECONNREFUSED)
+
+
+def payload(size: int) -> bytes:
+    """Build compressible payload, similar to typical text traffic."""
+    text = b"tinc is a Virtual Private Network daemon that uses tunnelling. "
+    return (text * (size // len(text) + 1))[:size]
+
+
+def _checksum(data: bytes) -> int:
+    """Internet checksum (RFC 1071) of data of even length."""
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+def ipv4_packet(src: str, dst: str, data: bytes) -> bytes:
+    """Build an IPv4 packet with a UDP datagram carrying data from src to dst,
+    both going to the discard port. The UDP checksum is left out.
+    """
+    header = struct.pack(
+        "!BBHHHBBH4s4s",
+        0x45,
+        0,
+        _IP_UDP_HEADERS + len(data),
+        0,
+        0x4000,
+        64,
+        socket.IPPROTO_UDP,
+        0,
+        socket.inet_aton(src),
+        socket.inet_aton(dst),
+    )
+    header = header[:10] + struct.pack("!H", _checksum(header)) + header[12:]
+    udp = struct.pack("!HHHH", 9, 9, 8 + len(data), 0)
+    return header + udp + data
+
+
+def _stats(nbytes: int, packets: int, seconds: float) -> Stats:
+    seconds = max(seconds, 1e-9)
+    return {
+        "bytes": nbytes,
+        "packets": packets,
+        "seconds": seconds,
+        "mbit_per_second": nbytes * 8 / seconds / 1e6,
+        "packets_per_second": packets / seconds,
+    }
+
+
+def _report(result: T.Mapping[str, T.Any]) -> None:
+    sys.stdout.write(json.dumps(result) + "\n")
+    sys.stdout.flush()
+
+
+def _announce(port: int) -> None:
+    sys.stdout.write(f"{port}\n")
+    sys.stdout.flush()
+
+
+def _recv_tcp(host: str) -> Stats:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as listener:
+        listener.bind((host, 0))
+        listener.listen(1)
+        _announce(listener.getsockname()[1])
+        listener.settimeout(_START_TIMEOUT)
+        conn, _ = listener.accept()
+
+    nbytes = packets = 0
+    buf = bytearray(_TCP_CHUNK)
+    with conn:
+        start = time.monotonic()
+        while True:
+            size = conn.recv_into(buf)
+            if not size:
+                break
+            nbytes += size
+            packets += 1
+    return _stats(nbytes, packets, time.monotonic() - start)
+
+
+def _recv_udp(host: str, duration: float) -> Stats:
+    """Receive datagrams until nothing arrives for a while after the sender
+    must have finished (duration seconds after the first datagram).
+    Stalls in the middle of the transfer don't stop the receiver.
+    """
+    nbytes = packets = 0
+    start = last = 0.0
+    buf = bytearray(1 << 16)
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        sock.bind((host, 0))
+        _announce(sock.getsockname()[1])
+        sock.settimeout(_UDP_IDLE)
+        deadline = time.monotonic() + _START_TIMEOUT
+
+        while True:
+            try:
+                size = sock.recv_into(buf)
+            except socket.timeout:
+                if time.monotonic() > deadline:
+                    break
+                continue
+            last = time.monotonic()
+            if not packets:
+                start = last
+                deadline = start + duration
+            nbytes += size
+            packets += 1
+
+    return _stats(nbytes, packets, last - start)
+
+
+def _send_tcp(host: str, port: int, duration: float, size: int) -> Stats:
+    data = payload(max(size, _TCP_CHUNK))
+    nbytes = packets = 0
+
+    with socket.create_connection((host, port), timeout=_START_TIMEOUT) as sock:
+        start = time.monotonic()
+        deadline = start + duration
+        while time.monotonic() < deadline:
+            sock.sendall(data)
+            nbytes += len(data)
+            packets += 1
+        sock.shutdown(socket.SHUT_WR)
+        sock.recv(1)
+
+    return _stats(nbytes, packets, time.monotonic() - start)
+
+
+def _send_udp(host: str, port: int, duration: float, size: int) -> Stats:
+    data = payload(size)
+    nbytes = packets = 0
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.connect((host, port))
+        start = time.monotonic()
+        deadline = start + duration
+
+        while True:
+            # Checking time after each packet is too expensive at high rates
+            for _ in range(64):
+                try:
+                    sock.send(data)
+                except OSError as ex:
+                    if ex.errno not in _UDP_TRANSIENT:
+                        raise
+                    continue
+                nbytes += size
+                packets += 1
+            if time.monotonic() >= deadline:
+                break
+
+    return _stats(nbytes, packets, time.monotonic() - start)
+
+
+def _spray(first: str, count: int, step: int, duration: float, size: int) -> Stats:
+    """Send datagrams to count different addresses, step apart, starting at first."""
+    data = payload(size)
+    base = struct.unpack("!I", socket.inet_aton(first))[0]
+    hosts = [socket.inet_ntoa(struct.pack("!I", base + i * step)) for i in range(count)]
+    nbytes = packets = 0
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        start = time.monotonic()
+        deadline = start + duration
+
+        while time.monotonic() < deadline:
+            for host in hosts:
+                try:
+                    sock.sendto(data, (host, 9))
+                except OSError as ex:
+                    if ex.errno not in _UDP_TRANSIENT:
+                        raise
+                    continue
+                nbytes += size
+                packets += 1
+                if not packets % 64 and time.monotonic() >= deadline:
+                    break
+
+    return _stats(nbytes, packets, time.monotonic() - start)
+
+
+def _trickle(host: str, interval: float) -> None:
+    """Send small datagrams to the discard port until killed."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        while True:
+            try:
+                sock.sendto(b"\0", (host, 9))
+            except OSError as ex:
+                if ex.errno not in _UDP_TRANSIENT:
+                    raise
+            time.sleep(interval)
+
+
+def _echo(host: str) -> None:
+    """Send every received datagram back until killed."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind((host, 0))
+        _announce(sock.getsockname()[1])
+        while True:
+            data, addr = sock.recvfrom(1 << 16)
+            sock.sendto(data, addr)
+
+
+def _send_probe(sock: socket.socket, seq: int, padding: bytes) -> None:
+    try:
+        sock.send(_PROBE.pack(seq, time.perf_counter()) + padding)
+    except OSError as ex:
+        if ex.errno not in _UDP_TRANSIENT:
+            raise
+
+
+def _read_replies(sock: socket.socket, rtts: T.List[T.Optional[int]]) -> None:
+    """Record round-trip times of all replies waiting in the socket."""
+    while True:
+        try:
+            data = sock.recv(1 << 16)
+        except (BlockingIOError, ConnectionRefusedError):
+            return
+        seq, sent_at = _PROBE.unpack_from(data)
+        if seq < len(rtts):
+            rtts[seq] = round((time.perf_counter() - sent_at) * 1e6)
+
+
+def _ping(host: str, port: int, rate: float, duration: float, size: int) -> None:
+    """Send probes to an echo server at a constant rate, and report round-trip
+    time in microseconds for each of them (or null if the reply was lost).
+    """
+    count = max(1, int(rate * duration))
+    interval = 1 / rate
+    padding = payload(max(size - _PROBE.size, 0))
+    rtts: T.List[T.Optional[int]] = [None] * count
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.connect((host, port))
+        sock.setblocking(False)
+        start = time.perf_counter()
+        sent = 0
+        end = start + count * interval + _UDP_IDLE
+
+        while True:
+            now = time.perf_counter()
+            if sent < count and now >= start + sent * interval:
+                _send_probe(sock, sent, padding)
+                sent += 1
+                continue
+            if now >= end:
+                break
+
+            wake = start + sent * interval if sent < count else end
+            if select.select([sock], [], [], max(0.0, wake - now))[0]:
+                _read_replies(sock, rtts)
+
+    _report({"rtt_us": rtts})
+
+
+class _Injection(T.NamedTuple):
+    """Packets written by _inject(): IPv4 packets of size bytes from src to dst,
+    tagged with run, sent at rate packets per second (or as fast as tincd reads
+    them if rate is 0) for duration seconds.
+    """
+
+    src: str
+    dst: str
+    run: int
+    rate: float
+    duration: float
+    size: int
+
+
+def _inject(fd: int, opts: _Injection) -> Stats:
+    """Write packets described by opts into fd."""
+    data = payload(max(opts.size - _IP_UDP_HEADERS, _INJECTED.size))
+    packet = bytearray(ipv4_packet(opts.src, opts.dst, data))
+    nbytes = packets = 0
+
+    # Checking time after each packet is too expensive at high rates
+    batch = 1 if opts.rate else 64
+
+    with socket.socket(fileno=fd) as sock:
+        start = time.monotonic()
+        deadline = start + opts.duration
+
+        while True:
+            for _ in range(batch):
+                _INJECTED.pack_into(
+                    packet, _IP_UDP_HEADERS, opts.run, packets, time_ns()
+                )
+                sock.send(packet)
+                nbytes += len(packet)
+                packets += 1
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if opts.rate:
+                time.sleep(max(0.0, start + packets / opts.rate - now))
+
+    return _stats(nbytes, packets, time.monotonic() - start)
+
+
+def _receive_injected(
+    sock: socket.socket, run: int, duration: float
+) -> T.Iterator[T.Tuple[int, int, int, int]]:
+    """Read packets injected with the same run ID from sock, and yield their
+    size, sequence number, and times they were sent and received at (in ns).
+    Stops duration seconds after the first of them arrives, or after not
+    getting anything for a while. Packets left over from other runs are ignored.
+    """
+    buf = bytearray(1 << 16)
+    deadline = time.monotonic() + _START_TIMEOUT
+    started = False
+
+    while True:
+        try:
+            size = sock.recv_into(buf)
+        except socket.timeout:
+            if time.monotonic() > deadline:
+                return
+            continue
+        now = time_ns()
+        if size < _IP_UDP_HEADERS + _INJECTED.size:
+            continue
+        pkt_run, seq, sent_at = _INJECTED.unpack_from(buf, _IP_UDP_HEADERS)
+        if pkt_run != run:
+            continue
+        if not started:
+            started = True
+            deadline = time.monotonic() + duration
+        yield size, seq, sent_at, now
+
+
+def _sink(fd: int, run: int, duration: float) -> T.Dict[str, T.Any]:
+    """Read packets injected with the same run ID from fd, like _recv_udp()
+    does with datagrams, and measure how long it took them to get through.
+    """
+    nbytes = packets = reordered = 0
+    start = last = 0.0
+    highest = -1
+    delays = bench.Histogram()
+
+    with socket.socket(fileno=fd) as sock:
+        _announce(fd)
+        sock.settimeout(_UDP_IDLE)
+
+        for size, seq, sent_at, now in _receive_injected(sock, run, duration):
+            last = now / 1e9
+            if not packets:
+                start = last
+            delays.record(max(0, now - sent_at) // 1000)
+            if seq < highest:
+                reordered += 1
+            highest = max(highest, seq)
+            nbytes += size
+            packets += 1
+
+    return {
+        **_stats(nbytes, packets, last - start),
+        "reordered": reordered,
+        "latency_us": delays.summary() if packets else None,
+    }
+
+
+def _main(args: T.List[str]) -> None:
+    role, proto, host, *rest = args
+    if role == "trickle":
+        _trickle(host, float(rest[0]))
+    elif role == "echo":
+        _echo(host)
+    elif role == "ping":
+        _ping(host, int(rest[0]), float(rest[1]), float(rest[2]), int(rest[3]))
+    elif role == "inject":
+        src, dst, run, rate, duration, size = rest
+        opts = _Injection(src, dst, int(run), float(rate), float(duration), int(size))
+        _report(_inject(int(host), opts))
+    elif role == "sink":
+        _report(_sink(int(host), int(rest[0]), float(rest[1])))
+    elif role == "spray":
+        _report(_spray(host, int(rest[0]), int(rest[1]), float(rest[2]), int(rest[3])))
+    elif role == "recv":
+        _report(_recv_tcp(host) if proto == "tcp" else _recv_udp(host, float(rest[0])))
+    else:
+        send = _send_tcp if proto == "tcp" else _send_udp
+        _report(send(host, int(rest[0]), float(rest[1]), int(rest[2])))
+
+
+def _spawn(netns: str, *args: str, **kwargs: T.Any) -> subp.Popen:
+    cmd = [path.PYTHON_PATH, "-m", "testlib.traffic", *args]
+    log.debug("starting traffic generator in netns '%s': %s", netns, cmd)
+    return ext.netns_popen(
+        netns, *cmd, cwd=_ROOT, stdout=subp.PIPE, encoding="utf-8", **kwargs
+    )
+
+
+def _result(proc: subp.Popen) -> T.Dict[str, T.Any]:
+    out, _ = proc.communicate()
+    if proc.returncode:
+        raise RuntimeError(f"traffic generator failed with code {proc.returncode}")
+    return json.loads(out.splitlines()[-1])
+
+
+def trickle(src_netns: str, dst_host: str, interval: float = 0.05) -> subp.Popen:
+    """Start sending a small UDP datagram to dst_host every interval seconds.
+    Used to make tincd do path MTU discovery. Kill the returned process to stop.
+    """
+    return _spawn(src_netns, "trickle", "udp", dst_host, str(interval))
+
+
+def spray(  # pylint: disable=too-many-arguments
+    src_netns: str,
+    first: str,
+    count: int,
+    *,
+    step: int = 1,
+    duration: float,
+    size: int = 64,
+) -> Stats:
+    """Send UDP datagrams for duration seconds from src_netns to count different
+    IPv4 addresses, step apart, starting at first, going through them in turn.
+    Nothing receives them, so only sender statistics are returned.
+    """
+    log.info("spraying %d addresses from %s for %.1f s", count, first, duration)
+    args = ("spray", "udp", first, str(count), str(step), str(duration), str(size))
+    sent = _result(_spawn(src_netns, *args))
+    log.info("sent %s", sent)
+    return sent
+
+
+def _combine(stats: T.List[Stats]) -> Stats:
+    """Add up statistics of streams running at the same time."""
+    nbytes = sum(int(st["bytes"]) for st in stats)
+    packets = sum(int(st["packets"]) for st in stats)
+    return _stats(nbytes, packets, max(st["seconds"] for st in stats))
+
+
+def measure(  # pylint: disable=too-many-arguments
+    proto: str,
+    src_netns: str,
+    dst_netns: str,
+    dst_host: str,
+    *,
+    duration: float,
+    size: int = UDP_SIZE,
+    streams: int = 1,
+) -> T.Tuple[Stats, Stats]:
+    """Send as much data as possible over proto ('tcp' or 'udp') for duration
+    seconds from src_netns to dst_host inside dst_netns. size is the datagram
+    size for UDP. Empty namespace names mean the current namespace.
+    If streams is more than 1, that many flows (each with its own port) are
+    sent in parallel, and their statistics are added up.
+    Returns (sender, receiver) statistics. RuntimeError is raised if either
+    side fails (for example, because the tunnel stalled for too long).
+    """
+    log.info(
+        "measuring %s throughput to %s for %.1f s with %d streams",
+        proto,
+        dst_host,
+        duration,
+        streams,
+    )
+
+    with contextlib.ExitStack() as stack:
+        receivers = [
+            stack.enter_context(
+                _spawn(dst_netns, "recv", proto, dst_host, str(duration))
+            )
+            for _ in range(streams)
+        ]
+        senders = []
+        for receiver in receivers:
+            assert receiver.stdout
+            port = receiver.stdout.readline().strip()
+            args = ("send", proto, dst_host, port, str(duration), str(size))
+            senders.append(stack.enter_context(_spawn(src_netns, *args)))
+        sent = _combine([_result(sender) for sender in senders])
+        received = _combine([_result(receiver) for receiver in receivers])
+
+    log.info("sent %s, received %s", sent, received)
+    return sent, received
+
+
+def latency(  # pylint: disable=too-many-arguments
+    src_netns: str,
+    dst_netns: str,
+    dst_host: str,
+    *,
+    rate: float,
+    duration: float,
+    size: int = 200,
+) -> T.List[T.Optional[int]]:
+    """Send UDP request/response probes of size bytes from src_netns to an echo
+    server at dst_host inside dst_netns, rate probes per second for duration
+    seconds. Returns the round-trip time in microseconds of each probe in the
+    order they were sent, or None for probes which got no reply.
+    """
+    log.info("measuring latency to %s at %.0f probes/s", dst_host, rate)
+
+    with _spawn(dst_netns, "echo", "udp", dst_host) as echo:
+        try:
+            assert echo.stdout
+            port = echo.stdout.readline().strip()
+            args = (port, str(rate), str(duration), str(size))
+            with _spawn(src_netns, "ping", "udp", dst_host, *args) as client:
+                rtts = _result(client)["rtt_us"]
+        finally:
+            echo.kill()
+
+    lost = sum(rtt is None for rtt in rtts)
+    log.info("received %d of %d replies", len(rtts) - lost, len(rtts))
+    return rtts
+
+
+def inject(  # pylint: disable=too-many-arguments
+    src_fd: int,
+    dst_fd: int,
+    src: str,
+    dst: str,
+    *,
+    rate: float = 0,
+    duration: float,
+    size: int = 1400,
+) -> T.Tuple[Stats, T.Dict[str, T.Any]]:
+    """Write IPv4 packets of size bytes from src to dst into src_fd, which is
+    connected to the fd device of one node, for duration seconds, and read them
+    from dst_fd, connected to the fd device of the node that owns dst.
+    rate is the number of packets per second, or 0 to send them as fast as
+    tincd takes them. Returns (sender, receiver) statistics. The receiver
+    also reports one-way latency in microseconds, and how many packets
+    arrived after a packet that was sent later.
+    """
+    log.info("injecting packets to %s for %.1f s at rate %.0f", dst, duration, rate)
+    run = random.getrandbits(32)
+
+    with contextlib.ExitStack() as stack:
+        args = ("sink", "ip", str(dst_fd), str(run), str(duration))
+        sink = stack.enter_context(_spawn("", *args, pass_fds=(dst_fd,)))
+        assert sink.stdout
+        sink.stdout.readline()
+
+        opts = _Injection(src, dst, run, rate, duration, size)
+        sender = stack.enter_context(
+            _spawn("", "inject", "ip", str(src_fd), *map(str, opts), pass_fds=(src_fd,))
+        )
+        sent, received = _result(sender), _result(sink)
+
+    log.info("sent %s, received %s", sent, received)
+    return sent, received
+
+
+if __name__ == "__main__":
+    _main(sys.argv[1:])
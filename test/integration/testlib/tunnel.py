@@ -0,0 +1,235 @@
+"""Two tinc nodes connected by real TUN devices living in separate network namespaces."""
+
+import os
+import time
+import contextlib
+import typing as T
+
+from . import bench, external as ext, traffic, util
+from .cmd import exchange_all
+from .converge import wait_converged
+from .control import NodeStatus
+from .log import log
+from .proc import Tinc, Script
+from .relay import Relay
+from .template import make_netns_config
+from .test import Test
+
+IP_FOO = "192.168.1.1"
+IP_BAR = "192.168.1.2"
+MASK = 24
+
+# How long to wait for nodes to learn subnets of each other
+_SUBNET_TIMEOUT = 10.0
+
+# How long to wait for path MTU discovery to finish
+_PMTU_TIMEOUT = 15.0
+
+
+def require_netns() -> None:
+    """Skip the test if network namespaces and TUN devices are not available."""
+    util.require_root()
+    util.require_command("ip", "netns", "list")
+    util.require_path("/dev/net/tun")
+
+
+def cpu_seconds(pid: int) -> float:
+    """Get CPU time (user and system) consumed by the process so far."""
+    with open(f"/proc/{pid}/stat", "r", encoding="utf-8") as f:
+        # Skip the process name, which may contain spaces
+        fields = f.read().rpartition(")")[2].split()
+    utime, stime = int(fields[11]), int(fields[12])
+    return (utime + stime) / os.sysconf("SC_CLK_TCK")
+
+
+class Tunnel:
+    """A pair of nodes, foo and bar, each with its TUN device moved into a network
+    namespace named after the node, and addresses IP_FOO and IP_BAR assigned to
+    them. bar connects to foo. config is a tinc script applied to both nodes.
+    If relay is passed, all traffic between the nodes goes through it.
+    """
+
+    foo: Tinc
+    bar: Tinc
+    udp_ready: bool
+
+    def __init__(
+        self, ctx: Test, config: str = "", relay: T.Optional[Relay] = None
+    ) -> None:
+        self.foo, self.bar = ctx.node(addr=IP_FOO), ctx.node(addr=IP_BAR)
+        self.udp_ready = False
+
+        connect_to = {self.bar.name: f"set ConnectTo {self.foo}"}
+
+        for node in self.nodes:
+            node.init_fast(
+                os.linesep.join(
+                    [
+                        "set Port 0",
+                        "set Address localhost",
+                        f"set Subnet {node.address}",
+                        self._setup_device(node),
+                        "set AutoConnect no",
+                        relay.add(node) if relay else "",
+                        connect_to.get(node.name, ""),
+                        config,
+                    ]
+                )
+            )
+
+    def _setup_device(self, node: Tinc) -> str:
+        """Prepare the device of node, and return tinc commands configuring it."""
+        assert ext.netns_add(node.name)
+        node.add_script(
+            Script.TINC_UP, make_netns_config(node.name, node.address, MASK)
+        )
+        return f"set Interface {node}"
+
+    @property
+    def nodes(self) -> T.Tuple[Tinc, Tinc]:
+        """Both nodes."""
+        return self.foo, self.bar
+
+    def start(self, warm_up: bool = True) -> None:
+        """Start both nodes and wait until packets can flow through the tunnel.
+        If warm_up is True, also wait until UDP works and path MTU is known in
+        both directions, so measurements are not affected by packets being sent
+        over TCP while tincd is probing the path. Some configurations never get
+        there (for example, the legacy protocol with Cipher = none), so this is
+        not an error: udp_ready reports whether it succeeded.
+        """
+        # foo gets the host file of bar before it starts. If it was written later,
+        # the next reload of foo (for example, by `tinc add Subnet`) would see it
+        # as changed and drop the connection to bar.
+        exchange_all(self.nodes, {self.foo.name: [self.bar]})
+        self.foo.start()
+        exchange_all(self.nodes, {self.bar.name: [self.foo]})
+        self.bar.start()
+
+        wait_converged(self.nodes)
+        deadline = time.monotonic() + _SUBNET_TIMEOUT
+
+        for node, peer in (self.foo, self.bar), (self.bar, self.foo):
+            while (peer.address, peer.name) not in node.control.dump_subnets():
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"{node} did not learn subnets of {peer}")
+                time.sleep(0.01)
+
+        log.info("tunnel between %s and %s is up", self.foo, self.bar)
+
+        if warm_up:
+            self.udp_ready = self._wait_pmtu()
+
+    def _pmtu_known(self, node: Tinc, peer: Tinc) -> bool:
+        for rec in node.control.dump_nodes():
+            if rec.name == peer.name:
+                confirmed = NodeStatus.UDP_CONFIRMED in rec.status
+                return confirmed and rec.min_mtu == rec.max_mtu
+        return False
+
+    @contextlib.contextmanager
+    def _trickle(self) -> T.Iterator[None]:
+        """Send a little traffic both ways, which makes tincd probe the path MTU."""
+        senders = [
+            traffic.trickle(self.bar.name, self.foo.address),
+            traffic.trickle(self.foo.name, self.bar.address),
+        ]
+        try:
+            yield
+        finally:
+            for sender in senders:
+                sender.kill()
+                sender.wait()
+
+    def _wait_pmtu(self) -> bool:
+        start = time.monotonic()
+        deadline = start + _PMTU_TIMEOUT
+        with self._trickle():
+            while not all(
+                self._pmtu_known(node, peer)
+                for node, peer in ((self.foo, self.bar), (self.bar, self.foo))
+            ):
+                if time.monotonic() > deadline:
+                    log.warning("path MTU discovery did not finish in time")
+                    return False
+                time.sleep(0.1)
+        log.info("path MTU discovered in %f s", time.monotonic() - start)
+        return True
+
+    def stop(self) -> None:
+        """Stop both nodes."""
+        for node in self.nodes:
+            node.cmd("stop")
+
+    def cpu_seconds(self) -> float:
+        """CPU time consumed by both tincd processes so far."""
+        return sum(cpu_seconds(node.pid) for node in self.nodes)
+
+    def measure(
+        self, case: bench.Result, *, duration: float, streams: int = 1
+    ) -> T.List[bench.Result]:
+        """Measure TCP and UDP throughput from bar to foo, along with CPU time
+        used by both nodes. Each result starts with the keys of case. Failed
+        measurements are reported with an error instead of aborting the benchmark.
+        """
+        results = []
+        for proto in "tcp", "udp":
+            result: bench.Result = {
+                **case,
+                "protocol": proto,
+                "udp_ready": self.udp_ready,
+            }
+            cpu = self.cpu_seconds()
+            try:
+                _, received = traffic.measure(
+                    proto,
+                    self.bar.name,
+                    self.foo.name,
+                    self.foo.address,
+                    duration=duration,
+                    streams=streams,
+                )
+            except RuntimeError as ex:
+                log.error("measurement %s over %s failed", case, proto, exc_info=ex)
+                result["error"] = str(ex)
+                results.append(result)
+                continue
+
+            cpu = self.cpu_seconds() - cpu
+            gigabits = received["bytes"] * 8 / 1e9
+            result.update(
+                {
+                    "mbit_per_second": received["mbit_per_second"],
+                    "packets_per_second": received["packets_per_second"],
+                    "cpu_seconds": cpu,
+                    "cpu_seconds_per_gigabit": cpu / gigabits if gigabits else None,
+                }
+            )
+            log.info("%s", result)
+            results.append(result)
+
+        return results
+
+
+def benchmark(
+    title: str,
+    cases: T.Iterable[T.Tuple[bench.Result, str]],
+    *,
+    duration: float,
+    streams: int = 1,
+) -> None:
+    """For each (case, config) pair, start a tunnel configured by the tinc script
+    config, measure its throughput with Tunnel.measure(), and stop it.
+    Results of all cases are saved with bench.report().
+    """
+    results = []
+
+    with Test(title) as ctx:
+        for case, config in cases:
+            log.info("benchmarking %s", case)
+            tunnel = Tunnel(ctx, config)
+            tunnel.start()
+            results += tunnel.measure(case, duration=duration, streams=streams)
+            tunnel.stop()
+
+    bench.report(results)
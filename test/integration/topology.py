@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+"""Test building node graphs of various shapes with cmd.Mesh."""
+
+from testlib import check
+from testlib.cmd import Mesh, Topology, make_edges
+from testlib.log import log
+from testlib.test import Test
+
+NODES = 5
+
+
+def test_edges() -> None:
+    """Check generated edges for all shapes."""
+    check.equals([(1, 0), (2, 0), (3, 0)], make_edges(4, Topology.STAR))
+    check.equals([(0, 1), (1, 2), (2, 3), (3, 0)], make_edges(4, Topology.RING))
+    check.equals(6, len(make_edges(4, Topology.FULL)))
+
+    edges = make_edges(20, Topology.RANDOM, degree=4, seed=1)
+    check.equals(edges, make_edges(20, Topology.RANDOM, degree=4, seed=1))
+    check.equals(40, len(edges))
+    check.equals(len(edges), len({frozenset(edge) for edge in edges}))
+
+
+def test_mesh(ctx: Test, shape: Topology, direct: bool, fast: bool = True) -> None:
+    """Build a mesh, check that all nodes can reach each other, and stop it."""
+    mesh = Mesh(ctx, NODES, shape, direct=direct, fast=fast, seed=NODES)
+
+    log.info("check that host files were distributed to neighbors")
+    for i, node in enumerate(mesh.nodes):
+        for peer in mesh.neighbors(i):
+            check.file_exists(node.sub("hosts", peer.name))
+
+    mesh.start()
+    for node in mesh.nodes:
+        check.nodes(node, NODES)
+        check.equals(len(mesh.edges) * 2, len(node.control.dump_edges()))
+
+    mesh.stop()
+
+
+test_edges()
+
+for topology in Topology:
+    with Test(f"{topology.value} mesh") as context:
+        test_mesh(context, topology, direct=True)
+
+with Test("mesh using tinc init, export and import") as context:
+    test_mesh(context, Topology.RING, direct=False, fast=False)
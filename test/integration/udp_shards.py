@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+"""Test sharding of UDP listen sockets (UDPShards)."""
+
+import os
+import signal
+import socket
+import subprocess as subp
+import typing as T
+
+from testlib import check, traffic, util
+from testlib.log import log
+from testlib.test import Test
+from testlib.tunnel import Tunnel, require_netns
+
+util.require_command("ss", "-nlup")
+
+SHARDS = 4
+
+# Number of flows (source ports) to send packets from
+FLOWS = 64
+
+
+def get_udp_queues(pid: int, port: int) -> T.List[int]:
+    """Get the receive queue length of each UDP socket of pid listening on port."""
+
+    listen = subp.run(["ss", "-nlup"], check=True, stdout=subp.PIPE, encoding="utf-8")
+    queues: T.List[int] = []
+
+    for line in listen.stdout.splitlines():
+        if f"pid={pid}," in line:
+            _, recv_q, _, addr, _ = line.split(maxsplit=4)
+            if addr.endswith(f":{port}"):
+                queues.append(int(recv_q))
+
+    return queues
+
+
+def test_invalid_shards(ctx: Test) -> None:
+    """Test that out of range shard counts are rejected."""
+    foo = ctx.node(init=True)
+
+    for shards in 0, 17:
+        log.info("starting with %d shards must fail", shards)
+        opts = ("-o", "DeviceType=dummy", "-o", f"UDPShards={shards}")
+        _, err = foo.cmd("start", *opts, code=1)
+        check.is_in("UDPShards must be between 1 and 16", err)
+
+
+def test_shards(ctx: Test) -> None:
+    """Test that every shard is opened and receives packets."""
+    foo = ctx.node(init=f"set UDPShards {SHARDS}")
+    foo.cmd("add", "BindToAddress", "127.0.0.1")
+    foo.start()
+
+    log.info("check that %d UDP sockets share port %d", SHARDS, foo.port)
+    queues = get_udp_queues(foo.pid, foo.port)
+    check.equals(SHARDS, len(queues))
+
+    log.info("send packets from %d flows while tincd is stopped", FLOWS)
+    os.kill(foo.pid, signal.SIGSTOP)
+    try:
+        for _ in range(FLOWS):
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.sendto(b"\0" * 64, ("127.0.0.1", foo.port))
+        queues = get_udp_queues(foo.pid, foo.port)
+    finally:
+        os.kill(foo.pid, signal.SIGCONT)
+
+    log.info("receive queues: %s", queues)
+    for queue in queues:
+        check.greater(queue, 0)
+
+    foo.cmd("stop")
+
+
+def test_tunnel(ctx: Test) -> None:
+    """Test that packets read from any shard are forwarded through the tunnel."""
+    tunnel = Tunnel(ctx, f"set UDPShards {SHARDS}")
+    tunnel.start()
+    check.true(tunnel.udp_ready)
+
+    _, received = traffic.measure(
+        "udp",
+        tunnel.bar.name,
+        tunnel.foo.name,
+        tunnel.foo.address,
+        duration=1,
+    )
+    check.greater(received["packets"], 0)
+
+    tunnel.stop()
+
+
+with Test("invalid UDPShards") as context:
+    test_invalid_shards(context)
+
+with Test("UDP shards") as context:
+    test_shards(context)
+
+require_netns()
+
+with Test("tunnel over UDP shards") as context:
+    test_tunnel(context)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+"""Test tunnels going through the WAN emulating relay."""
+
+import typing as T
+
+from testlib import check, traffic
+from testlib.fd_tunnel import FdTunnel
+from testlib.log import log
+from testlib.proc import Feature, features
+from testlib.relay import Impairment, Relay
+from testlib.test import Test
+
+# One-way delay added by the relay, in seconds
+DELAY = 0.02
+
+
+def inject(tunnel: FdTunnel) -> T.Dict[str, T.Any]:
+    """Send packets from bar to foo, and return statistics of the receiver."""
+    foo, bar = tunnel.nodes
+    sent, received = traffic.inject(
+        tunnel.devices[bar.name].fileno(),
+        tunnel.devices[foo.name].fileno(),
+        bar.address,
+        foo.address,
+        rate=500,
+        duration=1.0,
+        size=200,
+    )
+    received["sent"] = sent["packets"]
+    return received
+
+
+def test_clean(ctx: Test) -> None:
+    """Test that all traffic goes through the relay, which changes nothing by default."""
+    with Relay(seed=1) as relay:
+        tunnel = FdTunnel(ctx, relay=relay)
+        tunnel.start()
+        check.true(tunnel.udp_ready)
+
+        received = inject(tunnel)
+        check.equals(received["sent"], received["packets"])
+
+        stats = relay.stats()
+        log.info("relay statistics: %s", stats)
+        check.greater(stats["tcp_bytes"], 0)
+        check.greater(stats["udp_forwarded"], received["packets"])
+        check.not_in("udp_unknown", stats)
+
+        tunnel.stop()
+
+
+def test_impaired(ctx: Test) -> None:
+    """Test that delay, loss, duplication and reordering reach tincd."""
+    with Relay(seed=2) as relay:
+        tunnel = FdTunnel(ctx, relay=relay)
+        tunnel.start()
+        foo, bar = tunnel.nodes
+
+        relay.impairment = Impairment(delay=DELAY, loss=0.1, duplicate=0.1, reorder=0.2)
+        received = inject(tunnel)
+        log.info("relay statistics: %s", relay.stats())
+
+        latency: T.Optional[T.Dict[str, float]] = received["latency_us"]
+        assert latency
+        check.greater(latency["min"], DELAY * 1e6)
+        check.in_range(received["packets"], received["sent"] * 0.7, received["sent"])
+        check.greater(received["reordered"], 0)
+
+        stats = {rec.name: rec for rec in foo.control.dump_node_stats()}
+        check.greater(stats[bar.name].in_replayed, 0)
+
+        tunnel.stop()
+
+
+def test_tcp_fallback(ctx: Test) -> None:
+    """Test that packets go over TCP when the relay drops all UDP."""
+    with Relay(Impairment(loss=1.0)) as relay:
+        tunnel = FdTunnel(ctx, relay=relay)
+        tunnel.start(warm_up=False)
+
+        received = inject(tunnel)
+        check.equals(received["sent"], received["packets"])
+        check.equals(0, relay.stats().get("udp_forwarded", 0))
+
+        tunnel.stop()
+
+
+def test_roaming(ctx: Test) -> None:
+    """Test that packets keep flowing while the relay changes source ports.
+    Packets of the legacy protocol carry no sender ID, so tincd has to find
+    the sender of packets coming from an unknown port by trying session keys.
+    """
+    legacy = Feature.LEGACY_PROTOCOL in features()
+    config = "set ExperimentalProtocol no" if legacy else ""
+
+    with Relay(seed=3) as relay:
+        tunnel = FdTunnel(ctx, config, relay=relay)
+        tunnel.start()
+        check.true(tunnel.udp_ready)
+
+        relay.roam(tunnel.bar)
+        relay.impairment = Impairment(rebind=0.1)
+        received = inject(tunnel)
+        stats = relay.stats()
+        log.info("relay statistics: %s", stats)
+
+        check.greater(stats["udp_rebound"], 5)
+        check.in_range(received["packets"], received["sent"] * 0.9, received["sent"])
+
+        tunnel.stop()
+
+
+with Test("clean link") as context:
+    test_clean(context)
+
+with Test("impaired link") as context:
+    test_impaired(context)
+
+with Test("TCP fallback") as context:
+    test_tcp_fallback(context)
+
+with Test("roaming peers") as context:
+    test_roaming(context)
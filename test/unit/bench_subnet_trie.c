@@ -0,0 +1,93 @@
+#include "unittest.h"
+#include "../../src/crypto.h"
+#include "../../src/net.h"
+#include "../../src/node.h"
+#include "../../src/random.h"
+#include "../../src/subnet.h"
+#include "../../src/subnet_trie.h"
+#include "../../src/xalloc.h"
+
+// Number of lookups timed for each table size
+#define LOOKUPS 1000000
+
+static const int sizes[] = {1, 1000, 50000};
+
+static char owner_name[] = "owner";
+static node_t owner = {.name = owner_name};
+
+static double seconds(void) {
+	struct timespec ts;
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return ts.tv_sec + ts.tv_nsec * 1e-9;
+}
+
+// Fill the trie with count random IPv4 subnets between /8 and /32, all of them inside 10.0.0.0/8
+static subnet_t **fill(subnet_trie_t *trie, int count) {
+	subnet_t **subnets = xzalloc(count * sizeof(*subnets));
+
+	for(int i = 0; i < count; i++) {
+		subnet_t *subnet = subnets[i] = new_subnet();
+		subnet->type = SUBNET_IPV4;
+		subnet->owner = &owner;
+		subnet->net.ipv4.prefixlength = i ? 8 + (int)prng(25) : 8;
+		subnet->net.ipv4.address.x[0] = 10;
+		prng_randomize(subnet->net.ipv4.address.x + 1, 3);
+		mask(&subnet->net.ipv4.address, subnet->net.ipv4.prefixlength, sizeof(subnet->net.ipv4.address));
+		subnet->weight = i;
+		subnet_trie_insert(trie, &subnet->net.ipv4.address, subnet->net.ipv4.prefixlength, subnet);
+	}
+
+	return subnets;
+}
+
+static void bench_lookup_ipv4(void **state) {
+	(void)state;
+
+	owner.status.reachable = true;
+	ipv4_t *addresses = xzalloc(LOOKUPS * sizeof(*addresses));
+
+	for(int i = 0; i < LOOKUPS; i++) {
+		addresses[i].x[0] = 10;
+		prng_randomize(addresses[i].x + 1, 3);
+	}
+
+	for(size_t i = 0; i < sizeof(sizes) / sizeof(*sizes); i++) {
+		subnet_trie_t trie = {.bits = 32};
+		subnet_t **subnets = fill(&trie, sizes[i]);
+
+		double start = seconds();
+
+		for(int j = 0; j < LOOKUPS; j++) {
+			assert_non_null(subnet_trie_lookup(&trie, &addresses[j]));
+		}
+
+		double elapsed = seconds() - start;
+
+		print_message("# %d subnets, %zu trie nodes: %.1f ns per lookup\n",
+		              sizes[i], trie.nodes, elapsed / LOOKUPS * 1e9);
+
+		subnet_trie_clear(&trie);
+
+		for(int j = 0; j < sizes[i]; j++) {
+			free_subnet(subnets[j]);
+		}
+
+		free(subnets);
+	}
+
+	free(addresses);
+}
+
+int main(void) {
+	random_init();
+	crypto_init();
+	prng_init();
+
+	const struct CMUnitTest tests[] = {
+		cmocka_unit_test(bench_lookup_ipv4),
+	};
+	int result = cmocka_run_group_tests(tests, NULL, NULL);
+
+	random_exit();
+	return result;
+}
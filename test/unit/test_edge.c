@@ -0,0 +1,97 @@
+#include "unittest.h"
+#include "../../src/edge.h"
+#include "../../src/netutl.h"
+#include "../../src/node.h"
+
+static node_t *make_node(const char *name) {
+	node_t *node = new_node(name);
+	node_add(node);
+	return node;
+}
+
+static edge_t *connect_nodes(node_t *from, node_t *to, const char *address, const char *port) {
+	edge_t *e = new_edge();
+	e->from = from;
+	e->to = to;
+	e->address = str2sockaddr(address, port);
+	edge_add(e);
+	return e;
+}
+
+static void test_lookup_edge_address(void **state) {
+	(void)state;
+
+	node_t *mars = make_node("mars");
+	node_t *saturn = make_node("saturn");
+	node_t *neptune = make_node("neptune");
+
+	// mars and neptune share an address, but use different ports
+	edge_t *to_mars = connect_nodes(myself, mars, "10.0.0.1", "655");
+	edge_t *to_saturn = connect_nodes(myself, saturn, "10.0.0.2", "655");
+	edge_t *to_neptune = connect_nodes(saturn, neptune, "10.0.0.1", "656");
+
+	sockaddr_t sa = str2sockaddr("10.0.0.1", "1234");
+
+	edge_t *e = lookup_edge_address(&sa);
+	assert_ptr_equal(to_mars, e);
+
+	e = lookup_edge_address_next(e);
+	assert_ptr_equal(to_neptune, e);
+
+	assert_null(lookup_edge_address_next(e));
+
+	sa = str2sockaddr("10.0.0.2", "655");
+	assert_ptr_equal(to_saturn, lookup_edge_address(&sa));
+	assert_null(lookup_edge_address_next(to_saturn));
+
+	sa = str2sockaddr("10.0.0.3", "655");
+	assert_null(lookup_edge_address(&sa));
+
+	edge_del(to_mars);
+	sa = str2sockaddr("10.0.0.1", "655");
+	assert_ptr_equal(to_neptune, lookup_edge_address(&sa));
+}
+
+static void test_edge_add_rollback(void **state) {
+	(void)state;
+
+	node_t *mars = make_node("mars");
+	edge_t *first = connect_nodes(myself, mars, "10.0.0.1", "655");
+
+	// Make the trees disagree, so that only the first insert succeeds
+	free(splay_unlink(&myself->edge_tree, first));
+
+	edge_t *second = connect_nodes(myself, mars, "10.0.0.1", "655");
+	assert_null(lookup_edge(myself, mars));
+	assert_null(first->reverse);
+
+	sockaddr_t sa = str2sockaddr("10.0.0.1", "655");
+	assert_ptr_equal(first, lookup_edge_address(&sa));
+	assert_null(lookup_edge_address_next(first));
+
+	edge_del(first);
+	free_edge(first);
+	free_edge(second);
+}
+
+static int setup(void **state) {
+	(void)state;
+	myself = new_node("myself");
+	return 0;
+}
+
+static int teardown(void **state) {
+	(void)state;
+	free_node(myself);
+	exit_nodes();
+	exit_edges();
+	return 0;
+}
+
+int main(void) {
+	const struct CMUnitTest tests[] = {
+		cmocka_unit_test_setup_teardown(test_lookup_edge_address, setup, teardown),
+		cmocka_unit_test_setup_teardown(test_edge_add_rollback, setup, teardown),
+	};
+	return cmocka_run_group_tests(tests, NULL, NULL);
+}
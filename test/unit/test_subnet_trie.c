@@ -0,0 +1,270 @@
+#include "unittest.h"
+#include "../../src/net.h"
+#include "../../src/node.h"
+#include "../../src/subnet.h"
+#include "../../src/subnet_trie.h"
+
+static char foo_name[] = "foo";
+static char bar_name[] = "bar";
+
+static node_t foo = {.name = foo_name};
+static node_t bar = {.name = bar_name};
+
+static int setup(void **state) {
+	static subnet_trie_t trie;
+	trie = (subnet_trie_t) {
+		.bits = 32
+	};
+	foo.status.reachable = true;
+	bar.status.reachable = true;
+	*state = &trie;
+	return 0;
+}
+
+static int teardown(void **state) {
+	subnet_trie_clear(*state);
+	return 0;
+}
+
+static subnet_t *create_subnet(const char *netstr, node_t *owner) {
+	subnet_t *subnet = new_subnet();
+	assert_true(str2net(subnet, netstr));
+	subnet->owner = owner;
+	return subnet;
+}
+
+static void add(subnet_trie_t *trie, subnet_t *subnet) {
+	if(subnet->type == SUBNET_IPV4) {
+		subnet_trie_insert(trie, &subnet->net.ipv4.address, subnet->net.ipv4.prefixlength, subnet);
+	} else {
+		subnet_trie_insert(trie, &subnet->net.ipv6.address, subnet->net.ipv6.prefixlength, subnet);
+	}
+}
+
+static void del(subnet_trie_t *trie, subnet_t *subnet) {
+	if(subnet->type == SUBNET_IPV4) {
+		subnet_trie_delete(trie, &subnet->net.ipv4.address, subnet->net.ipv4.prefixlength, subnet);
+	} else {
+		subnet_trie_delete(trie, &subnet->net.ipv6.address, subnet->net.ipv6.prefixlength, subnet);
+	}
+}
+
+static subnet_t *lookup(const subnet_trie_t *trie, const char *address) {
+	subnet_t subnet;
+	assert_true(str2net(&subnet, address));
+
+	if(subnet.type == SUBNET_IPV4) {
+		return subnet_trie_lookup(trie, &subnet.net.ipv4.address);
+	} else {
+		return subnet_trie_lookup(trie, &subnet.net.ipv6.address);
+	}
+}
+
+static void test_lookup_empty(void **state) {
+	assert_null(lookup(*state, "10.0.0.1"));
+}
+
+static void test_lookup_longest_prefix(void **state) {
+	subnet_trie_t *trie = *state;
+
+	subnet_t *wide = create_subnet("10.0.0.0/8", &foo);
+	subnet_t *narrow = create_subnet("10.1.0.0/16", &foo);
+	subnet_t *host = create_subnet("10.1.2.3", &foo);
+	subnet_t *other = create_subnet("192.168.0.0/16", &foo);
+
+	add(trie, narrow);
+	add(trie, other);
+	add(trie, wide);
+	add(trie, host);
+
+	assert_ptr_equal(host, lookup(trie, "10.1.2.3"));
+	assert_ptr_equal(narrow, lookup(trie, "10.1.2.4"));
+	assert_ptr_equal(wide, lookup(trie, "10.2.0.1"));
+	assert_ptr_equal(other, lookup(trie, "192.168.255.255"));
+	assert_null(lookup(trie, "11.0.0.1"));
+	assert_null(lookup(trie, "192.169.0.1"));
+
+	del(trie, narrow);
+	del(trie, other);
+	del(trie, wide);
+	del(trie, host);
+
+	free_subnet(narrow);
+	free_subnet(other);
+	free_subnet(wide);
+	free_subnet(host);
+}
+
+static void test_lookup_default_route(void **state) {
+	subnet_trie_t *trie = *state;
+
+	subnet_t *all = create_subnet("0.0.0.0/0", &foo);
+	add(trie, all);
+
+	assert_ptr_equal(all, lookup(trie, "1.2.3.4"));
+	assert_ptr_equal(all, lookup(trie, "255.255.255.255"));
+
+	del(trie, all);
+	free_subnet(all);
+}
+
+static void test_lookup_skips_unreachable(void **state) {
+	subnet_trie_t *trie = *state;
+
+	subnet_t *wide = create_subnet("10.0.0.0/8", &foo);
+	subnet_t *narrow = create_subnet("10.1.0.0/16", &bar);
+
+	add(trie, wide);
+	add(trie, narrow);
+
+	bar.status.reachable = false;
+	assert_ptr_equal(wide, lookup(trie, "10.1.0.1"));
+
+	// When no owner is reachable, the subnet with the shortest prefix is returned
+	foo.status.reachable = false;
+	assert_ptr_equal(wide, lookup(trie, "10.1.0.1"));
+
+	bar.status.reachable = true;
+	assert_ptr_equal(narrow, lookup(trie, "10.1.0.1"));
+
+	del(trie, wide);
+	del(trie, narrow);
+
+	free_subnet(wide);
+	free_subnet(narrow);
+}
+
+static void test_lookup_same_prefix_order(void **state) {
+	subnet_trie_t *trie = *state;
+
+	subnet_t *heavy = create_subnet("10.0.0.0/8#20", &foo);
+	subnet_t *light = create_subnet("10.0.0.0/8#5", &bar);
+	subnet_t *broadcast = create_subnet("10.0.0.0/8#10", NULL);
+
+	add(trie, heavy);
+	add(trie, light);
+	add(trie, broadcast);
+
+	// Lower weights are preferred, subnets without an owner are always reachable
+	assert_ptr_equal(light, lookup(trie, "10.0.0.1"));
+
+	bar.status.reachable = false;
+	assert_ptr_equal(broadcast, lookup(trie, "10.0.0.1"));
+
+	del(trie, broadcast);
+	assert_ptr_equal(heavy, lookup(trie, "10.0.0.1"));
+
+	foo.status.reachable = false;
+	assert_ptr_equal(heavy, lookup(trie, "10.0.0.1"));
+
+	del(trie, heavy);
+	del(trie, light);
+
+	free_subnet(heavy);
+	free_subnet(light);
+	free_subnet(broadcast);
+}
+
+static void test_delete_prunes_nodes(void **state) {
+	subnet_trie_t *trie = *state;
+
+	subnet_t *a = create_subnet("10.0.0.0/24", &foo);
+	subnet_t *b = create_subnet("10.0.1.0/24", &foo);
+	subnet_t *c = create_subnet("10.0.0.0/16", &foo);
+
+	add(trie, a);
+	add(trie, b);
+	assert_int_equal(3, trie->nodes);
+
+	// 10.0.0.0/16 goes above the node that splits 10.0.0.0/23
+	add(trie, c);
+	assert_int_equal(4, trie->nodes);
+
+	del(trie, c);
+	assert_int_equal(3, trie->nodes);
+	assert_ptr_equal(a, lookup(trie, "10.0.0.1"));
+	assert_null(lookup(trie, "10.0.2.1"));
+
+	del(trie, a);
+	assert_int_equal(1, trie->nodes);
+	assert_ptr_equal(b, lookup(trie, "10.0.1.1"));
+
+	// Deleting a subnet that is not in the trie does nothing
+	del(trie, a);
+	assert_int_equal(1, trie->nodes);
+
+	del(trie, b);
+	assert_int_equal(0, trie->nodes);
+	assert_null(trie->root);
+
+	free_subnet(a);
+	free_subnet(b);
+	free_subnet(c);
+}
+
+static void test_owns(void **state) {
+	subnet_trie_t *trie = *state;
+
+	subnet_t *wide = create_subnet("10.0.0.0/8", &foo);
+	subnet_t *narrow = create_subnet("10.1.0.0/16", &bar);
+
+	add(trie, wide);
+	add(trie, narrow);
+
+	subnet_t address;
+	assert_true(str2net(&address, "10.1.2.3"));
+	assert_true(subnet_trie_owns(trie, &address.net.ipv4.address, &foo));
+	assert_true(subnet_trie_owns(trie, &address.net.ipv4.address, &bar));
+
+	assert_true(str2net(&address, "10.2.0.1"));
+	assert_true(subnet_trie_owns(trie, &address.net.ipv4.address, &foo));
+	assert_false(subnet_trie_owns(trie, &address.net.ipv4.address, &bar));
+
+	assert_true(str2net(&address, "11.1.2.3"));
+	assert_false(subnet_trie_owns(trie, &address.net.ipv4.address, &foo));
+
+	del(trie, wide);
+	del(trie, narrow);
+
+	free_subnet(wide);
+	free_subnet(narrow);
+}
+
+static void test_lookup_ipv6(void **state) {
+	subnet_trie_t *trie = *state;
+	trie->bits = 128;
+
+	subnet_t *wide = create_subnet("fe80::/10", &foo);
+	subnet_t *host = create_subnet("fe80::1", &bar);
+
+	add(trie, wide);
+	add(trie, host);
+
+	assert_ptr_equal(host, lookup(trie, "fe80::1"));
+	assert_ptr_equal(wide, lookup(trie, "fe80::2"));
+	assert_ptr_equal(wide, lookup(trie, "febf:ffff::1"));
+	assert_null(lookup(trie, "fec0::1"));
+
+	del(trie, wide);
+	del(trie, host);
+
+	free_subnet(wide);
+	free_subnet(host);
+}
+
+#define test_with_trie(test_func) \
+	cmocka_unit_test_setup_teardown((test_func), setup, teardown)
+
+int main(void) {
+	const struct CMUnitTest tests[] = {
+		test_with_trie(test_lookup_empty),
+		test_with_trie(test_lookup_longest_prefix),
+		test_with_trie(test_lookup_default_route),
+		test_with_trie(test_lookup_skips_unreachable),
+		test_with_trie(test_lookup_same_prefix_order),
+		test_with_trie(test_delete_prunes_nodes),
+		test_with_trie(test_owns),
+		test_with_trie(test_lookup_ipv6),
+	};
+	return cmocka_run_group_tests(tests, NULL, NULL);
+}